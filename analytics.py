@@ -0,0 +1,172 @@
+# analytics.py
+# 績效分析：以 NumPy 向量化計算資產曲線與成交紀錄的績效指標
+# Sharpe、Sortino、最大回撤與持續期間、Calmar、勝率、獲利因子、曝險時間，以及各交易模式的分項統計
+
+import math
+import numpy as np
+import config
+from resample import bars_per_year
+
+MODE_KEYS = list(config.TRADE_MODE_MAP)  # 'Spot_Buy', 'Margin_Long', 'Margin_Short'
+
+# --- 資產曲線指標 ---
+
+def equity_returns(equity: np.ndarray) -> np.ndarray:
+    """逐根 K 棒的簡單報酬率 (前一根資產 <= 0 時視為 0)"""
+    equity = np.asarray(equity, dtype=np.float64)
+    prev = equity[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(prev > 0, equity[1:] / prev - 1.0, 0.0)
+
+def sharpe_ratio(equity: np.ndarray, periods_per_year: int = 252, risk_free: float = 0.0) -> float:
+    """年化 Sharpe (risk_free 為年化無風險利率)；報酬無波動時回傳 NaN"""
+    excess = equity_returns(equity) - risk_free / periods_per_year
+    if len(excess) < 2: return math.nan
+    std = excess.std(ddof=1)
+    return float(excess.mean() / std * math.sqrt(periods_per_year)) if std > 0 else math.nan
+
+def sortino_ratio(equity: np.ndarray, periods_per_year: int = 252, risk_free: float = 0.0) -> float:
+    """年化 Sortino (下檔標準差以全部期數計算)；沒有虧損期時回傳 NaN"""
+    excess = equity_returns(equity) - risk_free / periods_per_year
+    if len(excess) < 2: return math.nan
+    downside = math.sqrt(np.mean(np.minimum(excess, 0.0) ** 2))
+    return float(excess.mean() / downside * math.sqrt(periods_per_year)) if downside > 0 else math.nan
+
+def drawdown_stats(equity: np.ndarray) -> dict:
+    """最大回撤 (%，正值) 與最長水下期間 (距離前一個高點的 K 棒數)"""
+    equity = np.asarray(equity, dtype=np.float64)
+    if len(equity) == 0:
+        return {'max_drawdown': 0.0, 'max_drawdown_duration': 0}
+    peak = np.maximum.accumulate(equity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = np.where(peak > 0, 1.0 - equity / peak, 0.0)
+    index = np.arange(len(equity))
+    last_peak = np.maximum.accumulate(np.where(equity >= peak, index, 0))
+    return {'max_drawdown': float(drawdown.max() * 100), 'max_drawdown_duration': int((index - last_peak).max())}
+
+def cagr(equity: np.ndarray, periods_per_year: int = 252) -> float:
+    """年化報酬率 (小數)；資產歸零時為 -1"""
+    if len(equity) < 2 or equity[0] <= 0: return 0.0
+    if equity[-1] <= 0: return -1.0
+    return float((equity[-1] / equity[0]) ** (periods_per_year / (len(equity) - 1)) - 1.0)
+
+def calmar_ratio(equity: np.ndarray, periods_per_year: int = 252, max_drawdown: float | None = None) -> float:
+    """年化報酬率 / 最大回撤；沒有回撤時回傳 NaN"""
+    if max_drawdown is None: max_drawdown = drawdown_stats(equity)['max_drawdown']
+    return cagr(equity, periods_per_year) / (max_drawdown / 100) if max_drawdown > 0 else math.nan
+
+# --- 成交紀錄指標 ---
+
+def trade_table(transactions, prices=None) -> dict:
+    """
+    將成交紀錄轉為欄式陣列 (每筆紀錄只讀取一次)：net_pnl、mode (MODE_KEYS 的索引)，
+    提供 prices (PriceCache) 時另含開/平倉的 K 棒索引 open_index / close_index。
+    """
+    n = len(transactions)
+    codes = {key: i for i, key in enumerate(MODE_KEYS)}
+    table = {
+        'net_pnl': np.fromiter((t.net_pnl for t in transactions), dtype=np.float64, count=n),
+        'mode': np.fromiter((codes.get(t.mode_key, -1) for t in transactions), dtype=np.int64, count=n),
+    }
+    if prices is not None:
+        for col, attr in (('open_index', 'open_date'), ('close_index', 'close_date')):
+            dates = np.array([getattr(t, attr) for t in transactions], dtype='datetime64[ns]')
+            table[col] = np.searchsorted(prices.dates, dates)
+    return table
+
+def trade_stats(net_pnl: np.ndarray) -> dict:
+    """交易筆數、勝率 (%)、獲利因子、平均獲利 / 虧損與總淨損益"""
+    net_pnl = np.asarray(net_pnl, dtype=np.float64)
+    wins = net_pnl[net_pnl > 0]
+    losses = net_pnl[net_pnl < 0]
+    gross_profit = float(wins.sum())
+    gross_loss = float(-losses.sum())
+    if gross_loss > 0: profit_factor = gross_profit / gross_loss
+    else: profit_factor = math.inf if gross_profit > 0 else math.nan
+    return {
+        'trades': len(net_pnl),
+        'win_rate': len(wins) / len(net_pnl) * 100 if len(net_pnl) else math.nan,
+        'profit_factor': profit_factor,
+        'avg_win': float(wins.mean()) if len(wins) else 0.0,
+        'avg_loss': float(losses.mean()) if len(losses) else 0.0,
+        'net_pnl': float(net_pnl.sum()),
+    }
+
+def mode_breakdown(table: dict) -> dict:
+    """各交易模式 (現貨 / 保證金多 / 保證金空) 的 trade_stats，以 bincount 一次彙總"""
+    net_pnl, mode = table['net_pnl'], table['mode']
+    valid = mode >= 0
+    net_pnl, mode = net_pnl[valid], mode[valid]
+    n_modes = len(MODE_KEYS)
+    win = net_pnl > 0
+    loss = net_pnl < 0
+    count = np.bincount(mode, minlength=n_modes)
+    n_win = np.bincount(mode, weights=win, minlength=n_modes)
+    n_loss = np.bincount(mode, weights=loss, minlength=n_modes)
+    gross_profit = np.bincount(mode, weights=np.where(win, net_pnl, 0.0), minlength=n_modes)
+    gross_loss = -np.bincount(mode, weights=np.where(loss, net_pnl, 0.0), minlength=n_modes)
+    total = np.bincount(mode, weights=net_pnl, minlength=n_modes)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        win_rate = np.where(count > 0, n_win / count * 100, np.nan)
+        profit_factor = np.where(gross_loss > 0, gross_profit / gross_loss, np.where(gross_profit > 0, np.inf, np.nan))
+        avg_win = np.where(n_win > 0, gross_profit / n_win, 0.0)
+        avg_loss = np.where(n_loss > 0, -gross_loss / n_loss, 0.0)
+
+    return {
+        key: {'trades': int(count[i]), 'win_rate': float(win_rate[i]), 'profit_factor': float(profit_factor[i]),
+              'avg_win': float(avg_win[i]), 'avg_loss': float(avg_loss[i]), 'net_pnl': float(total[i])}
+        for i, key in enumerate(MODE_KEYS)
+    }
+
+def exposure_time(table: dict, start_index: int, end_index: int, open_indices=()) -> float:
+    """
+    [start_index, end_index] 期間持有任一部位的 K 棒比例 (%)。
+    已平倉紀錄涵蓋 [開倉, 平倉) 的 K 棒；open_indices 為仍持有部位的開倉索引 (涵蓋到 end_index)。
+    """
+    n = end_index - start_index + 1
+    if n <= 0: return 0.0
+    opens = np.concatenate([table['open_index'], np.asarray(open_indices, dtype=np.int64)])
+    closes = np.concatenate([table['close_index'], np.full(len(open_indices), end_index + 1, dtype=np.int64)])
+    opens = np.clip(opens - start_index, 0, n)
+    closes = np.clip(closes - start_index, 0, n)
+
+    # 差分陣列：區間起點 +1、終點 -1，累加後大於 0 即為持倉中
+    delta = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(delta, opens, 1)
+    np.add.at(delta, closes, -1)
+    held = np.cumsum(delta[:-1]) > 0
+    return float(held.mean() * 100)
+
+# --- 彙總 ---
+
+def analyze(equity: np.ndarray, transactions, prices=None, start_index: int = 0,
+            periods_per_year: int = 252, risk_free: float = 0.0, positions=()) -> dict:
+    """
+    計算全部績效指標。equity 為逐根 K 棒的總資產 (第 0 筆對應 start_index)，
+    prices 未提供時不計算曝險時間；positions 為尚未平倉的持倉 (計入曝險)。
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    drawdown = drawdown_stats(equity)
+    table = trade_table(transactions, prices)
+    result = {
+        'sharpe': sharpe_ratio(equity, periods_per_year, risk_free),
+        'sortino': sortino_ratio(equity, periods_per_year, risk_free),
+        **drawdown,
+        'cagr': cagr(equity, periods_per_year) * 100,
+        'calmar': calmar_ratio(equity, periods_per_year, drawdown['max_drawdown']),
+        **trade_stats(table['net_pnl']),
+        'by_mode': mode_breakdown(table),
+    }
+    if prices is not None:
+        open_indices = [prices.index_of(pos.open_date) for pos in positions]
+        result['exposure'] = exposure_time(table, start_index, start_index + len(equity) - 1,
+                                           [i for i in open_indices if i is not None])
+    return result
+
+def analyze_engine(engine, risk_free: float = 0.0) -> dict:
+    """以 SimulationEngine 的資產帳本、成交紀錄與持倉計算績效指標"""
+    ledger = engine.equity_history
+    return analyze(ledger.equity, engine.portfolio.transactions, engine.prices, ledger.start_index,
+                   bars_per_year(engine.asset_type, engine.interval), risk_free,
+                   engine.portfolio.positions)
@@ -8,6 +8,7 @@ import time
 import config
 import logic
 import charts
+from records import to_frame
 
 # --- 初始化 ---
 st.set_page_config(layout="wide", page_title="Ksim V3")
@@ -19,9 +20,6 @@ if 'initialized' not in st.session_state:
 if 'chart_reset_id' not in st.session_state:
     st.session_state.chart_reset_id = 0 
 
-if 'pending_orders' not in st.session_state:
-    st.session_state.pending_orders = []
-
 if 'indicator_selector' not in st.session_state:
     st.session_state.indicator_selector = []
 
@@ -39,6 +37,13 @@ def on_reset_click():
 
 def toggle_autoplay():
     st.session_state.auto_play = not st.session_state.auto_play
+    st.session_state.autoplay_due = None
+    st.session_state.autoplay_pending = None
+
+@st.cache_resource
+def playback_listener():
+    """接收播放 iframe 載入完成通知的元件 (只註冊一次)"""
+    return st.components.v2.component("ksim_playback_listener", js=charts.PLAYBACK_LISTENER_JS)
 
 # --- 側邊欄：初始設定 ---
 if not state.initialized:
@@ -55,6 +60,13 @@ if not state.initialized:
             "**請輸入代碼**  \n(請從yahoo finance搜尋代碼  \ne.g. TSLA, JPY=X, BTC-USD)",
             value=state.ticker 
         ).strip().upper() 
+
+        state.interval = st.selectbox(
+            "K 棒週期 (日內資料的可回溯天數有限)",
+            options=list(config.INTERVALS),
+            index=list(config.INTERVALS).index(state.interval),
+            format_func=lambda x: '日 K' if x == '1d' else x
+        )
         
         if st.button("🚀點擊開始回測"):
             if state.ticker:
@@ -95,18 +107,22 @@ unit_name = asset_conf['unit']
 min_qty = asset_conf['min_qty']
 default_qty = asset_conf['default_qty']
 
-_, open_price, _ = logic.get_price_info_by_index(state.core_data, state.current_sim_index)
+engine = state.engine
+portfolio = engine.portfolio
+
+_, open_price, _ = engine.get_price_info(engine.current_sim_index)
 current_open_price = open_price if open_price > 0 else 0.0
 
 # --- 側邊欄 ---
 with st.sidebar:
-    st.subheader(f"📈 {state.ticker} ({unit_name}回測)")
+    st.subheader(f"📈 {state.ticker} ({unit_name}回測{'' if engine.interval == '1d' else f' · {engine.interval}'})")
+    bar_unit = '天' if engine.interval == '1d' else '根'
     
-    days_passed = state.current_sim_index - config.INITIAL_OBSERVATION_DAYS + 1
-    days_remain = state.max_sim_index - state.current_sim_index
+    days_passed = engine.current_sim_index - config.INITIAL_OBSERVATION_DAYS + 1
+    days_remain = engine.max_sim_index - engine.current_sim_index
     
-    st.markdown(f"**進度:** {max(1, days_passed)} 天 / 剩餘 {max(0, days_remain)} 天")
-    st.caption(f"(觀察期: {config.INITIAL_OBSERVATION_DAYS}天 / 顯示範圍: {config.VIEW_DAYS}天)")
+    st.markdown(f"**進度:** {max(1, days_passed)} {bar_unit} / 剩餘 {max(0, days_remain)} {bar_unit}")
+    st.caption(f"(觀察期: {config.INITIAL_OBSERVATION_DAYS}{bar_unit} / 顯示範圍: {config.VIEW_DAYS}{bar_unit})")
     st.markdown("---")
 
     st.subheader("🔍 指標設定")
@@ -115,9 +131,13 @@ with st.sidebar:
         options=['MA (移動平均線)', 'BBands (主圖)', 'MACD', 'RSI'],
         key='indicator_selector'
     )
+    chart_history = st.select_slider(
+        "圖表歷史範圍", options=list(charts.HISTORY_OPTIONS), value='近期',
+        help="近期只傳送可視範圍附近的 K 棒；較長的範圍會自動降採樣 (OHLC 彙總)"
+    )
     st.markdown("---")
     
-    if state.sim_active:
+    if engine.sim_active:
         st.subheader("⏯️ 自動播放 (Auto-Play)")
         col_speed1, col_speed2 = st.columns(2)
         with col_speed1:
@@ -131,7 +151,7 @@ with st.sidebar:
             st.rerun()
         st.markdown("---")
 
-    if state.sim_active:
+    if engine.sim_active:
         disable_manual = state.auto_play
         col_t1, col_t2 = st.columns(2)
         with col_t1:
@@ -161,7 +181,7 @@ with st.sidebar:
     
     st.subheader("🛒 開倉交易")
     
-    if state.sim_active:
+    if engine.sim_active:
         if state.auto_play:
             st.warning("⚠️ 自動播放中，請暫停後再交易。")
         
@@ -219,7 +239,7 @@ with st.sidebar:
                 final_qty = float(qty_input)
         else:
             pct = st.slider("開倉比例 (%)", 1.0, 100.0, 50.0, 1.0, disabled=disable_trade)
-            asset_to_use = state.balance * (pct / 100.0)
+            asset_to_use = portfolio.balance * (pct / 100.0)
             max_shares = (asset_to_use / price_for_calc * leverage) if price_for_calc > 0 else 0.0
             
             if is_int_qty:
@@ -262,8 +282,39 @@ with st.sidebar:
 
 # --- 主畫面區 ---
 
-if 'last_event_msg' in state and state.last_event_msg:
-    msg = state.last_event_msg
+# 圖表物件保存在 Session 中，設定不變時只增量更新新的 K 棒與有變動的疊加層
+def draw_main_chart():
+    return charts.render_main_chart(
+        state.ticker, engine.core_data, engine.current_sim_index, 
+        portfolio.positions, engine.end_sim_index_on_settle, state.plot_layout,
+        pending_orders=portfolio.pending_orders,
+        selected_indicators=state.indicator_selector, 
+        asset_type=state.asset_type,
+        transactions=portfolio.transactions,
+        indicators=engine.indicators,
+        chart=state.get('main_chart'),
+        history_bars=charts.HISTORY_OPTIONS[chart_history],
+        prices=engine.prices,
+        interval=engine.interval
+    )
+
+# --- 自動播放：一次預先推進一批畫格，由瀏覽器逐格播放，播完才重新執行一次 ---
+playback = None
+if state.auto_play and engine.sim_active:
+    base_fig, state.main_chart = draw_main_chart()
+    playback = (base_fig.to_json(), engine.current_sim_index)
+    frames, can_continue, event_triggered = logic.advance_autoplay(batch_size)
+    playback += (frames,)
+    state.autoplay_due = state.autoplay_pending = None
+    if not can_continue or event_triggered:
+        state.auto_play = False
+        if event_triggered: st.toast("⚠️ 交易觸發，自動暫停播放", icon="⏸️")
+    state.autoplay_token = state.get('autoplay_token', 0) + 1
+    _, open_price, _ = engine.get_price_info(engine.current_sim_index)
+    current_open_price = open_price if open_price > 0 else 0.0
+
+msg = logic.pop_event_msg()
+if msg:
     msg_text = msg['text']
     msg_type = msg.get('type', 'info')
     msg_mode = msg.get('mode', 'alert')
@@ -275,45 +326,53 @@ if 'last_event_msg' in state and state.last_event_msg:
         if msg_type == 'error': st.error(f"### {msg_text}")
         elif msg_type == 'success': st.success(f"### {msg_text}")
         else: st.info(f"### {msg_text}")
-    del state.last_event_msg
 
-if not state.sim_active and state.get('settlement_stats'):
-    stats = state.settlement_stats
+if not engine.sim_active and engine.settlement_stats:
+    stats = engine.settlement_stats
     with st.container():
         st.success(f"🏁 回測模擬結束！")
-        c1, c2, c3, c4 = st.columns(4)
+        c1, c2, c3, c5, c4 = st.columns(5)
         c1.metric("最終資產", f"${stats['final_asset']:,.2f}")
         pnl = stats['total_pnl']
         color = "normal" 
         c2.metric("總損益", f"${pnl:,.2f}", delta_color=color)
         c3.metric("投資報酬率 (ROI)", f"{stats['roi']:+.2f}%", delta_color=color)
+        c5.metric("最大回撤 (MDD)", f"{stats['max_drawdown']:.2f}%")
         with c4:
             s_str = stats['start_date'].strftime('%Y/%m/%d')
             e_str = stats['end_date'].strftime('%Y/%m/%d')
             st.metric("回測期間", f"{s_str} ~ {e_str}")
+
+        def fmt(value, spec): return format(value, spec) if np.isfinite(value) else "—"
+        k1, k2, k3, k4, k5, k6 = st.columns(6)
+        k1.metric("Sharpe", fmt(stats['sharpe'], '.2f'))
+        k2.metric("Sortino", fmt(stats['sortino'], '.2f'))
+        k3.metric("Calmar", fmt(stats['calmar'], '.2f'))
+        k4.metric("勝率", fmt(stats['win_rate'], '.1f') + ("%" if np.isfinite(stats['win_rate']) else ""))
+        k5.metric("獲利因子", fmt(stats['profit_factor'], '.2f'))
+        k6.metric("曝險時間", f"{stats['exposure']:.1f}%", help=f"最長回撤期間 {stats['max_drawdown_duration']} 根 K 棒")
+        if stats['trades']:
+            by_mode = pd.DataFrame.from_dict(stats['by_mode'], orient='index')
+            by_mode = by_mode[by_mode['trades'] > 0]
+            by_mode.index = [logic.get_display_name(state.asset_type, key) for key in by_mode.index]
+            by_mode.columns = ['交易次數', '勝率 (%)', '獲利因子', '平均獲利', '平均虧損', '淨損益']
+            st.dataframe(by_mode.style.format({'勝率 (%)': '{:.1f}', '獲利因子': '{:.2f}', '平均獲利': '${:,.2f}', '平均虧損': '${:,.2f}', '淨損益': '${:,.2f}'}), use_container_width=True)
         st.markdown("---")
 
-total_asset = logic.get_current_asset_value(state.core_data, state.current_sim_index)
+total_asset = logic.get_current_asset_value()
 unrealized_pnl = logic.get_total_unrealized_pnl(current_open_price)
-spot_info = logic.get_spot_summary(state.core_data, state.current_sim_index)
+spot_info = logic.get_spot_summary()
 
 m1, m2, m3, m4 = st.columns(4)
 m1.metric("總資產 (含未實現)", f"${total_asset:,.2f}")
-m2.metric("現金餘額", f"${state.balance:,.2f}")
+m2.metric("現金餘額", f"${portfolio.balance:,.2f}")
 m3.metric("未實現損益", f"${unrealized_pnl:,.2f}")
 m4.metric(f"現貨持倉 ({unit_name})", f"{spot_info['qty']:,.3f}")
 
 # =========================================================
 dynamic_key = f"main_chart_{state.chart_reset_id}"
 
-fig = charts.render_main_chart(
-    state.ticker, state.core_data, state.current_sim_index, 
-    state.positions, state.end_sim_index_on_settle, state.plot_layout,
-    pending_orders=state.pending_orders,
-    selected_indicators=state.indicator_selector, 
-    asset_type=state.asset_type,
-    transactions=state.transactions
-)
+fig, state.main_chart = draw_main_chart()
 
 drawing_config = {
     'scrollZoom': True,
@@ -323,12 +382,26 @@ drawing_config = {
     ]
 }
 
-chart_event = st.plotly_chart(
-    fig, 
-    use_container_width=True, 
-    key=dynamic_key,
-    config=drawing_config
-)
+playback_html = None
+if playback:
+    playback_html = state.main_chart.playback_html(*playback, refresh_rate, drawing_config, token=state.autoplay_token)
+    if state.auto_play:
+        duration = len(playback[2]) * refresh_rate
+        if playback_html:
+            # 計時等 iframe 載入 plotly.js 並畫好第一格後才開始 (見 autoplay_timer)
+            state.autoplay_pending = (state.autoplay_token, duration, time.time() + config.AUTOPLAY_LOAD_TIMEOUT)
+        else:
+            state.autoplay_due = time.time() + duration
+
+if playback_html:
+    st.iframe(playback_html, height=int(fig.layout.height or 800) + 20)
+else:
+    chart_event = st.plotly_chart(
+        fig, 
+        use_container_width=True, 
+        key=dynamic_key,
+        config=drawing_config
+    )
 
 if dynamic_key in state and state[dynamic_key]:
     layout = state[dynamic_key].get('layout', {})
@@ -343,18 +416,10 @@ if dynamic_key in state and state[dynamic_key]:
 st.markdown("---")
 st.header("📋 掛單管理 (Pending Orders)")
 
-if state.pending_orders:
-    pending_data = []
-    for order in state.pending_orders:
-        pending_data.append({
-            'ID': order['id'],
-            '類型': order['display_name'],
-            '訂單類型': order['order_type'],
-            '掛單價格': order['price'],
-            '數量': order['qty'],
-            '槓桿': f"{order['leverage']}x",
-        })
-    df_pending = pd.DataFrame(pending_data)
+if portfolio.pending_orders:
+    df_pending = to_frame(portfolio.pending_orders, ['id', 'display_name', 'order_type', 'price', 'qty', 'leverage'])
+    df_pending['leverage'] = df_pending['leverage'].map(lambda x: f"{x}x")
+    df_pending.columns = ['ID', '類型', '訂單類型', '掛單價格', '數量', '槓桿']
     col_p_table, col_p_action = st.columns([3, 1])
     with col_p_table:
         st.dataframe(
@@ -368,7 +433,7 @@ if state.pending_orders:
         )
     with col_p_action:
         st.caption("取消操作")
-        order_to_cancel = st.selectbox("選擇掛單取消", options=[o['id'] for o in state.pending_orders], format_func=lambda x: f"ID: {x} (點擊取消)")
+        order_to_cancel = st.selectbox("選擇掛單取消", options=[o.id for o in portfolio.pending_orders], format_func=lambda x: f"ID: {x} (點擊取消)")
         if st.button("🚫 取消選定掛單", disabled=state.auto_play):
             logic.cancel_order(order_to_cancel)
             st.rerun()
@@ -378,17 +443,16 @@ else:
 st.markdown("---")
 st.header("🎯 交易倉位 (Open Positions)")
 
-if state.positions:
+if portfolio.positions:
     pos_data = []
-    for pos in state.positions:
-        qty = pos['qty']
-        cost = pos['cost']
-        leverage = pos.get('leverage', 1.0)
-        mode_info = config.TRADE_MODE_MAP.get(pos['pos_mode_key'], {})
-        direction = mode_info.get('direction', 'Long')
+    for pos in portfolio.positions:
+        qty = pos.qty
+        cost = pos.cost
+        leverage = pos.leverage
+        direction = pos.direction
         pnl = logic.calculate_pnl_value(direction, qty, cost, current_open_price)
-        sl_val = pos['sl']
-        tp_val = pos['tp']
+        sl_val = pos.sl
+        tp_val = pos.tp
         sl_pnl_str = ""
         tp_pnl_str = ""
         if sl_val > 0:
@@ -400,7 +464,7 @@ if state.positions:
             sign = "+" if est_tp_pnl > 0 else "-"
             tp_pnl_str = f"預估 {sign}${abs(est_tp_pnl):,.0f}"
         pos_data.append({
-            'ID': pos['id'], '類型': pos['display_name'], '槓桿': f"{leverage:.1f}x",
+            'ID': pos.id, '類型': pos.display_name, '槓桿': f"{leverage:.1f}x",
             '數量': qty, '開倉價': cost, '未實現損益': pnl,
             'SL': sl_val, 'SL 預估損益': sl_pnl_str,
             'TP': tp_val, 'TP 預估損益': tp_pnl_str
@@ -429,28 +493,14 @@ if state.positions:
         updates = edited_df.to_dict('index')
         changed = False
         validation_error = False
-        for pos in state.positions:
-            pid = pos['id']
+        for pos in portfolio.positions:
+            pid = pos.id
             if pid in updates:
                 new_sl = updates[pid]['SL']
                 new_tp = updates[pid]['TP']
-                if pos['sl'] == new_sl and pos['tp'] == new_tp: continue
-                liq_price = pos.get('liquidation_price', 0.0)
-                cost_price = pos.get('cost', 0.0)
-                mode_info = config.TRADE_MODE_MAP.get(pos['pos_mode_key'], {})
-                direction = mode_info.get('direction', 'Long')
-                if liq_price > 0:
-                    if direction == 'Long' and new_sl > 0 and new_sl <= liq_price:
-                        st.error(f"🚫 ID {pid[-4:]} 錯誤：多頭止損 ({new_sl}) 不能低於強制平倉價 ({liq_price:.2f})！"); validation_error = True; continue
-                    elif direction == 'Short' and new_sl > 0 and new_sl >= liq_price:
-                        st.error(f"🚫 ID {pid[-4:]} 錯誤：空頭止損 ({new_sl}) 不能高於強制平倉價 ({liq_price:.2f})！"); validation_error = True; continue
-                if new_tp > 0:
-                    if direction == 'Long' and new_tp <= cost_price:
-                        st.error(f"🚫 ID {pid[-4:]} 錯誤：多頭止盈 ({new_tp}) 必須高於開倉價 ({cost_price:.2f})！"); validation_error = True; continue
-                    elif direction == 'Short' and new_tp >= cost_price:
-                        st.error(f"🚫 ID {pid[-4:]} 錯誤：空頭止盈 ({new_tp}) 必須低於開倉價 ({cost_price:.2f})！"); validation_error = True; continue
-                pos['sl'] = new_sl
-                pos['tp'] = new_tp
+                if pos.sl == new_sl and pos.tp == new_tp: continue
+                if not engine.set_sl_tp(pid, new_sl, new_tp):
+                    st.error(logic.pop_event_msg()['text']); validation_error = True; continue
                 changed = True
         if not validation_error:
             if changed: st.success("設定已更新！"); st.rerun() 
@@ -459,8 +509,8 @@ if state.positions:
     st.markdown("---")
     col_header, col_close_all = st.columns([4, 1])
     with col_header: st.subheader("手動平倉操作")
-    if state.sim_active:
-        pos_opts = {p['id']: f"{p['display_name']} {p['qty']:.3f} ({p['id'][-4:]})" for p in state.positions}
+    if engine.sim_active:
+        pos_opts = {p.id: f"{p.display_name} {p.qty:.3f} ({p.id[-4:]})" for p in portfolio.positions}
         with col_close_all:
              st.write("") 
              if st.button("🔴 平倉所有部位", use_container_width=True, key='close_all_btn', disabled=disabled_pos_edit):
@@ -469,9 +519,9 @@ if state.positions:
         with col_select:
             st.caption("選擇部位")
             sel_pid = st.selectbox("選擇部位", options=list(pos_opts.keys()), format_func=lambda x: pos_opts[x], label_visibility='collapsed', key='manual_close_select', disabled=disabled_pos_edit)
-        target_pos = next((p for p in state.positions if p['id'] == sel_pid), None)
+        target_pos = portfolio.find_position(sel_pid)
         if target_pos:
-            max_q = target_pos['qty']
+            max_q = target_pos.qty
             close_q = max_q
             with col_mode_radio:
                 st.caption("平倉模式")
@@ -498,9 +548,8 @@ else:
 
 st.markdown("---")
 st.header("📝 交易紀錄 (Transaction History)")
-if state.transactions:
-    df_tx = pd.DataFrame(state.transactions)
-    df_display = df_tx[['type_display', 'qty', 'open_price', 'close_price', 'fees', 'net_pnl', 'reason']].copy()
+if portfolio.transactions:
+    df_display = to_frame(portfolio.transactions, ['type_display', 'qty', 'open_price', 'close_price', 'fees', 'net_pnl', 'reason'])
     df_display.columns = ['類型', '數量', '開倉價', '平倉價', '總手續費', '淨損益', '備註']
     def color_pnl(val): return f'color: {"green" if val > 0 else "red" if val < 0 else ""}'
     st.dataframe(df_display.style.map(color_pnl, subset=['淨損益']).format({'數量': '{:,.3f}', '開倉價': '${:,.2f}', '平倉價': '${:,.2f}', '總手續費': '${:,.2f}', '淨損益': '${:,.2f}'}), use_container_width=True, hide_index=True)
@@ -508,26 +557,26 @@ else:
     st.info("尚無已平倉的交易紀錄。")
 
 st.markdown("---")
-if state.equity_history and len(state.equity_history) > 1:
+if len(engine.equity_history) > 1:
     st.subheader("💰 總資產成長曲線")
-    equity_fig = charts.render_equity_curve(state.equity_history)
+    equity_fig = charts.render_equity_curve(engine.equity_history)
     if equity_fig: st.plotly_chart(equity_fig, use_container_width=True, config={'displayModeBar': False})
 else:
     st.caption("資產曲線將在回測開始後顯示...")
 
-if state.auto_play and state.sim_active:
-    time.sleep(refresh_rate) 
-    can_continue, event_triggered = logic.advance_multiple_days(batch_size)
-    if not can_continue:
-        state.auto_play = False
-        st.rerun()
-    elif event_triggered:
-        state.auto_play = False
-        st.toast("⚠️ 交易觸發，自動暫停播放", icon="⏸️")
-        st.rerun()
-    else:
-
-        st.rerun()
-
-
-
+# 播放計時在瀏覽器端進行 (不佔用伺服器執行緒)，整批畫格播完後才重新執行整個頁面
+if state.get('autoplay_due') or state.get('autoplay_pending'):
+    @st.fragment(run_every=0.25)
+    def autoplay_timer():
+        pending = state.get('autoplay_pending')
+        if pending:
+            token, duration, load_deadline = pending
+            result = playback_listener()(key="playback_listener", data=token, on_loaded_change=lambda: None)
+            # 收到 iframe 畫好的通知才開始計時；通知遺失 (例如瀏覽器阻擋) 時逾時後照常開始
+            if result.loaded == token or time.time() >= load_deadline:
+                state.autoplay_pending = None
+                state.autoplay_due = time.time() + duration
+        if state.get('autoplay_due') and time.time() >= state.autoplay_due:
+            state.autoplay_due = None
+            st.rerun()
+    autoplay_timer()
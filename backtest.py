@@ -0,0 +1,268 @@
+# backtest.py
+# 批次蒙地卡羅回測：在同一代碼的多段歷史區間 (隨機抽樣或逐段步進) 上重播策略，以多行程平行執行並彙整 ROI / 最大回撤分布
+# 用法：python backtest.py TSLA --windows 1000 --seed 0 --strategy ma_cross
+
+import argparse
+import copy
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import config
+from data_sources import load_ohlcv
+from engine import SimulationEngine
+from indicators import LazyIndicators, INDICATOR_WARMUP_BARS
+from intrabar import IntrabarPaths, build_intrabar
+from price_cache import build_price_cache
+from resample import interval_minutes
+from strategy import Strategy, StrategyRunner, RSIReversion
+
+# 每段回測區間的長度 (觀察期 + 最少模擬天數)，與互動模式相同
+WINDOW_DAYS = config.INITIAL_OBSERVATION_DAYS + config.MIN_SIMULATION_DAYS
+
+# --- 內建策略 ---
+# 策略可為 strategy.Strategy (由 StrategyRunner 逐根 K 棒驅動)，
+# 或可呼叫物件 strategy(engine)，在每次推進前被呼叫，直接透過 engine 的下單函式交易；
+# 回傳值為距離下次呼叫的 K 棒數 (None 代表 1)，期間以 advance_multiple_days 快轉 (遇到成交/觸發事件會提早呼叫)。
+# 需為模組層級的類別才能傳給子行程 (pickle)。
+
+def _spot_buy_qty(engine: SimulationEngine, price: float, fraction: float) -> float:
+    """以可用餘額的 fraction 比例 (含手續費) 計算現貨可買數量，依最小單位無條件捨去"""
+    min_qty = config.ASSET_CONFIGS[engine.asset_type]['min_qty']
+    qty = engine.portfolio.balance * fraction / (price * (1 + config.FEE_RATE))
+    return math.floor(qty / min_qty) * min_qty
+
+class BuyAndHold:
+    """第一根可交易 K 棒以開盤價買入現貨並持有到結束"""
+
+    def __init__(self, fraction: float = 1.0):
+        self.fraction = fraction
+
+    def __call__(self, engine: SimulationEngine):
+        if not engine.portfolio.positions:
+            price = engine.get_current_price()
+            qty = _spot_buy_qty(engine, price, self.fraction)
+            if qty > 0: engine.execute_trade('Spot_Buy', qty, price)
+        return engine.max_sim_index - engine.current_sim_index
+
+class MACrossover:
+    """
+    均線交叉 (現貨)：快線由下往上穿越慢線時全額買入，由上往下穿越時全部賣出。
+    訊號使用前一根 K 棒收盤後的均線值，於本根開盤價成交 (不偷看當根收盤)。
+    """
+
+    def __init__(self, fast: int = 20, slow: int = 60, fraction: float = 1.0):
+        self.fast = fast
+        self.slow = slow
+        self.fraction = fraction
+        self._engine = None
+        self._signal = None
+
+    def required_indicators(self):
+        return [('MA', (self.fast, self.slow))]
+
+    def _prepare(self, engine: SimulationEngine):
+        ma = engine.indicators.get('MA', (self.fast, self.slow))
+        above = (ma[f'MA{self.fast}'] > ma[f'MA{self.slow}']).to_numpy()
+        # _signal[i]：第 i 根開盤時是否應持有 (依第 i-1 根的均線)
+        self._signal = np.r_[False, above[:-1]]
+        self._engine = engine
+
+    def __call__(self, engine: SimulationEngine):
+        if self._engine is not engine: self._prepare(engine)
+
+        idx = engine.current_sim_index
+        want_long = self._signal[idx]
+        positions = [p for p in engine.portfolio.positions if p.pos_mode_key == 'Spot_Buy']
+        price = engine.get_current_price()
+
+        if want_long and not positions:
+            qty = _spot_buy_qty(engine, price, self.fraction)
+            if qty > 0: engine.execute_trade('Spot_Buy', qty, price)
+        elif not want_long and positions:
+            for pos in positions:
+                engine.close_position_lot(pos.id, pos.qty, price, reason='策略賣出', mode='手動')
+
+        # 訊號不變的 K 棒不需要呼叫策略，直接跳到下一次訊號改變
+        changes = np.flatnonzero(self._signal[idx + 1:] != want_long)
+        return int(changes[0]) + 1 if len(changes) else engine.max_sim_index - idx
+
+STRATEGIES = {
+    'buy_and_hold': BuyAndHold,
+    'ma_cross': MACrossover,
+    'rsi_reversion': RSIReversion,
+}
+
+# --- 區間抽樣 ---
+
+def sample_windows(total_days: int, n_windows: int | None = None, seed: int | None = None,
+                   step: int | None = None, window_days: int = WINDOW_DAYS) -> list[int]:
+    """
+    回傳各段回測區間的起點 (同 select_random_start_index 的 start_view_index)。
+    指定 step 時逐段步進 (0, step, 2*step, ...，n_windows 為上限)；否則以 seed 隨機抽取 n_windows 段 (可重複)。
+    """
+    if total_days < config.INITIAL_OBSERVATION_DAYS:
+        return []
+    max_start_index = max(0, total_days - window_days)
+
+    if step is not None:
+        starts = list(range(0, max_start_index + 1, step))
+        return starts[:n_windows] if n_windows is not None else starts
+
+    rng = random.Random(seed)
+    return [rng.randint(0, max_start_index) for _ in range(n_windows or 1)]
+
+# --- 單段回測 ---
+
+def run_window(history: pd.DataFrame, start_view_idx: int, strategy, ticker: str | None = None,
+               asset_type: str = 'Stock', indicators_cache=None, interval: str = config.DEFAULT_INTERVAL,
+               intrabar: IntrabarPaths | None = None) -> dict:
+    """
+    在單一區間上執行策略直到結算。history 為含暖機期的完整 OHLCV，
+    start_view_idx 為扣除暖機期後的區間起點 (與互動模式相同的座標)。
+    intrabar 為與 history 對齊的盤中路徑 (見 load_intrabar)，提供時同一根 K 棒內的事件依觸價先後處理。
+    """
+    view_start = INDICATOR_WARMUP_BARS + start_view_idx
+    window = history.iloc[view_start:view_start + WINDOW_DAYS].reset_index(drop=True)
+    indicators = LazyIndicators(ticker, history, view_start, view_start + len(window), cache=indicators_cache)
+    paths = intrabar.slice(view_start, view_start + len(window)) if intrabar is not None else None
+    engine = SimulationEngine(window, asset_type=asset_type, start_index=config.INITIAL_OBSERVATION_DAYS,
+                              indicators=indicators, interval=interval, intrabar=paths)
+
+    strategy = copy.deepcopy(strategy)  # 每段區間使用全新的策略狀態
+    if isinstance(strategy, Strategy):
+        StrategyRunner(engine, strategy).run()
+    else:
+        while engine.sim_active:
+            bars = strategy(engine) or 1
+            if not engine.sim_active: break
+            engine.advance_multiple_days(bars)
+
+    stats = engine.settlement_stats
+    return {
+        'start_view_idx': start_view_idx,
+        'start_date': stats['start_date'], 'end_date': stats['end_date'],
+        'bars': engine.end_sim_index_on_settle - config.INITIAL_OBSERVATION_DAYS,
+        'final_asset': stats['final_asset'], 'roi': stats['roi'],
+        'max_drawdown': stats['max_drawdown'], 'max_drawdown_duration': stats['max_drawdown_duration'],
+        'sharpe': stats['sharpe'], 'sortino': stats['sortino'], 'calmar': stats['calmar'],
+        'win_rate': stats['win_rate'], 'profit_factor': stats['profit_factor'], 'exposure': stats['exposure'],
+        'n_trades': len(engine.portfolio.transactions),
+        'bankrupt': stats['final_asset'] <= 0,
+    }
+
+# --- 盤中路徑 ---
+
+def load_intrabar(ticker: str, history: pd.DataFrame, model: str, interval: str = config.DEFAULT_INTERVAL) -> IntrabarPaths:
+    """
+    建立與 history 對齊的盤中路徑 (整段歷史只建一次，各區間以切片取用)。
+    model 為 'ohlc' (以 O→H→L→C / O→L→H→C 推估) 或較 interval 更細的 K 棒週期 (例如日 K 搭配 '5m')；
+    細週期資料只涵蓋近期，其餘 K 棒仍以推估路徑處理。
+    """
+    prices = build_price_cache(history)
+    if model == 'ohlc': return build_intrabar(prices)
+    if interval_minutes(model) >= interval_minutes(interval):
+        raise ValueError(f"盤中路徑的週期 ({model}) 必須比 K 棒週期 ({interval}) 更細。")
+    return build_intrabar(prices, load_ohlcv(ticker, interval=model), interval)
+
+# --- 多行程執行 ---
+
+_worker_state = {}
+
+def _init_worker(history, strategy, ticker, asset_type, interval=config.DEFAULT_INTERVAL, intrabar=None):
+    _worker_state.update(history=history, strategy=strategy, ticker=ticker, asset_type=asset_type,
+                         interval=interval, intrabar=intrabar)
+
+def _run_chunk(starts: list[int]) -> list[dict]:
+    s = _worker_state
+    return [run_window(s['history'], start, s['strategy'], s['ticker'], s['asset_type'],
+                       interval=s['interval'], intrabar=s['intrabar'])
+            for start in starts]
+
+def run_monte_carlo(ticker: str, strategy, n_windows: int = 1000, seed: int | None = None, step: int | None = None,
+                    asset_type: str = 'Stock', history: pd.DataFrame | None = None,
+                    max_workers: int | None = None, interval: str = config.DEFAULT_INTERVAL,
+                    intrabar: str | None = None) -> pd.DataFrame:
+    """
+    對 ticker 抽樣 n_windows 段區間 (或以 step 逐段步進) 並平行回測，回傳每段一列的結果表。
+    history 未提供時以 data_sources.load_ohlcv 載入 interval 週期的 K 棒；max_workers=1 時在本行程依序執行。
+    intrabar 指定盤中路徑模型 ('ohlc' 或較細的 K 棒週期，見 load_intrabar)，None 為逐根檢查。
+    """
+    if history is None:
+        history = load_ohlcv(ticker, interval=interval)
+        if history is None:
+            raise ValueError(f"無法載入 {ticker} 的數據。")
+    history = history.reset_index(drop=True)
+    paths = load_intrabar(ticker, history, intrabar, interval) if intrabar else None
+
+    starts = sample_windows(len(history) - INDICATOR_WARMUP_BARS, n_windows, seed=seed, step=step)
+    if not starts:
+        return pd.DataFrame()
+
+    if max_workers == 1:
+        _init_worker(history, strategy, ticker, asset_type, interval, paths)
+        rows = _run_chunk(starts)
+    else:
+        # 每個子行程只接收一次資料與策略，之後以區間起點分批派工
+        n_chunks = (max_workers or os.cpu_count() or 1) * 4
+        chunk_size = max(1, -(-len(starts) // n_chunks))
+        chunks = [starts[i:i + chunk_size] for i in range(0, len(starts), chunk_size)]
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(history, strategy, ticker, asset_type, interval, paths)) as executor:
+            rows = [row for chunk_rows in executor.map(_run_chunk, chunks) for row in chunk_rows]
+
+    return pd.DataFrame(rows)
+
+def summarize(results: pd.DataFrame) -> dict:
+    """彙整 ROI、最大回撤與風險調整後報酬的分布 (NaN 不計入平均)"""
+    if results.empty:
+        return {'windows': 0}
+    roi = results['roi']
+    mdd = results['max_drawdown']
+    return {
+        'windows': len(results),
+        'roi_mean': roi.mean(), 'roi_std': roi.std(), 'roi_median': roi.median(),
+        'roi_p5': roi.quantile(0.05), 'roi_p95': roi.quantile(0.95),
+        'win_rate': (roi > 0).mean() * 100,
+        'mdd_mean': mdd.mean(), 'mdd_median': mdd.median(), 'mdd_p95': mdd.quantile(0.95), 'mdd_max': mdd.max(),
+        'sharpe_mean': results['sharpe'].mean(), 'sortino_mean': results['sortino'].mean(),
+        'calmar_mean': results['calmar'].mean(), 'exposure_mean': results['exposure'].mean(),
+        'trade_win_rate': results['win_rate'].mean(),
+        'bankruptcies': int(results['bankrupt'].sum()),
+    }
+
+def rank(results: pd.DataFrame, by: str = 'sharpe', top: int | None = None) -> pd.DataFrame:
+    """依指標由高到低排序各段回測 (max_drawdown 等越小越好的指標請先取負值或自行排序)"""
+    ranked = results.sort_values(by, ascending=False, na_position='last')
+    return ranked.head(top) if top else ranked
+
+def main():
+    parser = argparse.ArgumentParser(description="批次蒙地卡羅回測")
+    parser.add_argument('ticker', nargs='?', default=config.DEFAULT_TICKER)
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='buy_and_hold')
+    parser.add_argument('--windows', type=int, default=1000, help="抽樣區間數 (逐段模式下為上限)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--step', type=int, default=None, help="逐段步進的間隔 (K 棒數)，不指定則隨機抽樣")
+    parser.add_argument('--asset-type', choices=sorted(config.ASSET_CONFIGS), default='Stock')
+    parser.add_argument('--interval', choices=list(config.INTERVALS), default=config.DEFAULT_INTERVAL,
+                        help="K 棒週期 (區間長度與 --step 皆以 K 棒計)")
+    parser.add_argument('--intrabar', choices=['ohlc', *config.INTERVALS], default=None,
+                        help="盤中路徑模型：ohlc 以 O→H→L→C / O→L→H→C 推估，或指定較細的 K 棒週期決定同根 K 棒內的觸價順序")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--top', type=int, default=0, help="另外列出指標最佳的前 N 段區間")
+    parser.add_argument('--rank-by', default='sharpe', help="--top 使用的排序欄位 (例如 sharpe、calmar、roi)")
+    args = parser.parse_args()
+
+    results = run_monte_carlo(args.ticker, STRATEGIES[args.strategy](), n_windows=args.windows, seed=args.seed,
+                              step=args.step, asset_type=args.asset_type, max_workers=args.workers,
+                              interval=args.interval, intrabar=args.intrabar)
+    for key, value in summarize(results).items():
+        print(f"{key:<16}{value:,.2f}" if isinstance(value, float) else f"{key:<16}{value}")
+    if args.top and not results.empty:
+        columns = ['start_date', 'end_date', 'roi', 'max_drawdown', 'sharpe', 'sortino', 'calmar', 'win_rate', 'n_trades']
+        print(rank(results, args.rank_by, args.top)[columns].to_string(index=False, float_format='{:,.2f}'.format))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# benchmark.py
+# 效能基準測試：python benchmark.py
+# 使用 data_sources.SyntheticSource 產生的行情 (不需網路)，量測逐 K 棒查詢與回測引擎的耗時
+
+import time
+import pandas as pd
+import config
+from data_sources import SyntheticSource
+from engine import SimulationEngine
+from price_cache import build_price_cache
+
+def make_bench_data(n_bars: int = 970, seed: int = 0) -> pd.DataFrame:
+    """產生合成行情 (GBM + 跳躍擴散) 作為測試資料"""
+    return SyntheticSource(seed=seed, n_bars=n_bars).fetch('BENCH')
+
+def _timeit(func, repeat: int = 5) -> float:
+    """回傳多次執行中最快的一次 (秒)"""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def bench_price_lookup(data: pd.DataFrame) -> dict:
+    """逐 K 棒取 Open/High/Low：DataFrame.iloc vs PriceCache"""
+    n = len(data)
+    cache = build_price_cache(data)
+
+    def via_iloc():
+        for i in range(n):
+            data['Open'].iloc[i].item(); data['High'].iloc[i].item(); data['Low'].iloc[i].item()
+
+    def via_cache():
+        for i in range(n):
+            cache.get_bar(i)
+
+    t_iloc = _timeit(via_iloc)
+    t_cache = _timeit(via_cache)
+    return {'iloc (us/bar)': t_iloc / n * 1e6, 'cache (us/bar)': t_cache / n * 1e6, 'speedup': t_iloc / t_cache}
+
+def bench_engine_advance(data: pd.DataFrame, fast_forward: bool) -> dict:
+    """持有現貨與一張遠離市價的掛單，推進至回測結束"""
+    bars = len(data) - 1 - config.INITIAL_OBSERVATION_DAYS
+
+    def run():
+        engine = SimulationEngine(data, fast_forward=fast_forward)
+        price = engine.get_current_price()
+        engine.execute_trade('Spot_Buy', 10, price)
+        engine.place_limit_order('Spot_Buy', 1, price * 0.01)
+        engine.advance_multiple_days(bars)
+
+    t = _timeit(run)
+    return {'total (ms)': t * 1e3, 'us/bar': t / bars * 1e6}
+
+def _report(name: str, result: dict):
+    print(f"{name:<24}" + "  ".join(f"{k}: {v:,.2f}" for k, v in result.items()))
+
+def main():
+    data = make_bench_data()
+    print(f"bars = {len(data)}")
+    _report("price lookup", bench_price_lookup(data))
+    _report("engine (stepping)", bench_engine_advance(data, fast_forward=False))
+    _report("engine (fast-forward)", bench_engine_advance(data, fast_forward=True))
+
+if __name__ == '__main__':
+    main()
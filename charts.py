@@ -1,315 +1,545 @@
 # charts.py
 # 負責繪製 Plotly 圖表 (K線、MA、Volume、RSI)
 
+import json
 import plotly.graph_objects as go
+from functools import cache
+from plotly.offline import get_plotlyjs
 from plotly.subplots import make_subplots
+from plotly.utils import PlotlyJSONEncoder
 import config
 import numpy as np
-import pandas as pd
+from price_cache import build_price_cache
 
-def render_main_chart(ticker, core_data, current_idx, positions, end_sim_index_on_settle, saved_layout=None, pending_orders=None, selected_indicators=None, asset_type='Stock', transactions=None):
+# 介面選項 -> (指標名稱, 該指標的欄位)
+INDICATOR_OPTIONS = {
+    'MA (移動平均線)': ('MA', [f'MA{p}' for p in config.MA_PERIODS]),
+    'BBands (主圖)': ('BBands', ['BB_MA', 'BB_UPPER', 'BB_LOWER']),
+    'MACD': ('MACD', ['MACD_Line', 'MACD_Signal', 'MACD_Hist']),
+    'RSI': ('RSI', ['RSI']),
+}
+
+LABEL_FONT = "Roboto, Arial, sans-serif"
+
+# 圖表歷史範圍選項 -> 載入的 K 棒數 (None：可視範圍 + 緩衝；0：全部)
+HISTORY_OPTIONS = {'近期': None, '1 年': 252, '3 年': 756, '全部': 0}
+
+# 降採樣時各欄位的彙總方式 (未列出的欄位取每組最後一根，與收盤價對齊)
+BUCKET_REDUCERS = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Volume': 'sum'}
+
+def bucket_reduce(values, starts, how):
+    """依分組起點 starts 彙總 values：first / last / max / min / sum"""
+    if how == 'first': return values[starts]
+    if how == 'last': return values[np.r_[starts[1:], len(values)] - 1]
+    ufunc = {'max': np.fmax, 'min': np.fmin, 'sum': np.add}[how]
+    return ufunc.reduceat(values, starts)
+
+def lttb_indices(x, y, n_out):
     """
-    繪製主圖表，包括 K 線、成交量、技術指標等
+    Largest-Triangle-Three-Buckets 降採樣，回傳保留點的索引 (含頭尾)。
+    x、y 為等長的數值陣列，n_out 為輸出點數。
     """
-    if selected_indicators is None:
-        selected_indicators = []
-        
-    # 判斷是否顯示成交量
-    show_volume = (asset_type != 'Forex')
-    
-    # 決定子圖數量和高度
-    num_subplots = 1 # 預設只有 K 線
-    row_heights = [0.6 if show_volume else 0.8] # K 線高度
-    subplot_titles = [f"{ticker} 日線 (Log)"]
-    
-    if show_volume:
-        num_subplots += 1
-        row_heights.append(0.2)
-        subplot_titles.append("成交量")
-    
-    if 'MACD' in selected_indicators:
-        num_subplots += 1
-        row_heights.append(0.2)
-        subplot_titles.append("MACD")
-    
-    if 'RSI' in selected_indicators:
-        num_subplots += 1
-        row_heights.append(0.2)
-        subplot_titles.append("RSI(14)")
-        
-    # 定義各指標所在的 Row
-    row_ptr = 1
-    k_line_row = row_ptr
-    row_ptr += 1
-    
-    volume_row = 0
-    if show_volume:
-        volume_row = row_ptr
-        row_ptr += 1
-        
-    macd_row = 0
-    if 'MACD' in selected_indicators:
-        macd_row = row_ptr
-        row_ptr += 1
-        
-    rsi_row = 0
-    if 'RSI' in selected_indicators:
-        rsi_row = row_ptr
-        row_ptr += 1
-        
-    # --- 數據準備 ---
-    display_start_idx = 0 
-    display_end_idx = current_idx + 1
-    
-    data_to_display = core_data.iloc[display_start_idx : display_end_idx].copy()
-    data_to_display['DateStr'] = data_to_display['Date'].dt.strftime('%Y-%m-%d')
-    x_axis_data = data_to_display['DateStr']
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0] = 0
+    picked[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
 
-    last_visible_date = x_axis_data.iloc[-1]
+def _attach_indicators(data_to_display, selected_indicators, indicators):
+    """只為勾選的指標補上欄位 (core_data 已含該欄位時直接沿用)"""
+    if indicators is None:
+        return data_to_display
+    for option in selected_indicators:
+        if option not in INDICATOR_OPTIONS: continue
+        name, columns = INDICATOR_OPTIONS[option]
+        if all(col in data_to_display.columns for col in columns): continue
+        values = indicators.get(name).iloc[:len(data_to_display)]
+        for col in columns:
+            data_to_display[col] = values[col].to_numpy()
+    return data_to_display
 
-    # --- Y 軸動態範圍計算 ---
-    view_window_data = data_to_display.iloc[-config.VIEW_DAYS:] if len(data_to_display) > config.VIEW_DAYS else data_to_display
-    
-    if not view_window_data.empty:
-        cols_to_check = ['Low', 'High']
-        if 'BBands (主圖)' in selected_indicators and 'BB_UPPER' in view_window_data.columns:
-             cols_to_check.extend(['BB_UPPER', 'BB_LOWER'])
-
-        price_min = view_window_data[cols_to_check].min().min()
-        price_max = view_window_data[cols_to_check].max().max()
-        
-        padding = (price_max - price_min) * 0.1 
+def interval_label(interval: str) -> str:
+    """K 棒週期的顯示名稱 (主圖標題用)，例如 日線、5m K 線"""
+    return '日線' if interval == '1d' else f"{interval} K 線"
+
+def _hline(y, row, color, dash, width=1):
+    """橫跨整個子圖的水平線 (等同 fig.add_hline)"""
+    return dict(type='line', xref='x domain' if row == 1 else f'x{row} domain', x0=0, x1=1,
+                yref='y' if row == 1 else f'y{row}', y0=y, y1=y,
+                line=dict(color=color, dash=dash, width=width))
+
+def _vline(x, color, dash):
+    """主圖的垂直線 (等同 fig.add_vline)"""
+    return dict(type='line', xref='x', x0=x, x1=x, yref='y domain', y0=0, y1=1, line=dict(color=color, dash=dash))
+
+class MainChart:
+    """
+    主圖表的增量繪製。同一份 core_data 與指標設定下只建立一次 Figure，
+    各序列 (K 線、指標、成交量) 事先整理成陣列，之後每次 update 只延伸到新的 K 棒；
+    持倉線/掛單線只在內容變動時重建，交易標記只追加新成交的紀錄。
+    """
+
+    def __init__(self, ticker, core_data, selected_indicators=None, asset_type='Stock', indicators=None, prices=None,
+                 interval=config.DEFAULT_INTERVAL):
+        self.core_data = core_data
+        self.interval = interval
+        # 日期字串與日期 -> 索引對照表由 PriceCache 預先建立，與引擎共用
+        self.prices = prices if prices is not None else build_price_cache(core_data)
+        self.selected_indicators = list(selected_indicators or [])
+        self.asset_type = asset_type
+
+        selected = self.selected_indicators
+        data = _attach_indicators(core_data.copy(), selected, indicators)
+        self.dates = self.prices.date_labels
+        self.columns = {col: data[col].to_numpy() for col in data.columns if col not in ('Date',)}
+
+        # 判斷是否顯示成交量
+        self.show_volume = (asset_type != 'Forex')
+        show_bbands = 'BBands (主圖)' in selected and 'BB_MA' in data.columns
+        self.range_columns = ['Low', 'High'] + (['BB_UPPER', 'BB_LOWER'] if show_bbands else [])
+
+        # 決定子圖數量、高度與各指標所在的 Row
+        row_heights = [0.6 if self.show_volume else 0.8]
+        subplot_titles = [f"{ticker} {interval_label(interval)} (Log)"]
+        self.volume_row = self.macd_row = self.rsi_row = 0
+        if self.show_volume:
+            row_heights.append(0.2); subplot_titles.append("成交量"); self.volume_row = len(row_heights)
+        if 'MACD' in selected:
+            row_heights.append(0.2); subplot_titles.append("MACD"); self.macd_row = len(row_heights)
+        if 'RSI' in selected:
+            row_heights.append(0.2); subplot_titles.append("RSI(14)"); self.rsi_row = len(row_heights)
+
+        fig = make_subplots(
+            rows=len(row_heights), cols=1,
+            row_heights=row_heights,
+            shared_xaxes=True,
+            vertical_spacing=0.03,
+            subplot_titles=subplot_titles
+        )
+
+        # 隨 K 棒延伸的序列：trace 索引 -> {屬性: 欄位}
+        self.series = []
+
+        def add_series(trace, row, **columns):
+            fig.add_trace(trace, row=row, col=1)
+            self.series.append((len(fig.data) - 1, columns))
+
+        # 1. K線圖
+        add_series(go.Candlestick(name='K-Line'), 1, open='Open', high='High', low='Low', close='Close')
+
+        # 2. MA 線
+        if 'MA (移動平均線)' in selected:
+            for p_ma in config.MA_PERIODS:
+                if f'MA{p_ma}' in data.columns:
+                    add_series(go.Scatter(mode='lines', name=f'MA{p_ma}',
+                                          line=dict(color=config.MA_COLORS.get(p_ma, 'gray'), width=1)), 1, y=f'MA{p_ma}')
+
+        # 3. BBands
+        if show_bbands:
+            add_series(go.Scatter(mode='lines', name='BB Upper', line=dict(color='orange', width=1)), 1, y='BB_UPPER')
+            add_series(go.Scatter(mode='lines', name='BB MA', line=dict(color='yellow', width=1)), 1, y='BB_MA')
+            add_series(go.Scatter(mode='lines', name='BB Lower', line=dict(color='orange', width=1)), 1, y='BB_LOWER')
+
+        # 持倉/掛單價位標籤 (全部合併為一條文字序列)
+        fig.add_trace(go.Scatter(mode='text', textposition='middle right', cliponaxis=False,
+                                 showlegend=False, hoverinfo='skip'), row=1, col=1)
+        self.label_trace = len(fig.data) - 1
+
+        # 歷史交易箭頭 (Buy/Sell Markers)
+        fig.add_trace(go.Scatter(mode='markers', name='Buy', hoverinfo='text',
+                                 marker=dict(symbol='triangle-up', size=12, color='#00CC96', line=dict(width=1, color='white'))), row=1, col=1)
+        self.buy_trace = len(fig.data) - 1
+        fig.add_trace(go.Scatter(mode='markers', name='Sell', hoverinfo='text',
+                                 marker=dict(symbol='triangle-down', size=12, color='#EF553B', line=dict(width=1, color='white'))), row=1, col=1)
+        self.sell_trace = len(fig.data) - 1
+        self.markers = []  # (K 棒索引, 價格, 文字, 'buy'/'sell')
+        self.tx_count = 0
+
+        # 4. Volume
+        if self.show_volume:
+            add_series(go.Bar(marker_color='grey', name='Volume'), self.volume_row, y='Volume')
+
+        # 5. MACD
+        self.static_shapes = []
+        if self.macd_row > 0 and 'MACD_Line' in data.columns:
+            self.columns['MACD_Color'] = np.where(self.columns['MACD_Hist'] < 0, 'red', 'green')
+            add_series(go.Bar(name='MACD Hist'), self.macd_row, y='MACD_Hist', marker_color='MACD_Color')
+            add_series(go.Scatter(mode='lines', name='MACD Line', line=dict(color='blue', width=1)), self.macd_row, y='MACD_Line')
+            add_series(go.Scatter(mode='lines', name='MACD Signal', line=dict(color='orange', width=1)), self.macd_row, y='MACD_Signal')
+            self.static_shapes.append(_hline(0, self.macd_row, 'gray', 'dot'))
+
+        # 6. RSI
+        if self.rsi_row > 0 and 'RSI' in data.columns:
+            add_series(go.Scatter(line=dict(color='white'), name='RSI'), self.rsi_row, y='RSI')
+            self.static_shapes += [_hline(70, self.rsi_row, 'red', 'dash'), _hline(30, self.rsi_row, 'green', 'dash'),
+                                   _hline(50, self.rsi_row, 'gray', 'dot')]
+
+        self._layout(fig)
+        self.fig = fig
+        self.window = None
+        self.view_key = None
+        self.overlay_key = None
+        self.labels = []
+
+    def _layout(self, fig):
+        invisible_text = '\u200b'
+        yaxis_dict = {1: dict(side='right', type='log', fixedrange=False)}
+        if self.show_volume: yaxis_dict[self.volume_row] = dict(side='right')
+        if self.macd_row > 0: yaxis_dict[self.macd_row] = dict(side='right')
+        if self.rsi_row > 0: yaxis_dict[self.rsi_row] = dict(side='right', range=[0, 100])
+
+        fig.update_xaxes(type='category', showticklabels=False, rangeslider=dict(visible=False))
+
+        total_height = 500
+        if self.show_volume: total_height += 100
+        if self.macd_row > 0: total_height += 150
+        if self.rsi_row > 0: total_height += 150
+
+        layout_updates = {
+            "template": "plotly_dark",
+            "height": total_height,
+            "showlegend": False,
+            "dragmode": 'pan',
+            "hovermode": 'x unified',
+            "font": dict(family=LABEL_FONT),
+            "margin": dict(t=30, b=30, l=50, r=120),
+            "xaxis": dict(unifiedhovertitle=dict(text=invisible_text)),
+            "uirevision": "constant_value", # [保留] 鎖定圖表狀態，避免重置
+            "newshape": dict(line=dict(color='#00BFFF', width=2)) # [保留] 設定畫筆顏色為淺藍色
+        }
+        if self.show_volume:
+            layout_updates[f"xaxis{self.volume_row}"] = dict(unifiedhovertitle=dict(text=invisible_text))
+        for row, yaxis_config in yaxis_dict.items():
+            layout_updates['yaxis' if row == 1 else f'yaxis{row}'] = yaxis_config
+        fig.update_layout(**layout_updates)
+
+    def matches(self, core_data, selected_indicators, asset_type, interval=config.DEFAULT_INTERVAL) -> bool:
+        """同一份資料、相同週期與相同的指標設定才能沿用"""
+        return (self.core_data is core_data and self.asset_type == asset_type and self.interval == interval
+                and self.selected_indicators == list(selected_indicators or []))
+
+    def _y_range(self, shown, view_points):
+        """以可視範圍 (最後 view_points 個點) 的高低點計算主圖 Y 軸 (log)"""
+        if len(shown['Low']) == 0:
+            return [np.log10(1), np.log10(100)]
+        window = np.concatenate([shown[col][-view_points:].astype(np.float64) for col in self.range_columns])
+        price_min = np.nanmin(window)
+        price_max = np.nanmax(window)
+
+        padding = (price_max - price_min) * 0.1
         y_range_min = max(0.0001, price_min - padding)
         y_range_max = price_max + padding
         if y_range_max <= y_range_min: y_range_max = y_range_min * 1.1
-    else:
-        y_range_min, y_range_max = 1, 100
-
-    # 建立子圖
-    fig = make_subplots(
-        rows=num_subplots, cols=1, 
-        row_heights=row_heights, 
-        shared_xaxes=True, 
-        vertical_spacing=0.03,
-        subplot_titles=subplot_titles 
-    )
+        return [np.log10(y_range_min), np.log10(y_range_max)]
 
-    # 1. K線圖
-    fig.add_trace(go.Candlestick(
-        x=x_axis_data, 
-        open=data_to_display['Open'], high=data_to_display['High'],
-        low=data_to_display['Low'], close=data_to_display['Close'], 
-        name='K-Line'
-    ), row=k_line_row, col=1)
-
-    # 2. MA 線
-    if 'MA (移動平均線)' in selected_indicators:
-        for p_ma in config.MA_PERIODS:
-            if f'MA{p_ma}' in data_to_display.columns:
-                fig.add_trace(go.Scatter(
-                    x=x_axis_data, y=data_to_display[f'MA{p_ma}'], mode='lines', 
-                    name=f'MA{p_ma}', line=dict(color=config.MA_COLORS.get(p_ma, 'gray'), width=1)
-                ), row=k_line_row, col=1) 
-
-    # 3. BBands
-    if 'BBands (主圖)' in selected_indicators and 'BB_MA' in data_to_display.columns:
-        fig.add_trace(go.Scatter(x=x_axis_data, y=data_to_display['BB_UPPER'], mode='lines', 
-                                 name='BB Upper', line=dict(color='orange', width=1)), row=k_line_row, col=1)
-        fig.add_trace(go.Scatter(x=x_axis_data, y=data_to_display['BB_MA'], mode='lines', 
-                                 name='BB MA', line=dict(color='yellow', width=1)), row=k_line_row, col=1)
-        fig.add_trace(go.Scatter(x=x_axis_data, y=data_to_display['BB_LOWER'], mode='lines', 
-                                 name='BB Lower', line=dict(color='orange', width=1)), row=k_line_row, col=1)
-        
-    # --- 繪製輔助線與標籤 (持倉中) ---
-    for pos in positions:
-        is_spot = (pos['display_name'] == '現貨')
-        if is_spot: continue 
-
-        lines_to_plot = {'開倉': {'price': pos['cost'], 'color': 'yellow', 'dash': 'dot'}}
-        
-        is_long = pos['display_name'] in config.LONG_MODES
-        dir_str = '多' if is_long else '空'
-        
-        if pos.get('liquidation_price', 0) > 0:
-            lines_to_plot['強平'] = {'price': pos['liquidation_price'], 'color': 'red', 'dash': 'dash'}
-        if pos['sl'] > 0:
-            lines_to_plot['止損'] = {'price': pos['sl'], 'color': 'red', 'dash': 'dot'}
-        if pos['tp'] > 0:
-            lines_to_plot['止盈'] = {'price': pos['tp'], 'color': 'green', 'dash': 'dot'}
-
-        for name, info in lines_to_plot.items():
-            price = info['price']
-            if price <= 0: continue
-            
-            fig.add_hline(y=price, line_width=1, line_dash=info['dash'], line_color=info['color'], row=k_line_row, col=1)
-            
-            label_text = f"  {dir_str}{name} {price:,.2f}"
-            fig.add_trace(go.Scatter(
-                x=[last_visible_date], y=[price], text=[label_text], mode="text",
-                textposition="middle right", textfont=dict(color=info['color'], size=12, family="Roboto, Arial, sans-serif"),
-                cliponaxis=False, showlegend=False, hoverinfo='skip'
-            ), row=k_line_row, col=1)
-
-    # --- 繪製掛單 (Pending Orders) ---
-    if pending_orders:
-        for order in pending_orders:
-            price = order['price']
-            is_long = 'Buy' in order.get('trade_mode_key', '') or 'Long' in order.get('trade_mode_key', '')
-            color = 'cyan' if is_long else 'orange'
-            label_prefix = f"掛{order.get('order_type', 'Limit')}-買" if is_long else f"掛{order.get('order_type', 'Limit')}-賣"
-            
-            fig.add_hline(y=price, line_width=1, line_dash="dashdot", line_color=color, row=k_line_row, col=1)
-            
-            label_text = f"  ⏳ {label_prefix} {price:,.2f}"
-            fig.add_trace(go.Scatter(
-                x=[last_visible_date], y=[price], text=[label_text], mode="text",
-                textposition="middle right", textfont=dict(color=color, size=11, family="Roboto, Arial, sans-serif"),
-                cliponaxis=False, showlegend=False, hoverinfo='skip'
-            ), row=k_line_row, col=1)
-
-    # --- 繪製歷史交易箭頭 (Buy/Sell Markers) ---
-    if transactions:
-        buy_x, buy_y, buy_text = [], [], []
-        sell_x, sell_y, sell_text = [], [], []
-
-        for tx in transactions:
-            try:
-                open_d = pd.to_datetime(tx['open_date']).strftime('%Y-%m-%d')
-                close_d = pd.to_datetime(tx['close_date']).strftime('%Y-%m-%d')
-                
-                if tx['direction'] == 'Long': 
-                    buy_x.append(open_d); buy_y.append(tx['open_price']); buy_text.append(f"開多 @ {tx['open_price']:.2f}")
-                    sell_x.append(close_d); sell_y.append(tx['close_price']); sell_text.append(f"平多 ({tx['reason']})<br>損益: {tx['net_pnl']:.2f}")
-                else: 
-                    sell_x.append(open_d); sell_y.append(tx['open_price']); sell_text.append(f"開空 @ {tx['open_price']:.2f}")
-                    buy_x.append(close_d); buy_y.append(tx['close_price']); buy_text.append(f"平空 ({tx['reason']})<br>損益: {tx['net_pnl']:.2f}")
-            except:
-                continue
-
-        if buy_x:
-            fig.add_trace(go.Scatter(
-                x=buy_x, y=buy_y, mode='markers', name='Buy', text=buy_text, hoverinfo='text',
-                marker=dict(symbol='triangle-up', size=12, color='#00CC96', line=dict(width=1, color='white'))
-            ), row=k_line_row, col=1)
-        if sell_x:
-            fig.add_trace(go.Scatter(
-                x=sell_x, y=sell_y, mode='markers', name='Sell', text=sell_text, hoverinfo='text',
-                marker=dict(symbol='triangle-down', size=12, color='#EF553B', line=dict(width=1, color='white'))
-            ), row=k_line_row, col=1)
-
-    # 4. Volume
-    if show_volume:
-        fig.add_trace(go.Bar(x=x_axis_data, y=data_to_display['Volume'], marker_color='grey', name='Volume'), row=volume_row, col=1)
-
-    # 5. MACD
-    if macd_row > 0 and 'MACD_Line' in data_to_display.columns:
-        colors = ['red' if val < 0 else 'green' for val in data_to_display['MACD_Hist']]
-        fig.add_trace(go.Bar(x=x_axis_data, y=data_to_display['MACD_Hist'], marker_color=colors, name='MACD Hist'), row=macd_row, col=1)
-        fig.add_trace(go.Scatter(x=x_axis_data, y=data_to_display['MACD_Line'], mode='lines', 
-                                 name='MACD Line', line=dict(color='blue', width=1)), row=macd_row, col=1)
-        fig.add_trace(go.Scatter(x=x_axis_data, y=data_to_display['MACD_Signal'], mode='lines', 
-                                 name='MACD Signal', line=dict(color='orange', width=1)), row=macd_row, col=1)
-        fig.add_hline(y=0, line_dash="dot", line_color="gray", row=macd_row, col=1)
-    
-    # 6. RSI
-    if rsi_row > 0 and 'RSI' in data_to_display.columns:
-        fig.add_trace(go.Scatter(x=x_axis_data, y=data_to_display['RSI'], line=dict(color='white'), name='RSI'), row=rsi_row, col=1)
-        fig.add_hline(y=70, line_dash="dash", line_color="red", row=rsi_row, col=1)
-        fig.add_hline(y=30, line_dash="dash", line_color="green", row=rsi_row, col=1)
-        fig.add_hline(y=50, line_dash="dot", line_color="gray", row=rsi_row, col=1)
-
-    # 垂直線
-    if end_sim_index_on_settle:
-        try:
-            start_abs_idx = config.INITIAL_OBSERVATION_DAYS
-            end_abs_idx = end_sim_index_on_settle
-            if start_abs_idx < len(x_axis_data):
-                fig.add_vline(x=x_axis_data.iloc[start_abs_idx], line_dash="dot", line_color="green", row=k_line_row, col=1)
-            if end_abs_idx < len(x_axis_data):
-                fig.add_vline(x=x_axis_data.iloc[end_abs_idx], line_dash="dot", line_color="white", row=k_line_row, col=1)
-        except:
-            pass
-
-    initial_range = None
-    if end_sim_index_on_settle is not None:
-        initial_range = None 
-    else:
-        total_len = len(x_axis_data)
-        end_idx = total_len - 1
-        start_idx = max(0, end_idx - config.VIEW_DAYS)
-        initial_range = [start_idx - 0.5, end_idx + 0.5]
-
-    common_font = "Roboto, Arial, sans-serif"
-    invisible_text = '\u200b' 
-    
-    yaxis_dict = {
-        k_line_row: dict(side='right', type='log', range=[np.log10(y_range_min), np.log10(y_range_max)], fixedrange=False),
-    }
-    if show_volume:
-        yaxis_dict[volume_row] = dict(side='right')
-        
-    if macd_row > 0:
-        yaxis_dict[macd_row] = dict(side='right')
-    if rsi_row > 0:
-        yaxis_dict[rsi_row] = dict(side='right', range=[0, 100])
-
-    fig.update_xaxes(
-        type='category', showticklabels=False, range=initial_range, rangeslider=dict(visible=False) 
-    )
-    
-    total_height = 500 
-    if show_volume: total_height += 100
-    if macd_row > 0: total_height += 150
-    if rsi_row > 0: total_height += 150
-    
-    layout_updates = {
-        "template": "plotly_dark", 
-        "height": total_height, 
-        "showlegend": False, 
-        "dragmode": 'pan', 
-        "hovermode": 'x unified', 
-        "font": dict(family=common_font),
-        "margin": dict(t=30, b=30, l=50, r=120), 
-        "xaxis": dict(unifiedhovertitle=dict(text=invisible_text)),
-        "uirevision": "constant_value", # [保留] 鎖定圖表狀態，避免重置
-        "newshape": dict(line=dict(color='#00BFFF', width=2)) # [保留] 設定畫筆顏色為淺藍色
-    }
-    
-    if show_volume:
-        layout_updates[f"xaxis{volume_row}"] = dict(unifiedhovertitle=dict(text=invisible_text))
-
-    for row, yaxis_config in yaxis_dict.items():
-        if row == 1:
-            layout_updates['yaxis'] = yaxis_config
-        else:
-            layout_updates[f'yaxis{row}'] = yaxis_config
-            
-    fig.update_layout(**layout_updates)
-    
-    return fig
+    def _overlay_shapes(self, positions, pending_orders, end_sim_index_on_settle):
+        """持倉線、掛單線、結算垂直線，以及價位標籤 (x, y, 文字, 顏色, 字級)"""
+        shapes = list(self.static_shapes)
+        labels = []
+
+        # --- 繪製輔助線與標籤 (持倉中) ---
+        for pos in positions:
+            if not pos.is_margin: continue
+
+            lines_to_plot = {'開倉': {'price': pos.cost, 'color': 'yellow', 'dash': 'dot'}}
+
+            dir_str = '多' if pos.is_long else '空'
+
+            if pos.liquidation_price > 0:
+                lines_to_plot['強平'] = {'price': pos.liquidation_price, 'color': 'red', 'dash': 'dash'}
+            if pos.sl > 0:
+                lines_to_plot['止損'] = {'price': pos.sl, 'color': 'red', 'dash': 'dot'}
+            if pos.tp > 0:
+                lines_to_plot['止盈'] = {'price': pos.tp, 'color': 'green', 'dash': 'dot'}
+
+            for name, info in lines_to_plot.items():
+                price = info['price']
+                if price <= 0: continue
+                shapes.append(_hline(price, 1, info['color'], info['dash']))
+                labels.append((price, f"  {dir_str}{name} {price:,.2f}", info['color'], 12))
+
+        # --- 繪製掛單 (Pending Orders) ---
+        for order in pending_orders or []:
+            price = order.price
+            color = 'cyan' if order.is_long else 'orange'
+            label_prefix = f"掛{order.order_type}-買" if order.is_long else f"掛{order.order_type}-賣"
+            shapes.append(_hline(price, 1, color, 'dashdot'))
+            labels.append((price, f"  ⏳ {label_prefix} {price:,.2f}", color, 11))
+
+        # 垂直線
+        if end_sim_index_on_settle:
+            for index, color in ((config.INITIAL_OBSERVATION_DAYS, 'green'), (end_sim_index_on_settle, 'white')):
+                x = self._to_x(index)
+                if x is not None: shapes.append(_vline(x, color, 'dot'))
+        return shapes, labels
+
+    def _append_transactions(self, transactions):
+        """只處理上次更新之後新增的成交紀錄"""
+        if len(transactions) < self.tx_count:
+            self.markers = []
+            self.tx_count = 0
+
+        for tx in transactions[self.tx_count:]:
+            open_i = self.prices.index_of(tx.open_date)
+            close_i = self.prices.index_of(tx.close_date)
+            if open_i is None or close_i is None: continue
+
+            if tx.direction == 'Long':
+                self.markers.append((open_i, tx.open_price, f"開多 @ {tx.open_price:.2f}", 'buy'))
+                self.markers.append((close_i, tx.close_price, f"平多 ({tx.reason})<br>損益: {tx.net_pnl:.2f}", 'sell'))
+            else:
+                self.markers.append((open_i, tx.open_price, f"開空 @ {tx.open_price:.2f}", 'sell'))
+                self.markers.append((close_i, tx.close_price, f"平空 ({tx.reason})<br>損益: {tx.net_pnl:.2f}", 'buy'))
+        changed = len(transactions) != self.tx_count
+        self.tx_count = len(transactions)
+        return changed
+
+    def _window(self, n, history_bars, settled):
+        """
+        決定要送出的 K 棒範圍與降採樣分組：回傳 (起點, 每組 K 棒數)。
+        預設只送出可視範圍加上緩衝；範圍超過 CHART_MAX_POINTS 時以 OHLC 彙總降採樣，
+        分組對齊絕對索引，播放時既有的分組不會變動。
+        """
+        if history_bars is None:
+            history_bars = n if settled else config.VIEW_DAYS + config.CHART_BUFFER_DAYS
+        elif history_bars <= 0:
+            history_bars = n
+        start = max(0, n - history_bars)
+        bucket = max(1, -(-(n - start) // config.CHART_MAX_POINTS))
+        return start - start % bucket, bucket
+
+    def _to_x(self, index):
+        """K 棒索引 -> 目前顯示中的 x 標籤 (不在範圍內回傳 None)"""
+        start, bucket, n = self.window
+        if not (start <= index < n): return None
+        return self.dates[index - (index - start) % bucket]
 
-def render_equity_curve(equity_history):
-    """繪製總資產變動曲線"""
-    if not equity_history:
+    def update(self, current_idx, positions, pending_orders=None, transactions=None, end_sim_index_on_settle=None,
+               history_bars=None):
+        """
+        更新到 current_idx 並回傳 Figure。
+        history_bars 為要載入的歷史 K 棒數 (見 HISTORY_OPTIONS)；None 時只送出可視範圍加緩衝 (結算後為全部)。
+        """
+        fig = self.fig
+        n = current_idx + 1
+        settled = end_sim_index_on_settle is not None
+        start, bucket = self._window(n, history_bars, settled)
+        window_changed = (start, bucket, n) != self.window
+        self.window = (start, bucket, n)
+
+        overlay_key = (
+            tuple((p.id, p.display_name, p.cost, p.liquidation_price, p.sl, p.tp) for p in positions),
+            tuple((o.id, o.price, o.order_type, o.trade_mode_key) for o in pending_orders or []),
+            end_sim_index_on_settle, self.window if end_sim_index_on_settle else None
+        )
+        markers_changed = self._append_transactions(transactions or [])
+
+        with fig.batch_update():
+            view_key = (self.window, settled, history_bars)
+            if view_key != self.view_key:
+                starts = np.arange(0, n - start, bucket)
+                x_axis_data = self.dates[start:n][starts]
+                shown = {}
+                for trace_idx, columns in self.series:
+                    trace = fig.data[trace_idx]
+                    trace.x = x_axis_data
+                    for attr, col in columns.items():
+                        values = self.columns[col][start:n]
+                        if bucket > 1: values = bucket_reduce(values, starts, BUCKET_REDUCERS.get(col, 'last'))
+                        shown[col] = values
+                        if attr == 'marker_color': trace.marker.color = values
+                        else: trace[attr] = values
+
+                # 只顯示近期時預設停在最後 VIEW_DAYS 根，載入更長歷史或結算後則顯示全部
+                if settled or history_bars is not None:
+                    initial_range = None
+                    view_points = len(x_axis_data)
+                else:
+                    end_idx = len(x_axis_data) - 1
+                    start_idx = max(0, end_idx - config.VIEW_DAYS)
+                    initial_range = [start_idx - 0.5, end_idx + 0.5]
+                    view_points = config.VIEW_DAYS
+                fig.update_xaxes(range=initial_range)
+                fig.layout.yaxis.range = self._y_range(shown, view_points)
+                self.last_x = x_axis_data[-1] if len(x_axis_data) else None
+                self.view_key = view_key
+
+            if overlay_key != self.overlay_key:
+                shapes, labels = self._overlay_shapes(positions, pending_orders, end_sim_index_on_settle)
+                fig.layout.shapes = shapes
+                self.labels = labels
+                self.overlay_key = overlay_key
+            label_trace = fig.data[self.label_trace]
+            label_trace.x = [self.last_x] * len(self.labels)
+            label_trace.y = [label[0] for label in self.labels]
+            label_trace.text = [label[1] for label in self.labels]
+            label_trace.textfont = dict(color=[label[2] for label in self.labels],
+                                        size=[label[3] for label in self.labels], family=LABEL_FONT)
+
+            if markers_changed or window_changed:
+                for trace_idx, side in ((self.buy_trace, 'buy'), (self.sell_trace, 'sell')):
+                    points = [(self._to_x(i), y, text) for i, y, text, s in self.markers if s == side]
+                    points = [p for p in points if p[0] is not None]
+                    fig.data[trace_idx].update(x=[p[0] for p in points], y=[p[1] for p in points], text=[p[2] for p in points])
+        return fig
+
+    def playback_html(self, base_json, start_idx, frame_indices, refresh_rate, plotly_config=None, token=None):
+        """
+        自動播放用的 HTML：先畫出 start_idx 時的圖 (base_json)，瀏覽器再以 extendTraces 逐格追加新 K 棒，
+        最後一格換成目前 (update 後) 的完整圖表，伺服器每批只需計算一次。
+        圖表畫好 (開始播放) 時會把 token 通知上層頁面 (見 PLAYBACK_LISTENER_JS)，播放計時由此起算。
+        只支援預設 (近期) 範圍；載入較長歷史或結算後回傳 None (改用一般靜態圖表)。
+        """
+        start, bucket, n_final = self.window
+        if self.view_key is None or self.view_key[1] or self.view_key[2] is not None or bucket > 1 or not frame_indices:
+            return None
+        max_points = config.VIEW_DAYS + config.CHART_BUFFER_DAYS
+
+        # 相同欄位組合的序列才能合併成一次 extendTraces 呼叫
+        groups = {}
+        for trace_idx, columns in self.series:
+            groups.setdefault(tuple(columns.items()), []).append(trace_idx)
+
+        frames = []
+        prev_n = start_idx + 1
+        for index in frame_indices:
+            n = min(index + 1, len(self.dates))
+            if n <= prev_n: continue
+            new_x = self.dates[prev_n:n].tolist()
+            extends = []
+            for attrs, trace_ids in groups.items():
+                update = {'x': [new_x] * len(trace_ids)}
+                for attr, col in attrs:
+                    key = 'marker.color' if attr == 'marker_color' else attr
+                    update[key] = [self.columns[col][prev_n:n].tolist()] * len(trace_ids)
+                extends.append({'update': update, 'traces': trace_ids})
+
+            shown = {col: self.columns[col][:n] for col in self.range_columns}
+            length = min(n, max_points)
+            start_pos = max(0, length - 1 - config.VIEW_DAYS)
+            frames.append({
+                'extends': extends,
+                'label_x': [self.dates[n - 1]] * len(self.labels),
+                'layout': {'xaxis.range': [start_pos - 0.5, length - 0.5], 'yaxis.range': self._y_range(shown, config.VIEW_DAYS)},
+            })
+            prev_n = n
+
+        payload = {
+            'base': json.loads(base_json), 'final': json.loads(self.fig.to_json()), 'frames': frames,
+            'labelTrace': self.label_trace, 'maxPoints': max_points,
+            'delay': int(refresh_rate * 1000), 'config': plotly_config or {}, 'token': token,
+        }
+        # 先填入 payload 再填入 plotly.js：只替換第一個 (樣板中的) __PLOTLY_JS__
+        return PLAYBACK_TEMPLATE.replace('__PAYLOAD__', json.dumps(payload, cls=PlotlyJSONEncoder)) \
+                                .replace('__PLOTLY_JS__', plotly_js(), 1)
+
+@cache
+def plotly_js() -> str:
+    """plotly.js 原始碼 (隨 plotly 套件安裝，離線可用)"""
+    return get_plotlyjs()
+
+# 瀏覽器端逐格播放 (plotly.js 內嵌於頁面，不依賴 CDN)
+PLAYBACK_TEMPLATE = """
+<script>__PLOTLY_JS__</script>
+<div id="ksim-playback"></div>
+<script>
+const p = __PAYLOAD__;
+const gd = document.getElementById('ksim-playback');
+Plotly.newPlot(gd, p.base.data, p.base.layout, p.config).then(() => {
+    // iframe 與 Streamlit 頁面同源時直接留下記號 (監聽器可能晚於此刻才掛載)，另以 postMessage 通知
+    try { window.parent.ksimPlaybackLoaded = p.token; } catch (e) {}
+    window.parent.postMessage({ksimPlaybackLoaded: p.token}, '*');
+    let i = 0;
+    const timer = setInterval(() => {
+        if (i >= p.frames.length) {
+            clearInterval(timer);
+            Plotly.react(gd, p.final.data, p.final.layout, p.config);
+            return;
+        }
+        const f = p.frames[i++];
+        for (const e of f.extends) Plotly.extendTraces(gd, e.update, e.traces, p.maxPoints);
+        Plotly.restyle(gd, {x: [f.label_x]}, [p.labelTrace]);
+        Plotly.relayout(gd, f.layout);
+    }, p.delay);
+});
+</script>
+"""
+
+# 上層頁面的播放監聽器 (st.components.v2 元件，data 為本批的 token)：收到對應 iframe 的通知後觸發 loaded 事件
+PLAYBACK_LISTENER_JS = """
+export default function({ data, setTriggerValue }) {
+    let reported = false;
+    const report = () => {
+        if (reported || window.ksimPlaybackLoaded !== data) return;
+        reported = true;
+        setTriggerValue('loaded', data);
+    };
+    const onMessage = (event) => {
+        if (event.data && event.data.ksimPlaybackLoaded === data) {
+            window.ksimPlaybackLoaded = data;
+            report();
+        }
+    };
+    window.addEventListener('message', onMessage);
+    report();
+    return () => window.removeEventListener('message', onMessage);
+}
+"""
+
+def render_main_chart(ticker, core_data, current_idx, positions, end_sim_index_on_settle, saved_layout=None, pending_orders=None, selected_indicators=None, asset_type='Stock', transactions=None, indicators=None, chart=None, history_bars=None, prices=None, interval=config.DEFAULT_INTERVAL):
+    """
+    繪製主圖表，包括 K 線、成交量、技術指標等
+    indicators 為 LazyIndicators，只有被勾選的指標才會計算；
+    傳入上一次的 MainChart (chart) 且設定相同時會增量更新，回傳 (fig, chart)
+    history_bars 控制送往瀏覽器的歷史長度 (見 HISTORY_OPTIONS)；prices 為引擎的 PriceCache (共用日期字串)
+    interval 為目前的 K 棒週期 (主圖標題)
+    """
+    if chart is None or not chart.matches(core_data, selected_indicators, asset_type, interval):
+        chart = MainChart(ticker, core_data, selected_indicators, asset_type, indicators, prices, interval)
+    fig = chart.update(current_idx, positions, pending_orders, transactions, end_sim_index_on_settle, history_bars)
+    return fig, chart
+
+def render_equity_curve(ledger):
+    """繪製總資產變動曲線 (ledger 為引擎的 EquityLedger，高低點直接取自帳本的統計量)"""
+    if not len(ledger):
         return None
-        
-    df = pd.DataFrame(equity_history)
+
+    equity = ledger.equity
+    labels = ledger.date_labels
+    keep = np.arange(len(equity))
+    if len(equity) > config.CHART_MAX_POINTS:
+        # LTTB 降採樣，並保留最高/最低點
+        keep = lttb_indices(keep, equity, config.CHART_MAX_POINTS)
+        keep = np.union1d(keep, [ledger.peak_index, ledger.trough_index])
+
     fig = go.Figure()
     fig.add_trace(go.Scatter(
-        x=df['date'], y=df['equity'], mode='lines', name='總資產',
+        x=labels[keep], y=equity[keep], mode='lines', name='總資產',
         line=dict(color='#00CC96', width=2), fill='tozeroy', fillcolor='rgba(0, 204, 150, 0.1)'
     ))
     initial_cap = config.INITIAL_CAPITAL
     fig.add_hline(y=initial_cap, line_dash="dash", line_color="gray", annotation_text="初始本金")
     
-    if len(df) > 1:
-        max_idx = df['equity'].idxmax()
-        min_idx = df['equity'].idxmin()
-        max_equity = df['equity'].max()
-        min_equity = df['equity'].min()
-        fig.add_annotation(x=df.iloc[max_idx]['date'], y=max_equity, text=f"Max: ${max_equity:,.0f}", showarrow=True, arrowhead=1, yshift=10)
+    if len(equity) > 1:
+        max_equity = ledger.peak
+        min_equity = ledger.trough
+        fig.add_annotation(x=labels[ledger.peak_index], y=max_equity, text=f"Max: ${max_equity:,.0f}", showarrow=True, arrowhead=1, yshift=10)
         if min_equity < initial_cap:
-            fig.add_annotation(x=df.iloc[min_idx]['date'], y=min_equity, text=f"Min: ${min_equity:,.0f}", showarrow=True, arrowhead=1, yshift=-10, ay=30)
+            fig.add_annotation(x=labels[ledger.trough_index], y=min_equity, text=f"Min: ${min_equity:,.0f}", showarrow=True, arrowhead=1, yshift=-10, ay=30)
 
     fig.update_layout(
         title=" ",
@@ -1,12 +1,39 @@
 # config.py
 # 用於存放全域常數、交易規則與設定
 
+import os
+
 # --- 回測參數 (Backtest Parameters) ---
 VIEW_DAYS = 100                # 圖表可視範圍 (天)
+CHART_BUFFER_DAYS = 100        # 可視範圍之外額外送出的歷史 K 棒 (可往回拖曳)
+CHART_MAX_POINTS = 400         # 圖表單一序列最多送出的點數，超過時降採樣
+AUTOPLAY_BUFFER_FRAMES = 20    # 自動播放時每批預先計算並交給瀏覽器播放的畫格數
+AUTOPLAY_LOAD_TIMEOUT = 15     # 等待播放 iframe 載入完成的上限 (秒)，逾時仍開始計時
 INITIAL_OBSERVATION_DAYS = 250 # 初始觀察期 (天)
 
 MIN_SIMULATION_DAYS = 720      # 最少需要多少天數據才能跑模擬
 MA_PERIODS = [5, 10, 20, 60, 120]  # 移動平均線週期
+INDICATOR_CACHE_SIZE = 256     # 指標快取 (LRU) 最多保留的結果與中間結果數量
+
+# --- 資料來源與本地資料庫 (Data Source / Local Data Store) ---
+# 'yfinance'、'yahoo[:<網址>]'、'synthetic[:seed]' 或 'local:<目錄>'，可用環境變數 KSIM_DATA_SOURCE 覆寫 (離線環境)
+DATA_SOURCE = os.environ.get("KSIM_DATA_SOURCE", "yfinance")
+DATA_STORE_DIR = "data_store"  # 歷史 K 線 Feather 檔存放目錄
+YAHOO_CHART_URL = "https://query1.finance.yahoo.com"  # 'yahoo' 來源的 Chart API 位址 (測試時可指向本地伺服器)
+HTTP_TIMEOUT = 30.0            # 單次 HTTP 請求逾時 (秒)
+
+# --- 批次預載 (Bulk Prefetch) ---
+PREFETCH_WORKERS = 16          # 同時下載的執行緒數
+PREFETCH_RATE = 8.0            # 每秒最多發出的請求數 (所有執行緒合計)
+PREFETCH_RETRIES = 4           # 暫時性錯誤 (逾時、429、5xx) 的重試次數
+PREFETCH_BACKOFF = 0.5         # 第一次重試前的等待秒數，之後每次加倍 (含隨機抖動)
+
+# --- K 棒週期 (Intervals) ---
+# 週期 -> 分鐘數。日內週期下，觀察期、可視範圍等「天數」設定一律視為 K 棒數
+INTERVALS = {'1m': 1, '5m': 5, '15m': 15, '30m': 30, '1h': 60, '1d': 1440}
+DEFAULT_INTERVAL = '1d'
+# 資料源可回溯的日內歷史天數 (Yahoo Finance 的限制)；同樣回溯天數內只保存最細的一份序列，較粗的週期由其重新取樣
+INTRADAY_HISTORY_DAYS = {'1m': 7, '5m': 60, '15m': 60, '30m': 60, '1h': 730}
 
 # --- 預設值 (Defaults) ---
 DEFAULT_TICKER = "TSLA"      # 預設載入的股票代號
@@ -34,7 +61,9 @@ ASSET_CONFIGS = {
         'mode_margin_long': '融資',   
         'mode_margin_short': '融券',  
         'default_qty': 1000.0, 
-        'min_qty': 1.0
+        'min_qty': 1.0,
+        'periods_per_year': 252,  # 年化用的每年交易日數
+        'session_minutes': 390    # 每個交易日的交易分鐘數 (日內 K 棒的年化)
     }, 
     'Forex': {
         'unit': '點', 
@@ -42,7 +71,9 @@ ASSET_CONFIGS = {
         'mode_margin_long': '做多',   
         'mode_margin_short': '做空',  
         'default_qty': 100.0, 
-        'min_qty': 100.0
+        'min_qty': 100.0,
+        'periods_per_year': 260,
+        'session_minutes': 1440
     }, 
     'Crypto': {
         'unit': '顆', 
@@ -50,7 +81,9 @@ ASSET_CONFIGS = {
         'mode_margin_long': '合約做多', 
         'mode_margin_short': '合約做空', 
         'default_qty': 1.0, 
-        'min_qty': 0.001
+        'min_qty': 0.001,
+        'periods_per_year': 365,
+        'session_minutes': 1440
     }
 }
 
@@ -0,0 +1,261 @@
+# data_sources.py
+# 歷史 K 線資料來源：Yahoo Finance (yfinance 或直接呼叫 Chart API)、本地 CSV/Parquet/Feather 目錄、可重現的合成行情 (GBM + 跳躍擴散)
+
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from datetime import timedelta, timezone
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import config
+from data_store import OHLCVStore, OHLCV_FIELDS, safe_ticker_name
+from resample import base_interval, interval_minutes, is_intraday, resample_ohlcv
+
+class DataSource:
+    """
+    資料來源介面。fetch(ticker, start, interval) 回傳 Date/Open/High/Low/Close/Volume 欄位的 DataFrame，
+    start 為 None 代表全部歷史，interval 為 config.INTERVALS 的週期 (日內 K 棒的 Date 為交易所當地時間)；查無資料回傳 None。
+    is_remote 為 True 的來源會經過本地資料庫 (OHLCVStore) 做增量快取。
+    """
+    is_remote = False
+
+    def fetch(self, ticker: str, start: pd.Timestamp | None = None,
+              interval: str = config.DEFAULT_INTERVAL) -> pd.DataFrame | None:
+        raise NotImplementedError
+
+    def __call__(self, ticker: str, start: pd.Timestamp | None = None,
+                 interval: str = config.DEFAULT_INTERVAL) -> pd.DataFrame | None:
+        return self.fetch(ticker, start, interval)
+
+class YFinanceSource(DataSource):
+    """Yahoo Finance 線上資料"""
+    is_remote = True
+
+    def fetch(self, ticker, start=None, interval=config.DEFAULT_INTERVAL):
+        import yfinance as yf
+
+        # 日內資料只能回溯有限天數
+        if start is None and is_intraday(interval):
+            data = yf.download(ticker.upper(), period=f"{config.INTRADAY_HISTORY_DAYS[interval]}d", interval=interval, progress=False)
+        elif start is None:
+            data = yf.download(ticker.upper(), period='max', interval=interval, progress=False)
+        else:
+            data = yf.download(ticker.upper(), start=start.strftime('%Y-%m-%d'), interval=interval, progress=False)
+
+        if data is None or data.empty:
+            return None
+
+        if isinstance(data.columns, pd.MultiIndex):
+            data.columns = data.columns.droplevel(1)
+
+        required_cols = ['Open', 'High', 'Low', 'Close', 'Volume']
+        if not all(col in data.columns for col in required_cols):
+            raise ValueError(f"數據格式錯誤：缺少必要欄位。可用欄位: {data.columns.tolist()}")
+
+        data = data[required_cols].reset_index()
+        data.columns = OHLCV_FIELDS
+        data['Date'] = pd.to_datetime(data['Date'])
+        if data['Date'].dt.tz is not None: data['Date'] = data['Date'].dt.tz_localize(None)  # 日內資料轉為交易所當地時間
+        return data
+
+class YahooChartSource(DataSource):
+    """
+    直接以 HTTP 呼叫 Yahoo Finance Chart API (v8) 的 K 線資料，只用標準函式庫，可在多執行緒中並行使用。
+    價格依 adjclose 調整 (與 yfinance 的 auto_adjust 相同)；base_url 可指向本地的替身伺服器做測試。
+    代碼不存在 (404) 時回傳 None，其餘 HTTP / 網路錯誤直接拋出，由呼叫端決定是否重試。
+    """
+    is_remote = True
+
+    def __init__(self, base_url: str = config.YAHOO_CHART_URL, timeout: float = config.HTTP_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def url(self, ticker: str, start: pd.Timestamp | None = None, interval: str = config.DEFAULT_INTERVAL) -> str:
+        if start is not None: params = {'period1': int(pd.Timestamp(start).timestamp()), 'period2': int(time.time())}
+        elif is_intraday(interval): params = {'range': f"{config.INTRADAY_HISTORY_DAYS[interval]}d"}
+        else: params = {'range': 'max'}
+        params.update(interval=interval, events='history')
+        return f"{self.base_url}/v8/finance/chart/{urllib.parse.quote(ticker.upper())}?{urllib.parse.urlencode(params)}"
+
+    def fetch(self, ticker, start=None, interval=config.DEFAULT_INTERVAL):
+        request = urllib.request.Request(self.url(ticker, start, interval), headers={'User-Agent': 'Mozilla/5.0'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.load(response)
+        except urllib.error.HTTPError as e:
+            if e.code == 404: return None
+            raise
+        return parse_chart_payload(payload, intraday=is_intraday(interval))
+
+def parse_chart_payload(payload: dict, intraday: bool = False) -> pd.DataFrame | None:
+    """
+    將 Chart API 的 JSON 轉為 Date/OHLCV DataFrame (交易所當地時間，日線只取日期)；沒有資料時回傳 None。
+    時間以 meta.exchangeTimezoneName 換算 (跨越夏令時間仍正確)，缺少時才退回固定的 meta.gmtoffset。
+    """
+    results = (payload.get('chart') or {}).get('result') or []
+    if not results or not results[0].get('timestamp'):
+        return None
+    result = results[0]
+    meta = result.get('meta') or {}
+    tz = meta.get('exchangeTimezoneName') or timezone(timedelta(seconds=meta.get('gmtoffset') or 0))
+    quote = result['indicators']['quote'][0]
+
+    dates = pd.to_datetime(np.asarray(result['timestamp'], dtype=np.int64), unit='s')
+    dates = dates.tz_localize('UTC').tz_convert(tz).tz_localize(None)
+    data = pd.DataFrame({
+        'Date': dates if intraday else dates.normalize(),
+        **{col: np.array(quote.get(col.lower()) or [], dtype=np.float64) for col in OHLCV_FIELDS[1:]},
+    })
+    adjclose = (result['indicators'].get('adjclose') or [{}])[0].get('adjclose')
+    if adjclose is not None:
+        ratio = np.array(adjclose, dtype=np.float64) / data['Close'].to_numpy()
+        for col in ('Open', 'High', 'Low', 'Close'):
+            data[col] = data[col] * ratio
+
+    data['Volume'] = data['Volume'].fillna(0.0)
+    data = data.dropna(subset=['Open', 'High', 'Low', 'Close'])
+    data = data.drop_duplicates('Date', keep='last').sort_values('Date').reset_index(drop=True)
+    return data if not data.empty else None
+
+class LocalFileSource(DataSource):
+    """
+    本地目錄，每個代碼一個檔案：<代碼>.parquet / .feather / .csv，日內週期為 <代碼>_<週期>.csv (例如 TSLA_5m.csv)
+    (代碼中的特殊字元同 OHLCVStore 轉為底線，例如 JPY=X -> JPY_X.csv)。
+    欄位名稱不分大小寫，缺少 Volume 時補 0 (匯率)。
+    """
+    EXTENSIONS = ('.parquet', '.feather', '.csv')
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def find_file(self, ticker: str, interval: str = config.DEFAULT_INTERVAL) -> Path | None:
+        suffix = f"_{interval}" if interval != config.DEFAULT_INTERVAL else ''
+        for name in dict.fromkeys([ticker, ticker.upper(), safe_ticker_name(ticker)]):
+            for ext in self.EXTENSIONS:
+                path = self.root / f"{name}{suffix}{ext}"
+                if path.exists():
+                    return path
+        return None
+
+    def fetch(self, ticker, start=None, interval=config.DEFAULT_INTERVAL):
+        path = self.find_file(ticker, interval)
+        if path is None:
+            return None
+
+        if path.suffix == '.parquet': data = pd.read_parquet(path)
+        elif path.suffix == '.feather': data = pd.read_feather(path)
+        else: data = pd.read_csv(path)
+
+        rename = {col: col.strip().title() for col in data.columns}
+        data = data.rename(columns=rename)
+        if 'Date' not in data.columns and 'Datetime' in data.columns:
+            data = data.rename(columns={'Datetime': 'Date'})
+        if 'Volume' not in data.columns:
+            data['Volume'] = 0.0
+
+        data = data[OHLCV_FIELDS].copy()
+        data['Date'] = pd.to_datetime(data['Date'])
+        data = data.sort_values('Date').reset_index(drop=True)
+        if start is not None:
+            data = data[data['Date'] >= start].reset_index(drop=True)
+        return data if not data.empty else None
+
+class SyntheticSource(DataSource):
+    """
+    合成行情：幾何布朗運動疊加 Merton 跳躍擴散。
+    同一組 (seed, ticker, interval) 永遠產生相同的資料，適合離線的批次回測與效能基準測試。
+    日內週期只在平日 09:30 ~ 16:00 產生 K 棒 (模擬美股交易時段)，波動依 K 棒長度縮放。
+    """
+    SESSION_OPEN_MINUTES = 570  # 09:30
+
+    def __init__(self, seed: int = 0, n_bars: int = 3000, start_date: str = '2000-01-03',
+                 s0: float = 100.0, mu: float = 0.12, sigma: float = 0.35,
+                 jump_intensity: float = 3.0, jump_mean: float = -0.01, jump_std: float = 0.06,
+                 freq: str = 'B'):
+        self.seed = seed
+        self.n_bars = n_bars
+        self.start_date = start_date
+        self.s0 = s0
+        self.mu = mu
+        self.sigma = sigma
+        self.jump_intensity = jump_intensity  # 每年平均跳躍次數
+        self.jump_mean = jump_mean
+        self.jump_std = jump_std
+        self.freq = freq
+
+    def _dates(self, interval: str) -> pd.DatetimeIndex:
+        n = self.n_bars
+        if not is_intraday(interval):
+            return pd.date_range(self.start_date, periods=n, freq=self.freq)
+        minutes = interval_minutes(interval)
+        per_day = config.ASSET_CONFIGS['Stock']['session_minutes'] // minutes
+        days = pd.bdate_range(self.start_date, periods=-(-n // per_day)).to_numpy(dtype='datetime64[ns]')
+        offsets = (self.SESSION_OPEN_MINUTES + np.arange(per_day) * minutes) * np.timedelta64(1, 'm')
+        return pd.DatetimeIndex((days[:, None] + offsets).ravel()[:n])
+
+    def fetch(self, ticker, start=None, interval=config.DEFAULT_INTERVAL):
+        seed = [self.seed, zlib.crc32(ticker.upper().encode())]
+        if is_intraday(interval): seed.append(interval_minutes(interval))
+        rng = np.random.default_rng(seed)
+        n = self.n_bars
+        if is_intraday(interval): dt = interval_minutes(interval) / (252 * config.ASSET_CONFIGS['Stock']['session_minutes'])
+        else: dt = 1.0 / 252
+        vol = self.sigma * np.sqrt(dt)
+
+        # 對數報酬 = 漂移 + 擴散 + 跳躍
+        log_ret = (self.mu - 0.5 * self.sigma ** 2) * dt + vol * rng.standard_normal(n)
+        n_jumps = rng.poisson(self.jump_intensity * dt, n)
+        log_ret += n_jumps * self.jump_mean + np.sqrt(n_jumps) * self.jump_std * rng.standard_normal(n)
+
+        close = self.s0 * np.exp(np.cumsum(log_ret))
+        prev_close = np.r_[self.s0, close[:-1]]
+        open_ = prev_close * np.exp(0.2 * vol * rng.standard_normal(n))
+        high = np.maximum(open_, close) * np.exp(np.abs(0.5 * vol * rng.standard_normal(n)))
+        low = np.minimum(open_, close) * np.exp(-np.abs(0.5 * vol * rng.standard_normal(n)))
+        volume = np.round(rng.lognormal(13.0, 0.5, n))
+
+        data = pd.DataFrame({
+            'Date': self._dates(interval),
+            'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume
+        })
+        if start is not None:
+            data = data[data['Date'] >= start].reset_index(drop=True)
+        return data
+
+def get_data_source(spec: str = config.DATA_SOURCE) -> DataSource:
+    """
+    依設定字串建立資料來源：
+    'yfinance'、'yahoo' / 'yahoo:<網址>'、'synthetic' / 'synthetic:<seed>'、'local:<目錄>'
+    """
+    kind, _, arg = spec.partition(':')
+    kind = kind.strip().lower()
+    if kind == 'yfinance':
+        return YFinanceSource()
+    if kind == 'yahoo':
+        return YahooChartSource(arg or config.YAHOO_CHART_URL)
+    if kind == 'synthetic':
+        return SyntheticSource(seed=int(arg) if arg else 0)
+    if kind == 'local':
+        return LocalFileSource(arg or '.')
+    raise ValueError(f"未知的資料來源: {spec}")
+
+def load_ohlcv(ticker: str, source: DataSource | None = None,
+               interval: str = config.DEFAULT_INTERVAL) -> pd.DataFrame | None:
+    """
+    讀取歷史 K 線；遠端來源經由本地資料庫增量更新，本地/合成來源直接讀取。
+    實際只下載並保存 base_interval(interval) 的基礎序列 (例如 15m 取 5m)，再由 resample_ohlcv 彙總成 interval。
+    """
+    source = source if source is not None else get_data_source()
+    ticker = ticker.upper()
+    base = base_interval(interval)
+    if source.is_remote:
+        data = OHLCVStore().refresh(ticker, lambda t, start: source.fetch(t, start, base), base)
+    else:
+        data = source.fetch(ticker, None, base)
+    if data is not None and base != interval:
+        data = resample_ohlcv(data, interval)
+    return data
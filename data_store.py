@@ -0,0 +1,114 @@
+# data_store.py
+# 本地 OHLCV 資料庫：以 Feather (Arrow IPC) 檔案依代碼保存歷史 K 線，支援增量更新
+
+import os
+import re
+from pathlib import Path
+from typing import Callable
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import config
+
+OHLCV_FIELDS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+# 重新下載的重疊 K 棒與本地紀錄差異超過此比例時，視為歷史價格已被調整 (分割/除息)，改為全量重抓
+ADJUSTMENT_TOLERANCE = 1e-4
+
+class OHLCVStore:
+    """以代碼 (與週期) 為鍵的本地 K 線資料庫，每個代碼一個未壓縮的 Feather 檔 (讀取不需解壓縮)，日內週期另存 <代碼>@<週期>.feather"""
+
+    def __init__(self, root: str | os.PathLike = config.DATA_STORE_DIR):
+        self.root = Path(root)
+
+    def path(self, ticker: str, interval: str = config.DEFAULT_INTERVAL) -> Path:
+        """代碼對應的檔案路徑"""
+        suffix = f"@{interval}" if interval != config.DEFAULT_INTERVAL else ''
+        return self.root / f"{safe_ticker_name(ticker)}{suffix}.feather"
+
+    def load(self, ticker: str, interval: str = config.DEFAULT_INTERVAL) -> pd.DataFrame | None:
+        """
+        讀取已保存的歷史資料，不存在時回傳 None。
+        資料會複製到記憶體：refresh 會在讀取後以 os.replace 覆寫同一個檔案，保持映射會讓 Windows 上的替換失敗。
+        """
+        path = self.path(ticker, interval)
+        if not path.exists():
+            return None
+        return feather.read_feather(path)
+
+    def save(self, ticker: str, data: pd.DataFrame, interval: str = config.DEFAULT_INTERVAL):
+        """覆寫保存 (先寫暫存檔再替換，避免中斷時留下損毀檔案)"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.path(ticker, interval)
+        tmp_path = path.with_suffix('.tmp')
+        table = pa.Table.from_pandas(data[OHLCV_FIELDS].reset_index(drop=True), preserve_index=False)
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+
+    def refresh(self, ticker: str, fetch: Callable[[str, pd.Timestamp | None], pd.DataFrame | None],
+                interval: str = config.DEFAULT_INTERVAL) -> pd.DataFrame | None:
+        """
+        增量更新並回傳完整歷史。
+        fetch(ticker, start) 需回傳 interval 週期、Date/OHLCV 欄位的 DataFrame，start 為 None 代表全量下載。
+        只抓取倒數第二根已保存 K 棒 (含) 之後的資料並合併：最後一根可能是盤中未完成的 K 棒，
+        倒數第二根則用來檢查歷史價格是否被調整。下載失敗時沿用本地資料。
+        """
+        stored = self.load(ticker, interval)
+        if stored is None or len(stored) < 2:
+            fresh = fetch(ticker, None)
+            if fresh is None or fresh.empty:
+                return stored
+            fresh = _normalize(fresh)
+            self.save(ticker, fresh, interval)
+            return fresh
+
+        since = pd.Timestamp(stored['Date'].iloc[-2])
+        try:
+            new_bars = fetch(ticker, since)
+        except Exception:
+            new_bars = None
+        if new_bars is None or new_bars.empty:
+            return stored
+
+        new_bars = _normalize(new_bars)
+        if _history_adjusted(stored, new_bars):
+            fresh = fetch(ticker, None)
+            if fresh is None or fresh.empty:
+                return stored
+            fresh = _normalize(fresh)
+            self.save(ticker, fresh, interval)
+            return fresh
+
+        merged = merge_bars(stored, new_bars)
+        if len(merged) != len(stored) or not merged.iloc[-1].equals(stored.iloc[-1]):
+            self.save(ticker, merged, interval)
+        return merged
+
+# --- 輔助函式 ---
+
+def safe_ticker_name(ticker: str) -> str:
+    """代碼轉為檔名 (特殊字元如 '=' '^' 轉為底線)"""
+    return re.sub(r'[^A-Za-z0-9._-]', '_', ticker.upper())
+
+def _normalize(data: pd.DataFrame) -> pd.DataFrame:
+    data = data[OHLCV_FIELDS].copy()
+    data['Date'] = pd.to_datetime(data['Date'])
+    for col in OHLCV_FIELDS[1:]:
+        data[col] = data[col].astype('float64')
+    return data.sort_values('Date').reset_index(drop=True)
+
+def merge_bars(stored: pd.DataFrame, new_bars: pd.DataFrame) -> pd.DataFrame:
+    """合併新舊 K 棒，同一日期以新資料為準 (最後一根可能是盤中未完成的 K 棒)"""
+    merged = pd.concat([stored, new_bars], ignore_index=True)
+    merged = merged.drop_duplicates(subset='Date', keep='last')
+    return merged.sort_values('Date').reset_index(drop=True)
+
+def _history_adjusted(stored: pd.DataFrame, new_bars: pd.DataFrame) -> bool:
+    """比對重疊 K 棒的收盤價，判斷資料源是否重新調整過歷史價格"""
+    overlap = stored[['Date', 'Close']].merge(new_bars[['Date', 'Close']], on='Date', suffixes=('_old', '_new'))
+    if overlap.empty:
+        return False
+    first = overlap.iloc[0]
+    if first['Close_old'] == 0:
+        return False
+    return abs(first['Close_new'] / first['Close_old'] - 1.0) > ADJUSTMENT_TOLERANCE
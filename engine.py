@@ -0,0 +1,843 @@
+# engine.py
+# 無介面 (Headless) 模擬引擎：保證金、強平、手續費與掛單規則的純 Python 實作
+# 不依賴 Streamlit，可直接於批次回測或子行程中使用
+
+import bisect
+import uuid
+from collections import Counter
+import numpy as np
+import pandas as pd
+import config
+from price_cache import PriceCache, build_price_cache
+from records import Position, PendingOrder, TradeRecord
+from equity_ledger import EquityLedger
+from analytics import analyze_engine
+from intrabar import IntrabarPaths, first_touch
+
+# --- 輔助函式：核心損益計算 ---
+
+def calculate_pnl_value(direction, qty, open_avg, current_price):
+    """統一損益 (PnL) 計算邏輯"""
+    price_diff = 0.0
+    if direction == 'Long':
+        price_diff = current_price - open_avg
+    else: # Short
+        price_diff = open_avg - current_price
+
+    return price_diff * qty
+
+def get_display_name(asset_type, trade_mode_key):
+    """取得交易模式在該資產類型下的顯示名稱"""
+    asset_conf = config.ASSET_CONFIGS[asset_type]
+    if trade_mode_key == 'Spot_Buy': return asset_conf['mode_spot']
+    if trade_mode_key == 'Margin_Long': return asset_conf['mode_margin_long']
+    if trade_mode_key == 'Margin_Short': return asset_conf['mode_margin_short']
+    return ""
+
+# --- 觸發價位索引 ---
+
+def order_trigger_levels(order):
+    """掛單的觸發價位 [(是否為上緣, 價位)]：上緣在 High >= 價位時觸發，下緣在 Low <= 價位時觸發"""
+    is_upper = (not order.is_long) if order.order_type == 'Limit' else order.is_long
+    return [(is_upper, float(order.price))]
+
+def position_trigger_levels(pos):
+    """持倉的強平、止損、止盈觸發價位 [(是否為上緣, 價位)]"""
+    levels = []
+    if pos.is_margin and pos.liquidation_price > 0:
+        levels.append((not pos.is_long, float(pos.liquidation_price)))
+    if pos.sl > 0: levels.append((not pos.is_long, float(pos.sl)))
+    if pos.tp > 0: levels.append((pos.is_long, float(pos.tp)))
+    return levels
+
+class TriggerIndex:
+    """
+    依價位排序的觸發索引。每根 K 棒以二分搜尋取出 High/Low 範圍內可能觸發的項目，
+    不必逐一掃描所有掛單與持倉；回傳順序與加入順序相同 (維持原本的成交先後)。
+    """
+
+    def __init__(self):
+        self.upper_prices, self.upper_keys = [], []  # High >= 價位時觸發，由低到高
+        self.lower_prices, self.lower_keys = [], []  # Low <= 價位時觸發，由低到高
+        self._levels = {}
+        self._seq = {}
+        self._next_seq = 0
+
+    def __len__(self):
+        return len(self._seq)
+
+    def set(self, key, levels):
+        """設定 (或更新) key 的觸發價位，保留原本的加入順序"""
+        self._remove_levels(key)
+        if key not in self._seq:
+            self._seq[key] = self._next_seq
+            self._next_seq += 1
+        self._levels[key] = levels
+        for is_upper, price in levels:
+            prices, keys = (self.upper_prices, self.upper_keys) if is_upper else (self.lower_prices, self.lower_keys)
+            i = bisect.bisect_right(prices, price)
+            prices.insert(i, price)
+            keys.insert(i, key)
+
+    def discard(self, key):
+        self._remove_levels(key)
+        self._seq.pop(key, None)
+
+    def clear(self):
+        self.upper_prices, self.upper_keys = [], []
+        self.lower_prices, self.lower_keys = [], []
+        self._levels.clear()
+        self._seq.clear()
+
+    def _remove_levels(self, key):
+        for is_upper, price in self._levels.pop(key, ()):
+            prices, keys = (self.upper_prices, self.upper_keys) if is_upper else (self.lower_prices, self.lower_keys)
+            i = bisect.bisect_left(prices, price)
+            while keys[i] != key: i += 1
+            del prices[i], keys[i]
+
+    def hits(self, high, low):
+        """High/Low 範圍內可能觸發的 key (依加入順序)"""
+        found = set(self.upper_keys[:bisect.bisect_right(self.upper_prices, high)])
+        found.update(self.lower_keys[bisect.bisect_left(self.lower_prices, low):])
+        return sorted(found, key=self._seq.__getitem__)
+
+    def bounds(self):
+        """回傳 (upper, lower)：High >= upper 或 Low <= lower 時才可能觸發"""
+        upper = self.upper_prices[0] if self.upper_prices else np.inf
+        lower = self.lower_prices[-1] if self.lower_prices else -np.inf
+        return upper, lower
+
+# --- 投資組合 (資金與部位) ---
+
+class Portfolio:
+    """
+    資金、持倉、掛單與成交紀錄。
+    持倉、掛單與成交紀錄為 records.py 的 Position / PendingOrder / TradeRecord。
+    持倉與掛單以 ID 為鍵存放 (依加入順序)，並維護各 (類型, 方向) 的數量，查詢、刪除與互斥檢查皆為 O(1)；
+    positions / pending_orders 回傳依加入順序的列表副本。
+    掛單與持倉的觸發價位另以 TriggerIndex 索引；直接修改持倉的 sl/tp 後需呼叫 update_position_levels。
+    淨部位數量、成本與圈存資金等彙總值在開倉、平倉、掛單與撤單時增量維護，
+    總資產 = 現金 + 圈存 + 價格 x 淨數量 + 常數項，估值與持倉筆數無關；部分平倉請使用 reduce_position。
+    """
+
+    def __init__(self, initial_capital=config.INITIAL_CAPITAL):
+        self.initial_capital = initial_capital
+        self.balance = initial_capital
+        self.position_map = {}
+        self.order_map = {}
+        self.position_counts = Counter()  # (type, direction) -> 持倉數
+        self.order_counts = Counter()     # (type, direction) -> 掛單數
+        self.transactions = []
+        self.order_triggers = TriggerIndex()
+        self.position_triggers = TriggerIndex()
+        self._reset_position_totals()
+        self.locked_funds = 0.0
+
+    def _reset_position_totals(self):
+        self.net_qty = 0.0       # 價格敏感度：現貨與多單為正，空單為負
+        self.signed_cost = 0.0   # 方向 x 成本 x 數量 (未實現損益 = 價格 x net_qty - signed_cost)
+        self.value_offset = 0.0  # 部位淨值中與價格無關的部分 (保證金與成本)
+        self.spot_qty = 0.0
+        self.spot_cost = 0.0
+
+    def _apply_position(self, pos, sign):
+        """將持倉對彙總值的貢獻加入 (sign=1) 或扣除 (sign=-1)"""
+        qty = pos.qty * sign
+        cost_qty = pos.cost * qty
+        if not pos.is_margin:
+            self.net_qty += qty
+            self.signed_cost += cost_qty
+            self.spot_qty += qty
+            self.spot_cost += cost_qty
+        elif pos.is_long:
+            self.net_qty += qty
+            self.signed_cost += cost_qty
+            self.value_offset += cost_qty / pos.leverage - cost_qty
+        else:
+            self.net_qty -= qty
+            self.signed_cost -= cost_qty
+            self.value_offset += cost_qty / pos.leverage + cost_qty
+
+    @property
+    def positions(self):
+        return list(self.position_map.values())
+
+    @property
+    def pending_orders(self):
+        return list(self.order_map.values())
+
+    @staticmethod
+    def _mode_group(record):
+        return ('Margin' if record.is_margin else 'Spot', record.direction)
+
+    def find_position(self, pos_id):
+        """依 ID 取得持倉，找不到回傳 None"""
+        return self.position_map.get(pos_id)
+
+    def find_order(self, order_id):
+        """依 ID 取得掛單，找不到回傳 None"""
+        return self.order_map.get(order_id)
+
+    def add_position(self, pos):
+        self.position_map[pos.id] = pos
+        self.position_counts[self._mode_group(pos)] += 1
+        self.position_triggers.set(pos.id, position_trigger_levels(pos))
+        self._apply_position(pos, 1)
+
+    def reduce_position(self, pos, qty, open_fee):
+        """部分平倉：扣除數量與對應的開倉手續費"""
+        self._apply_position(pos, -1)
+        pos.qty -= qty
+        pos.total_open_fee -= open_fee
+        self._apply_position(pos, 1)
+
+    def update_position_levels(self, pos):
+        """持倉的止損/止盈變更後重建其觸發價位"""
+        self.position_triggers.set(pos.id, position_trigger_levels(pos))
+
+    def remove_position(self, pos_id):
+        pos = self.position_map.pop(pos_id, None)
+        if pos is None: return
+        self.position_counts[self._mode_group(pos)] -= 1
+        self.position_triggers.discard(pos_id)
+        if self.position_map: self._apply_position(pos, -1)
+        else: self._reset_position_totals()  # 清空時歸零，避免浮點誤差累積
+
+    def add_order(self, order):
+        self.order_map[order.id] = order
+        self.order_counts[self._mode_group(order)] += 1
+        self.order_triggers.set(order.id, order_trigger_levels(order))
+        self.locked_funds += order.locked_funds
+
+    def remove_orders(self, order_ids):
+        for order_id in order_ids:
+            order = self.order_map.pop(order_id, None)
+            if order is None: continue
+            self.order_counts[self._mode_group(order)] -= 1
+            self.order_triggers.discard(order_id)
+            self.locked_funds -= order.locked_funds
+        if not self.order_map: self.locked_funds = 0.0
+
+    def clear_orders(self):
+        self.order_map.clear()
+        self.order_counts.clear()
+        self.order_triggers.clear()
+        self.locked_funds = 0.0
+
+    def has_margin_exposure(self, direction, include_orders=False):
+        """同方向保證金倉位 (或掛單) 是否已存在"""
+        if self.position_counts[('Margin', direction)] > 0: return True
+        return include_orders and self.order_counts[('Margin', direction)] > 0
+
+    def get_locked_funds(self):
+        """掛單圈存資金總額"""
+        return self.locked_funds
+
+    def get_net_value(self, price):
+        """以指定價格計算總資產 (現金 + 圈存 + 部位淨值)"""
+        return self.balance + self.locked_funds + (price * self.net_qty + self.value_offset)
+
+    def get_total_unrealized_pnl(self, price):
+        """計算投資組合的總未實現損益"""
+        return price * self.net_qty - self.signed_cost
+
+    def get_spot_summary(self, price):
+        """彙總現貨部位資訊"""
+        if self.position_counts[('Spot', 'Long')] == 0:
+            return {'qty': 0.0, 'avg_cost': 0.0, 'unrealized_pnl': 0.0}
+
+        total_qty = self.spot_qty
+        avg_cost = self.spot_cost / total_qty if total_qty > 0 else 0.0
+        unrealized_pnl = total_qty * price - self.spot_cost
+
+        return {'qty': total_qty, 'avg_cost': avg_cost, 'unrealized_pnl': unrealized_pnl}
+
+# --- 模擬引擎 ---
+
+class SimulationEngine:
+    """
+    單一資產回測引擎。
+    core_data 需包含 Date/Open/High/Low/Close 欄位，start_index 為第一個可交易的 K 棒。
+    逐 K 棒的價格查詢一律經由 price_cache (未提供時由 core_data 建立)，不再走 DataFrame.iloc。
+    indicators 為選用的 LazyIndicators (與 core_data 索引對齊)，供圖表與策略依需求取用技術指標。
+    每根 K 棒的總資產記錄於 equity_history (EquityLedger，含歷史高低點與最大回撤)。
+    事件訊息寫入 last_event_msg，由呼叫端 (例如 Streamlit 介面) 決定如何呈現。
+    fast_forward 啟用時，多日推進會以 NumPy 直接跳到下一根可能觸發事件的 K 棒。
+    interval 為 K 棒週期 (config.INTERVALS)，只影響績效指標的年化；引擎本身以 K 棒為單位，每根的成本與週期無關。
+    intrabar 為選用的盤中路徑 (intrabar.IntrabarPaths，與 core_data 索引對齊)：提供時同一根 K 棒內的掛單成交、
+    強平與 SL/TP 依路徑上觸價的先後處理；未提供時沿用先成交掛單、再依強平 -> 止損 -> 止盈檢查持倉的順序。
+    """
+
+    def __init__(self, core_data: pd.DataFrame, asset_type: str = 'Stock',
+                 start_index: int = config.INITIAL_OBSERVATION_DAYS,
+                 initial_capital: float = config.INITIAL_CAPITAL,
+                 fast_forward: bool = True, price_cache: PriceCache | None = None,
+                 indicators=None, interval: str = config.DEFAULT_INTERVAL,
+                 intrabar: IntrabarPaths | None = None):
+        self.core_data = core_data
+        self.prices = price_cache if price_cache is not None else build_price_cache(core_data)
+        self.indicators = indicators
+        self.asset_type = asset_type
+        self.interval = interval
+        self.intrabar = intrabar
+        self.portfolio = Portfolio(initial_capital)
+        self.fast_forward = fast_forward
+
+        self.current_sim_index = start_index
+        self.max_sim_index = len(self.prices) - 1
+        self.sim_active = True
+        self.end_sim_index_on_settle = None
+        self.settlement_stats = None
+        self.last_event_msg = None
+
+        self.start_date, _, _ = self.get_price_info(start_index)
+        self.equity_history = EquityLedger(self.prices, start_index, self.portfolio.balance)
+
+    # --- 行情存取 ---
+
+    def get_price_info(self, index):
+        """根據索引取得某一天的日期、開盤價與收盤價"""
+        return self.prices.get_price_info(index)
+
+    def get_current_price(self):
+        """當前 K 棒開盤價 (市價)"""
+        return float(self.prices.opens[self.current_sim_index])
+
+    def _notify(self, text, msg_type):
+        self.last_event_msg = {'text': text, 'type': msg_type, 'mode': 'toast'}
+
+    # --- 資金計算 ---
+
+    def get_current_asset_value(self):
+        """計算當前總資產價值"""
+        if len(self.prices) == 0:
+            return self.portfolio.balance
+        if not self.sim_active or self.current_sim_index >= len(self.prices):
+            return self.portfolio.balance
+        return self.portfolio.get_net_value(self.get_current_price())
+
+    def get_total_unrealized_pnl(self, price=None):
+        if price is None: price = self.get_current_price()
+        return self.portfolio.get_total_unrealized_pnl(price)
+
+    def get_spot_summary(self):
+        if not self.sim_active or self.current_sim_index >= len(self.prices):
+            return {'qty': 0.0, 'avg_cost': 0.0, 'unrealized_pnl': 0.0}
+        return self.portfolio.get_spot_summary(self.get_current_price())
+
+    def check_and_end_simulation(self, asset_value):
+        """風險控制：破產檢測"""
+        if asset_value <= 0:
+            if self.sim_active:
+                self.settle_portfolio(force_end=True)
+                self._notify("🚨 風險控制警告！總資產歸零，模擬強制結束！", 'error')
+            return True
+        return False
+
+    # --- 交易執行 ---
+
+    def close_position_lot(self, pos_id: str, settle_qty: float, settle_price: float, reason: str, mode: str = '自動'):
+        """核心平倉邏輯"""
+        portfolio = self.portfolio
+        pos = portfolio.find_position(pos_id)
+        if pos is None: return False
+
+        if settle_qty <= 0 or settle_qty > pos.qty * 1.000001: return False
+        if abs(settle_qty - pos.qty) < 1e-9: settle_qty = pos.qty
+
+        current_datetime, _, _ = self.get_price_info(self.current_sim_index)
+        is_margin = pos.is_margin
+        direction = pos.direction
+
+        # 計算費用與資金
+        fee_rate_used = config.LEVERAGE_FEE_RATE if is_margin else config.FEE_RATE
+        close_amount = settle_qty * settle_price
+        close_fee = close_amount * fee_rate_used
+
+        portfolio.balance -= close_fee
+
+        is_fully_closed = (settle_qty == pos.qty)
+        leverage = pos.leverage
+        margin_released = (pos.cost * settle_qty) / leverage
+        realized_pnl = calculate_pnl_value(direction, settle_qty, pos.cost, settle_price)
+
+        portfolio.balance += (margin_released + realized_pnl)
+
+        # 紀錄
+        prorated_open_fee = pos.total_open_fee * (settle_qty / pos.initial_qty)
+        total_fee = prorated_open_fee + close_fee
+        display_name = pos.display_name
+        type_display = f"{display_name} ({leverage}x)" if is_margin else display_name
+        if "強平" in reason: type_display += " [強平]"
+
+        trade_record = TradeRecord(
+            id=pos.id, asset=self.asset_type, mode_key=pos.pos_mode_key, mode_name=display_name,
+            type_display=type_display, leverage=leverage, direction=direction,
+            open_date=pos.open_date, close_date=current_datetime,
+            qty=settle_qty, open_price=pos.cost, close_price=settle_price,
+            pnl=realized_pnl, fees=total_fee, net_pnl=realized_pnl - total_fee,
+            reason=reason
+        )
+        portfolio.transactions.append(trade_record)
+
+        # 訊息通知
+        if mode == '自動':
+            icon = "💰" if realized_pnl > 0 else "📉"
+            msg_text = f"{icon} {reason}：{display_name} {settle_qty:.3f} 單位 @ ${settle_price:,.2f} (損益: ${realized_pnl:,.2f})"
+            self._notify(msg_text, 'success' if realized_pnl > 0 else 'error')
+
+        if is_fully_closed:
+            portfolio.remove_position(pos_id)
+            if mode == '手動':
+                self._notify(f"✅ {display_name} 已完全平倉", 'success')
+        else:
+            portfolio.reduce_position(pos, settle_qty, prorated_open_fee)
+            if mode == '手動':
+                self._notify(f"✅ {display_name} 已部分平倉", 'success')
+
+        self.check_and_end_simulation(self.get_current_asset_value())
+        return True
+
+    def execute_trade(self, trade_mode_key, quantity, price, leverage=1.0):
+        """執行開倉交易"""
+        if not self.sim_active: return False
+        if quantity <= 0 or price <= 0: return False
+
+        mode_conf = config.TRADE_MODE_MAP.get(trade_mode_key)
+        if not mode_conf: return False
+
+        portfolio = self.portfolio
+        is_margin = mode_conf['type'] == 'Margin'
+        direction = mode_conf['direction']
+        asset_conf = config.ASSET_CONFIGS[self.asset_type]
+        display_name = get_display_name(self.asset_type, trade_mode_key)
+
+        # 倉位檢查
+        if is_margin and portfolio.has_margin_exposure(direction):
+            self._notify(f"🚫 限制：{display_name} 最多只能持有一個倉位！", 'error')
+            return False
+
+        transaction_amount = quantity * price
+        fee_rate_used = config.LEVERAGE_FEE_RATE if is_margin else config.FEE_RATE
+        open_fee = transaction_amount * fee_rate_used
+
+        portfolio.balance -= open_fee
+        if self.check_and_end_simulation(self.get_current_asset_value()):
+            return False
+
+        margin_required = transaction_amount / leverage if is_margin else transaction_amount
+        liquidation_price = 0.0
+
+        if is_margin:
+            if direction == 'Long': liquidation_price = price * (1.0 - (1.0 / leverage))
+            else: liquidation_price = price * (1.0 + (1.0 / leverage))
+
+        if portfolio.balance < margin_required:
+            portfolio.balance += open_fee
+            self._notify(f"💸 餘額不足！需保證金 ${margin_required:,.0f}", 'error')
+            return False
+
+        portfolio.balance -= margin_required
+        current_datetime, _, _ = self.get_price_info(self.current_sim_index)
+
+        new_position = Position(
+            id=str(uuid.uuid4())[:8], open_date=current_datetime,
+            pos_mode_key=trade_mode_key, display_name=display_name,
+            qty=quantity, initial_qty=quantity,
+            cost=price, initial_cost=transaction_amount,
+            leverage=leverage, liquidation_price=liquidation_price,
+            sl=0.0, tp=0.0, total_open_fee=open_fee
+        )
+        portfolio.add_position(new_position)
+        self._notify(f"✅ {display_name} 成功！開倉 {quantity:,.3f} {asset_conf['unit']} @ ${price:,.2f}", 'success')
+        return True
+
+    # --- 掛單 (Limit/Stop Order) ---
+
+    def place_limit_order(self, trade_mode_key, quantity, limit_price, leverage=1.0, order_type='Limit'):
+        """新增掛單"""
+        if quantity <= 0 or limit_price <= 0: return False
+
+        mode_conf = config.TRADE_MODE_MAP.get(trade_mode_key)
+        if not mode_conf: return False
+
+        portfolio = self.portfolio
+        is_margin = mode_conf['type'] == 'Margin'
+        direction = mode_conf['direction']
+        display_name = get_display_name(self.asset_type, trade_mode_key)
+
+        # 取得當前市價
+        current_open_price = self.get_current_price()
+
+        # --- 1. 訂單價格檢查 ---
+        if order_type == 'Limit':
+            if direction == 'Long' and limit_price >= current_open_price:
+                self._notify(f"🚫 Limit Buy 錯誤：限價單 ({limit_price:,.2f}) 必須低於市價 ({current_open_price:,.2f})。", 'error')
+                return False
+            elif direction == 'Short' and limit_price <= current_open_price:
+                self._notify(f"🚫 Limit Sell 錯誤：限價單 ({limit_price:,.2f}) 必須高於市價 ({current_open_price:,.2f})。", 'error')
+                return False
+        elif order_type == 'Stop':
+            if direction == 'Long' and limit_price <= current_open_price:
+                self._notify(f"🚫 Stop Buy 錯誤：止損單 ({limit_price:,.2f}) 必須高於市價 ({current_open_price:,.2f})。", 'error')
+                return False
+            elif direction == 'Short' and limit_price >= current_open_price:
+                self._notify(f"🚫 Stop Sell 錯誤：止損單 ({limit_price:,.2f}) 必須低於市價 ({current_open_price:,.2f})。", 'error')
+                return False
+
+        # --- 2. 倉位互斥檢查 ---
+        if is_margin:
+            if portfolio.has_margin_exposure(direction):
+                self._notify(f"🚫 禁止：已有 {display_name} 持倉，無法新增掛單。", 'error')
+                return False
+            if portfolio.has_margin_exposure(direction, include_orders=True):
+                self._notify(f"🚫 禁止：已有 {display_name} 掛單，請先刪除舊單。", 'error')
+                return False
+
+        # --- 3. 資金預扣 ---
+        transaction_amount = quantity * limit_price
+        fee_rate_used = config.LEVERAGE_FEE_RATE if is_margin else config.FEE_RATE
+        estimated_fee = transaction_amount * fee_rate_used
+        margin_required = transaction_amount / leverage if is_margin else transaction_amount
+
+        total_locked = margin_required + estimated_fee
+
+        if portfolio.balance < total_locked:
+            self._notify(f"💸 掛單失敗：餘額不足！(需 ${total_locked:,.0f})", 'error')
+            return False
+
+        portfolio.balance -= total_locked
+
+        new_order = PendingOrder(
+            id=str(uuid.uuid4())[:8],
+            trade_mode_key=trade_mode_key,
+            display_name=display_name,
+            order_type=order_type,
+            qty=quantity,
+            price=limit_price,
+            leverage=leverage,
+            created_at=self.current_sim_index,
+            locked_funds=total_locked
+        )
+
+        portfolio.add_order(new_order)
+        self._notify(f"📌 {order_type} 掛單成功：{display_name} @ {limit_price} (圈存 ${total_locked:,.0f})", 'success')
+        return True
+
+    def cancel_order(self, order_id):
+        """取消掛單並退還資金"""
+        order_to_cancel = self.portfolio.find_order(order_id)
+
+        if order_to_cancel:
+            locked = order_to_cancel.locked_funds
+            self.portfolio.balance += locked
+            self.portfolio.remove_orders([order_id])
+            self._notify(f"🗑️ 掛單已取消 (退還 ${locked:,.0f})", 'info')
+
+    def set_sl_tp(self, pos_id, sl, tp):
+        """設定部位的止損/止盈價 (0 代表不設定)"""
+        pos = self.portfolio.find_position(pos_id)
+        if pos is None: return False
+
+        liq_price = pos.liquidation_price
+        cost_price = pos.cost
+        direction = pos.direction
+        error = None
+        if liq_price > 0:
+            if direction == 'Long' and sl > 0 and sl <= liq_price:
+                error = f"多頭止損 ({sl}) 不能低於強制平倉價 ({liq_price:.2f})！"
+            elif direction == 'Short' and sl > 0 and sl >= liq_price:
+                error = f"空頭止損 ({sl}) 不能高於強制平倉價 ({liq_price:.2f})！"
+        if error is None and tp > 0:
+            if direction == 'Long' and tp <= cost_price:
+                error = f"多頭止盈 ({tp}) 必須高於開倉價 ({cost_price:.2f})！"
+            elif direction == 'Short' and tp >= cost_price:
+                error = f"空頭止盈 ({tp}) 必須低於開倉價 ({cost_price:.2f})！"
+        if error is not None:
+            self._notify(f"🚫 ID {pos_id[-4:]} 錯誤：{error}", 'error')
+            return False
+
+        pos.sl = sl
+        pos.tp = tp
+        self.portfolio.update_position_levels(pos)
+        return True
+
+    def check_pending_orders(self):
+        """檢查掛單是否觸發 (只檢查價位索引中落在當根 High/Low 範圍內的掛單)"""
+        portfolio = self.portfolio
+        if not portfolio.order_map: return False
+
+        current_open, current_high, current_low, _ = self.prices.get_bar(self.current_sim_index)
+        candidates = portfolio.order_triggers.hits(current_high, current_low)
+        if not candidates: return False
+
+        triggered_orders = []
+
+        for order in [portfolio.find_order(order_id) for order_id in candidates]:
+            # --- 觸發檢查 ---
+            (is_upper, level), = order_trigger_levels(order)
+            if not (current_high >= level if is_upper else current_low <= level): continue
+
+            # --- 執行成交 ---
+            portfolio.balance += order.locked_funds
+            triggered_orders.append(order.id)
+            self._fill_order(order, self._order_fill_price(order, current_open))
+
+        if triggered_orders:
+            portfolio.remove_orders(triggered_orders)
+            return True
+
+        return False
+
+    @staticmethod
+    def _order_fill_price(order, current_open):
+        """觸發後的成交價：限價單取開盤價與限價中較有利者，停損單跳空越過時以開盤價成交"""
+        limit_price = float(order.price)
+        if order.order_type == 'Limit':
+            return min(current_open, limit_price) if order.is_long else max(current_open, limit_price)
+        return max(current_open, limit_price) if order.is_long else min(current_open, limit_price)
+
+    def _fill_order(self, order, fill_price):
+        """以 fill_price 成交已觸發的掛單 (圈存資金需先退回餘額)"""
+        if self.execute_trade(order.trade_mode_key, order.qty, fill_price, order.leverage):
+            self._notify(f"成交：{order.order_type} 單 @ ${fill_price:,.2f} ({order.display_name})", 'success')
+        else:
+            self._notify(f"⚠️ 掛單 {order.display_name} 觸發但餘額不足以成交 (已撤單)", 'error')
+
+    @staticmethod
+    def _position_exits(pos):
+        """持倉的出場價位 [(是否為上緣, 價位, 原因)]，依強平 -> 止損 -> 止盈的優先順序"""
+        exits = []
+        if pos.is_margin and pos.liquidation_price > 0:
+            exits.append((not pos.is_long, pos.liquidation_price, '⚡ 強制平倉(多)' if pos.is_long else '⚡ 強制平倉(空)'))
+        if pos.sl > 0: exits.append((not pos.is_long, pos.sl, '🛑 止損賣出' if pos.is_long else '🛑 止損買回'))
+        if pos.tp > 0: exits.append((pos.is_long, pos.tp, '🎯 止盈賣出' if pos.is_long else '🎯 止盈買回'))
+        return exits
+
+    def check_sl_tp_trigger(self):
+        """檢查 SL/TP 與強平"""
+        if not self.sim_active: return False
+        idx = self.current_sim_index
+        if idx >= len(self.prices): return False
+
+        high = float(self.prices.highs[idx])
+        low = float(self.prices.lows[idx])
+        candidates = self.portfolio.position_triggers.hits(high, low)
+        if not candidates: return False
+        positions_to_close_info = []
+
+        for pos in [self.portfolio.find_position(pos_id) for pos_id in candidates]:
+            # 強平 -> 止損 -> 止盈，取第一個被當根 High/Low 觸及的價位
+            for is_upper, settle_price, reason in self._position_exits(pos):
+                if high >= settle_price if is_upper else low <= settle_price:
+                    positions_to_close_info.append({'id': pos.id, 'qty': pos.qty, 'price': settle_price, 'reason': reason})
+                    break
+
+        trigger_happened = False
+        for info in positions_to_close_info:
+            if self.close_position_lot(info['id'], info['qty'], info['price'], info['reason'], mode='自動'):
+                trigger_happened = True
+
+        return trigger_happened
+
+    def process_intrabar_events(self):
+        """
+        依盤中路徑處理當根 K 棒的掛單與持倉：每次取路徑上最早觸及的價位執行 (掛單成交或平倉)，
+        再從該時間點往後找下一個，因此成交後新建的持倉只會被成交之後的價格觸發。
+        同一時間點依掛單、強平、止損、止盈的順序處理。成交價與平倉價的規則與逐根檢查相同。
+        """
+        portfolio = self.portfolio
+        idx = self.current_sim_index
+        if not portfolio.order_map and not portfolio.position_map: return False
+
+        current_open, high, low, _ = self.prices.get_bar(idx)
+        path = self.intrabar.path(idx)
+        after = 0.0
+        happened = False
+
+        while self.sim_active:
+            events = []
+            for order_id in portfolio.order_triggers.hits(high, low):
+                order = portfolio.find_order(order_id)
+                (is_upper, level), = order_trigger_levels(order)
+                events.append((is_upper, level, order, None))
+            for pos_id in portfolio.position_triggers.hits(high, low):
+                pos = portfolio.find_position(pos_id)
+                events.extend((is_upper, level, pos, reason) for is_upper, level, reason in self._position_exits(pos))
+            if not events: break
+
+            times = first_touch(path, [e[1] for e in events], [e[0] for e in events], after)
+            first = int(np.argmin(times))  # 同時觸及時取列表中較前者
+            if not np.isfinite(times[first]): break
+            after = float(times[first])
+
+            _, level, record, reason = events[first]
+            if reason is None:
+                portfolio.balance += record.locked_funds
+                portfolio.remove_orders([record.id])
+                self._fill_order(record, self._order_fill_price(record, current_open))
+            else:
+                self.close_position_lot(record.id, record.qty, level, reason, mode='自動')
+            happened = True
+
+        return happened
+
+    # --- 結算 ---
+
+    def settle_portfolio(self, force_end=False):
+        """結算功能 (包含掛單退款)"""
+        if not self.sim_active and not force_end: return
+
+        portfolio = self.portfolio
+        current_idx = self.current_sim_index
+        prices = self.prices
+        if len(prices) == 0: return
+
+        if current_idx >= len(prices):
+            settle_price = float(prices.closes[-1])
+        elif force_end:
+            settle_price = float(prices.closes[current_idx])
+        else:
+            settle_price = float(prices.opens[current_idx])
+
+        positions_to_close = portfolio.positions
+        if positions_to_close:
+            msg = "強制結算" if force_end else "手動全平"
+            for pos in positions_to_close:
+                self.close_position_lot(pos.id, pos.qty, settle_price, reason=msg, mode='自動結算')
+
+        if force_end:
+            for order in portfolio.order_map.values():
+                portfolio.balance += order.locked_funds
+            portfolio.clear_orders()
+
+            self.sim_active = False
+            self.end_sim_index_on_settle = current_idx
+
+            final_asset = self.get_current_asset_value()
+            initial_cap = portfolio.initial_capital
+            total_pnl = final_asset - initial_cap
+            roi = (total_pnl / initial_cap) * 100
+
+            end_date, _, _ = self.get_price_info(current_idx)
+
+            ledger = self.equity_history
+            self.settlement_stats = {
+                'final_asset': final_asset, 'total_pnl': total_pnl, 'roi': roi,
+                'start_date': self.start_date, 'end_date': end_date,
+                'peak_equity': ledger.peak, 'trough_equity': ledger.trough, 'max_drawdown': ledger.max_drawdown
+            }
+            # 績效指標 (Sharpe、Sortino、回撤期間、Calmar、勝率、獲利因子、曝險時間、各模式分項)
+            self.settlement_stats.update(analyze_engine(self))
+
+    # --- 時間推進 ---
+
+    def _step(self):
+        """前進一根 K 棒並處理觸發事件，回傳 (事件是否發生, 是否破產)"""
+        self.current_sim_index += 1
+
+        if self.intrabar is not None:
+            event_triggered = self.process_intrabar_events()
+        else:
+            order_triggered = self.check_pending_orders()
+            sltp_triggered = self.check_sl_tp_trigger()
+            event_triggered = order_triggered or sltp_triggered
+
+        total_asset_new = self.get_current_asset_value()
+        self.equity_history.append(total_asset_new)
+
+        is_bankrupt = self.check_and_end_simulation(total_asset_new)
+        return event_triggered, is_bankrupt
+
+    def advance_one_day(self):
+        """推進一天 (記錄資產變化)，回傳 (可否繼續, 事件是否發生)"""
+        if not self.sim_active: return False, False
+
+        if self.current_sim_index < self.max_sim_index:
+            event_triggered, is_bankrupt = self._step()
+            if is_bankrupt:
+                return False, True
+            return True, event_triggered
+        else:
+            self.settle_portfolio(force_end=True)
+            return False, True
+
+    def advance_multiple_days(self, days_to_advance):
+        """一次推進多天，遇到事件即停止"""
+        if not self.sim_active: return False, False
+
+        event_occurred = False
+        can_continue = True
+        remaining = days_to_advance
+
+        while remaining > 0:
+            if self.current_sim_index >= self.max_sim_index:
+                self.settle_portfolio(force_end=True)
+                can_continue = False
+                event_occurred = True
+                break
+
+            # 快轉：直接跳過確定不會觸發任何事件的 K 棒
+            if self.fast_forward:
+                start = self.current_sim_index + 1
+                stop = min(start + remaining, self.max_sim_index + 1)
+                skipped = self._find_next_event_index(start, stop) - start
+                if skipped > 0:
+                    self._fast_forward(start, start + skipped)
+                    remaining -= skipped
+                    continue
+
+            event_triggered, is_bankrupt = self._step()
+            remaining -= 1
+            if event_triggered or is_bankrupt:
+                event_occurred = True
+                break
+
+        return can_continue, event_occurred
+
+    # --- 快轉 (Fast-Forward) ---
+
+    def _trigger_levels(self):
+        """
+        彙整所有掛單與持倉的觸發價位 (取自價位索引)。
+        回傳 (upper, lower)：High >= upper 或 Low <= lower 時可能觸發事件。
+        """
+        order_upper, order_lower = self.portfolio.order_triggers.bounds()
+        pos_upper, pos_lower = self.portfolio.position_triggers.bounds()
+        return min(order_upper, pos_upper), max(order_lower, pos_lower)
+
+    def _equity_curve(self, prices):
+        """以目前持倉計算一段價格序列對應的總資產 (與 Portfolio.get_net_value 相同的公式)"""
+        portfolio = self.portfolio
+        return portfolio.balance + portfolio.locked_funds + (prices * portfolio.net_qty + portfolio.value_offset)
+
+    def _find_next_event_index(self, start, stop):
+        """在 [start, stop) 中找出第一根可能觸發掛單、SL/TP、強平或破產的 K 棒，沒有則回傳 stop"""
+        if start >= stop: return stop
+
+        upper, lower = self._trigger_levels()
+        prices = self.prices
+        hit = (prices.highs[start:stop] >= upper) | (prices.lows[start:stop] <= lower)
+        hit |= self._equity_curve(prices.opens[start:stop]) <= 0
+
+        first = int(np.argmax(hit))
+        return start + first if hit[first] else stop
+
+    def _fast_forward(self, start, stop):
+        """批次跳過 [start, stop) 區間：不觸發任何事件，只補齊資產曲線"""
+        self.equity_history.extend(self._equity_curve(self.prices.opens[start:stop]))
+        self.current_sim_index = stop - 1
+
+    def next_day(self):
+        if not self.sim_active: return
+        self.advance_one_day()
+
+    def next_ten_days(self):
+        if not self.sim_active: return
+        days_to_advance = min(10, self.max_sim_index - self.current_sim_index)
+        if days_to_advance <= 0: self.settle_portfolio(force_end=True); return
+        self.advance_multiple_days(days_to_advance)
+        if self.sim_active and self.current_sim_index >= self.max_sim_index:
+            self.settle_portfolio(force_end=True)
+            self._notify("回測結束。", 'info')
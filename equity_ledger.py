@@ -0,0 +1,82 @@
+# equity_ledger.py
+# 資產曲線帳本：逐根 K 棒的總資產存放於預先配置的 NumPy 陣列，並即時維護歷史高點、低點與最大回撤
+
+import numpy as np
+from price_cache import PriceCache
+
+class EquityLedger:
+    """
+    第 i 筆紀錄對應 K 棒 start_index + i (資產紀錄逐根連續)，日期直接取自 PriceCache。
+    append / extend 為 O(1) / 向量化，peak、trough、max_drawdown 隨時可讀，不需重建 DataFrame。
+    max_drawdown 以百分比 (正值) 表示。
+    """
+
+    def __init__(self, prices: PriceCache, start_index: int, initial_equity: float):
+        self.prices = prices
+        self.start_index = start_index
+        self._values = np.empty(max(1, len(prices) - start_index), dtype=np.float64)
+        self._count = 0
+
+        self.peak = -np.inf
+        self.peak_index = 0
+        self.trough = np.inf
+        self.trough_index = 0
+        self._max_dd = 0.0
+        self.append(initial_equity)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        """單筆紀錄 {'date', 'equity'}"""
+        i = range(self._count)[i]
+        return {'date': self.prices.py_dates[self.start_index + i], 'equity': float(self._values[i])}
+
+    @property
+    def equity(self) -> np.ndarray:
+        return self._values[:self._count]
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self.prices.py_dates[self.start_index:self.start_index + self._count]
+
+    @property
+    def date_labels(self) -> np.ndarray:
+        return self.prices.date_labels[self.start_index:self.start_index + self._count]
+
+    @property
+    def max_drawdown(self) -> float:
+        return self._max_dd * 100
+
+    @property
+    def last(self) -> float:
+        return float(self._values[self._count - 1])
+
+    def append(self, equity: float):
+        i = self._count
+        self._values[i] = equity
+        self._count += 1
+
+        if equity > self.peak: self.peak, self.peak_index = equity, i
+        if equity < self.trough: self.trough, self.trough_index = equity, i
+        if self.peak > 0:
+            drawdown = 1.0 - equity / self.peak
+            if drawdown > self._max_dd: self._max_dd = drawdown
+
+    def extend(self, values: np.ndarray):
+        """一次加入多筆 (快轉區間)，統計量以向量化方式更新"""
+        n = len(values)
+        if n == 0: return
+        i = self._count
+        self._values[i:i + n] = values
+        self._count += n
+
+        peaks = np.maximum.accumulate(np.r_[self.peak, values])[1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drawdown = np.where(peaks > 0, 1.0 - values / peaks, 0.0)
+        self._max_dd = max(self._max_dd, float(drawdown.max()))
+
+        hi = int(np.argmax(values))
+        if values[hi] > self.peak: self.peak, self.peak_index = float(values[hi]), i + hi
+        lo = int(np.argmin(values))
+        if values[lo] < self.trough: self.trough, self.trough_index = float(values[lo]), i + lo
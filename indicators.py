@@ -0,0 +1,545 @@
+# indicators.py
+# 技術指標：向量化批次計算、O(1) 增量 (串流) 更新，以及依需求計算並快取的指標存取介面
+# 串流版本的演算法與 Pandas 的 rolling / ewm 相同 (Kahan 補償的滾動和、視窗 Welford 變異數、遞迴 EMA)，
+# 逐根輸出與批次計算結果一致
+
+import hashlib
+import math
+from collections import OrderedDict, deque
+import numpy as np
+import pandas as pd
+import config
+
+NAN = float('nan')
+
+# --- 批次計算 (向量化) ---
+
+def calculate_ma(data: pd.DataFrame, periods=None) -> pd.DataFrame:
+    """計算移動平均線 (MA{週期})"""
+    periods = periods if periods is not None else config.MA_PERIODS
+    return pd.DataFrame({f'MA{p}': data['Close'].rolling(window=p).mean() for p in periods})
+
+def calculate_rsi(data: pd.DataFrame, window: int = 14) -> pd.Series:
+    """計算 RSI (Wilder's Smoothing)"""
+    delta = data['Close'].diff()
+    gain = (delta.where(delta > 0, 0))
+    loss = (-delta.where(delta < 0, 0))
+    
+    avg_gain = gain.ewm(com=window - 1, min_periods=window).mean()
+    avg_loss = loss.ewm(com=window - 1, min_periods=window).mean()
+    
+    rs = avg_gain / avg_loss
+    rsi = 100 - (100 / (1 + rs))
+    return rsi
+
+def calculate_bollinger_bands(data: pd.DataFrame, window: int = 20, num_std: float = 2.0) -> pd.DataFrame:
+    """計算布林通道"""
+    ma = data['Close'].rolling(window=window).mean()
+    std = data['Close'].rolling(window=window).std()
+    upper = ma + (std * num_std)
+    lower = ma - (std * num_std)
+    
+    return pd.DataFrame({
+        'BB_MA': ma,
+        'BB_UPPER': upper,
+        'BB_LOWER': lower
+    })
+
+def calculate_macd(data: pd.DataFrame, fast_period: int = 12, slow_period: int = 26, signal_period: int = 9) -> pd.DataFrame:
+    """計算 MACD"""
+    ema_fast = data['Close'].ewm(span=fast_period, adjust=False).mean()
+    ema_slow = data['Close'].ewm(span=slow_period, adjust=False).mean()
+    
+    macd_line = ema_fast - ema_slow
+    macd_signal = macd_line.ewm(span=signal_period, adjust=False).mean()
+    macd_hist = macd_line - macd_signal
+    
+    return pd.DataFrame({
+        'MACD_Line': macd_line,
+        'MACD_Signal': macd_signal,
+        'MACD_Hist': macd_hist
+    })
+
+# --- 串流基礎元件 ---
+
+class RollingMean:
+    """滾動平均 (等同 Series.rolling(window).mean())，NaN 不計入觀測數，視窗內有效值不足 window 個時輸出 NaN"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values = deque()
+        self.nobs = 0
+        self.sum_x = 0.0
+        self.comp_add = 0.0
+        self.comp_remove = 0.0
+        self.neg_ct = 0
+        self.same_ct = 0
+        self.prev_value = NAN
+
+    def update(self, x: float) -> float:
+        if len(self.values) == self.window:
+            old = self.values.popleft()
+            if old == old:
+                self.nobs -= 1
+                y = -old - self.comp_remove
+                t = self.sum_x + y
+                self.comp_remove = t - self.sum_x - y
+                self.sum_x = t
+                if math.copysign(1.0, old) < 0: self.neg_ct -= 1
+
+        self.values.append(x)
+        if x == x:
+            self.nobs += 1
+            y = x - self.comp_add
+            t = self.sum_x + y
+            self.comp_add = t - self.sum_x - y
+            self.sum_x = t
+            if math.copysign(1.0, x) < 0: self.neg_ct += 1
+            self.same_ct = self.same_ct + 1 if x == self.prev_value else 1
+            self.prev_value = x
+
+        nobs = self.nobs
+        if nobs < self.window or nobs == 0: return NAN
+        if self.same_ct >= nobs: return self.prev_value
+        result = self.sum_x / nobs
+        if self.neg_ct == 0 and result < 0: result = 0.0
+        elif self.neg_ct == nobs and result > 0: result = 0.0
+        return result
+
+    def seed(self, closes: np.ndarray) -> 'RollingMean':
+        """
+        建立處理完 closes 後的狀態。累計和與補償項取決於整段歷史的加減順序，只重播最後一個視窗會差在最後幾位，
+        因此從頭重播整段 (與 Pandas 的單次掃描逐位元相同)；之後狀態留在快取中持續延伸，每份結果只需重播一次。
+        """
+        for x in closes:
+            self.update(float(x))
+        return self
+
+# 平方差和單次更新後縮小到原本的 1e3 * eps 以下時，視為發生災難性抵銷 (只剩約 3 位有效數字)
+INV_COND_TOL = np.finfo(np.float64).eps * 1e3
+
+class RollingStd:
+    """
+    滾動樣本標準差 (等同 Series.rolling(window).std()，ddof=1)，與 Pandas 相同以視窗版 Welford 演算法維護：
+    加入/移除各自以 Kahan 補償；某次更新使平方差和驟降 (可能的災難性抵銷) 時，改以目前視窗內的值重新累計。
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values = deque()
+        self.nobs = 0
+        self.mean_x = 0.0
+        self.ssqdm_x = 0.0
+        self.comp_add = 0.0
+        self.comp_remove = 0.0
+        self.unstable = False
+
+    def _add(self, x):
+        if x != x: return
+        prev_m2 = self.ssqdm_x
+        self.nobs += 1
+        prev_mean = self.mean_x - self.comp_add
+        y = x - self.comp_add
+        t = y - self.mean_x
+        self.comp_add = t + self.mean_x - y
+        self.mean_x = self.mean_x + t / self.nobs
+        self.ssqdm_x += (x - prev_mean) * (x - self.mean_x)
+        if prev_m2 * INV_COND_TOL > self.ssqdm_x: self.unstable = True
+
+    def _remove(self, x):
+        if x != x: return
+        prev_m2 = self.ssqdm_x
+        self.nobs -= 1
+        if self.nobs:
+            prev_mean = self.mean_x - self.comp_remove
+            y = x - self.comp_remove
+            t = y - self.mean_x
+            self.comp_remove = t + self.mean_x - y
+            self.mean_x = self.mean_x - t / self.nobs
+            self.ssqdm_x -= (x - prev_mean) * (x - self.mean_x)
+            if prev_m2 * INV_COND_TOL > self.ssqdm_x: self.unstable = True
+        else:
+            self.mean_x = 0.0
+            self.ssqdm_x = 0.0
+            self.unstable = False
+
+    def _recompute(self):
+        """以目前視窗內的值從頭累計"""
+        self.nobs = 0
+        self.mean_x = self.ssqdm_x = self.comp_add = self.comp_remove = 0.0
+        for x in self.values:
+            self._add(x)
+        self.unstable = False
+
+    def update(self, x: float) -> float:
+        if len(self.values) == self.window:
+            self._remove(self.values.popleft())
+        self.values.append(x)
+        self._add(x)
+        if self.unstable: self._recompute()
+
+        nobs = self.nobs
+        if nobs < self.window or nobs <= 1: return NAN
+        var = self.ssqdm_x / (nobs - 1)
+        return math.sqrt(var) if var > 0 else 0.0
+
+    def seed(self, closes: np.ndarray) -> 'RollingStd':
+        """建立處理完 closes 後的狀態：同 RollingMean.seed 從頭重播整段"""
+        for x in closes:
+            self.update(float(x))
+        return self
+
+class EMA:
+    """
+    指數移動平均 (等同 Series.ewm(...).mean())。
+    可用 span 或 com 指定平滑係數；adjust=True 為加權正規化版本 (RSI 的 Wilder 平滑即 com=window-1)。
+    """
+
+    def __init__(self, span: float | None = None, com: float | None = None, adjust: bool = True, min_periods: int = 0):
+        if com is None:
+            com = (span - 1) / 2.0
+        alpha = 1.0 / (1.0 + com)
+        self.old_wt_factor = 1.0 - alpha
+        self.new_wt = 1.0 if adjust else alpha
+        self.adjust = adjust
+        self.min_periods = max(min_periods, 1)
+        self.weighted = NAN
+        self.old_wt = 1.0
+        self.nobs = 0
+
+    def update(self, x: float) -> float:
+        self.nobs += 1
+        if self.nobs == 1:
+            self.weighted = x
+        else:
+            self.old_wt *= self.old_wt_factor
+            if self.weighted != x:
+                self.weighted = (self.old_wt * self.weighted + self.new_wt * x) / (self.old_wt + self.new_wt)
+            self.old_wt = self.old_wt + self.new_wt if self.adjust else 1.0
+        return self.weighted if self.nobs >= self.min_periods else NAN
+
+    def seed(self, nobs: int, weighted: float) -> 'EMA':
+        """
+        由批次結果建立狀態：已處理 nobs 筆、目前平均為 weighted (ewm().mean() 的最後一個值)，與逐筆 update 完全相同。
+        權重和只與筆數有關，收斂到固定點後不再變動，迴圈最多執行到收斂為止。
+        """
+        self.nobs = nobs
+        self.weighted = weighted
+        if self.adjust:
+            for _ in range(nobs - 1):
+                old_wt = self.old_wt * self.old_wt_factor + self.new_wt
+                if old_wt == self.old_wt: break
+                self.old_wt = old_wt
+        return self
+
+# --- 組合指標 ---
+
+class RSI:
+    """相對強弱指標 (Wilder's Smoothing)，對應 calculate_rsi"""
+
+    def __init__(self, window: int = 14):
+        self.window = window
+        self.avg_gain = EMA(com=window - 1, min_periods=window)
+        self.avg_loss = EMA(com=window - 1, min_periods=window)
+        self.prev_close = NAN
+
+    def update(self, close: float) -> float:
+        delta = close - self.prev_close
+        self.prev_close = close
+        gain = delta if delta > 0 else 0.0
+        loss = -(delta if delta < 0 else 0.0)
+
+        avg_gain = self.avg_gain.update(gain)
+        avg_loss = self.avg_loss.update(loss)
+        if avg_gain != avg_gain or avg_loss != avg_loss: return NAN
+        if avg_loss == 0:
+            if avg_gain == 0: return NAN
+            return 100.0
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+    def seed(self, shared: 'SharedIntermediates', frame: pd.DataFrame) -> 'RSI':
+        closes = shared.close.to_numpy()
+        if len(closes) < self.window:
+            for close in closes:
+                self.update(float(close))
+            return self
+        avg_gain, avg_loss = shared.wilder(self.window)
+        self.avg_gain.seed(len(closes), float(avg_gain.iloc[-1]))
+        self.avg_loss.seed(len(closes), float(avg_loss.iloc[-1]))
+        self.prev_close = float(closes[-1])
+        return self
+
+class BollingerBands:
+    """布林通道，回傳 (BB_MA, BB_UPPER, BB_LOWER)"""
+
+    def __init__(self, window: int = 20, num_std: float = 2.0):
+        self.ma = RollingMean(window)
+        self.std = RollingStd(window)
+        self.num_std = num_std
+
+    def update(self, close: float) -> tuple[float, float, float]:
+        ma = self.ma.update(close)
+        std = self.std.update(close)
+        return ma, ma + (std * self.num_std), ma - (std * self.num_std)
+
+    def seed(self, shared: 'SharedIntermediates', frame: pd.DataFrame) -> 'BollingerBands':
+        closes = shared.close.to_numpy()
+        self.ma.seed(closes)
+        self.std.seed(closes)
+        return self
+
+class MACD:
+    """MACD，回傳 (MACD_Line, MACD_Signal, MACD_Hist)"""
+
+    def __init__(self, fast_period: int = 12, slow_period: int = 26, signal_period: int = 9):
+        self.fast_period = fast_period
+        self.slow_period = slow_period
+        self.ema_fast = EMA(span=fast_period, adjust=False)
+        self.ema_slow = EMA(span=slow_period, adjust=False)
+        self.ema_signal = EMA(span=signal_period, adjust=False)
+
+    def update(self, close: float) -> tuple[float, float, float]:
+        macd_line = self.ema_fast.update(close) - self.ema_slow.update(close)
+        macd_signal = self.ema_signal.update(macd_line)
+        return macd_line, macd_signal, macd_line - macd_signal
+
+    def seed(self, shared: 'SharedIntermediates', frame: pd.DataFrame) -> 'MACD':
+        n = len(shared.close)
+        self.ema_fast.seed(n, float(shared.ema(self.fast_period).iloc[-1]))
+        self.ema_slow.seed(n, float(shared.ema(self.slow_period).iloc[-1]))
+        self.ema_signal.seed(n, float(frame['MACD_Signal'].iloc[-1]))
+        return self
+
+class MovingAverages:
+    """多條移動平均線，回傳各週期的 MA 值"""
+
+    def __init__(self, periods=None):
+        self.mas = [RollingMean(p) for p in (periods if periods is not None else config.MA_PERIODS)]
+
+    def update(self, close: float) -> tuple:
+        return tuple(ma.update(close) for ma in self.mas)
+
+    def seed(self, shared: 'SharedIntermediates', frame: pd.DataFrame) -> 'MovingAverages':
+        closes = shared.close.to_numpy()
+        for ma in self.mas:
+            ma.seed(closes)
+        return self
+
+# 指標暖機期：所有預設指標 (MA config.MA_PERIODS、RSI(14)、BBands(20)) 都有值之前所需的 K 棒數
+INDICATOR_WARMUP_BARS = max(config.MA_PERIODS + [14, 20]) - 1
+
+# --- 指標註冊表 (參數化) ---
+
+class SharedIntermediates:
+    """
+    同一份收盤價序列上可共用的中間結果 (滾動均值/標準差、EMA、Wilder 平滑)，記憶化於 IndicatorCache。
+    例如 MA20 與 BB(20, 2.5) 共用同一條 20 日滾動均值，MACD(12, 26) 與 MACD(12, 30) 共用 EMA12。
+    """
+
+    def __init__(self, cache: 'IndicatorCache', data_key: str, closes: np.ndarray):
+        self.cache = cache
+        self.data_key = data_key
+        self.close = pd.Series(closes)
+
+    def _memo(self, kind: str, args: tuple, compute):
+        return self.cache.memo((self.data_key, kind, args), compute)
+
+    def rolling_mean(self, window: int) -> pd.Series:
+        return self._memo('rolling_mean', (window,), lambda: self.close.rolling(window=window).mean())
+
+    def rolling_std(self, window: int) -> pd.Series:
+        return self._memo('rolling_std', (window,), lambda: self.close.rolling(window=window).std())
+
+    def ema(self, span: int) -> pd.Series:
+        return self._memo('ema', (span,), lambda: self.close.ewm(span=span, adjust=False).mean())
+
+    def wilder(self, window: int) -> tuple[pd.Series, pd.Series]:
+        """RSI 使用的平均漲幅與平均跌幅"""
+        def compute():
+            delta = self.close.diff()
+            gain = (delta.where(delta > 0, 0))
+            loss = (-delta.where(delta < 0, 0))
+            return (gain.ewm(com=window - 1, min_periods=window).mean(),
+                    loss.ewm(com=window - 1, min_periods=window).mean())
+        return self._memo('wilder', (window,), compute)
+
+def _ma_periods(periods) -> tuple:
+    return (periods,) if isinstance(periods, int) else tuple(periods)
+
+def _compute_ma(shared, periods):
+    return pd.DataFrame({f'MA{p}': shared.rolling_mean(p) for p in _ma_periods(periods)})
+
+def _compute_rsi(shared, window):
+    avg_gain, avg_loss = shared.wilder(window)
+    rs = avg_gain / avg_loss
+    return (100 - (100 / (1 + rs))).to_frame('RSI')
+
+def _compute_bbands(shared, window, num_std):
+    ma = shared.rolling_mean(window)
+    std = shared.rolling_std(window)
+    return pd.DataFrame({'BB_MA': ma, 'BB_UPPER': ma + (std * num_std), 'BB_LOWER': ma - (std * num_std)})
+
+def _compute_macd(shared, fast_period, slow_period, signal_period):
+    macd_line = shared.ema(fast_period) - shared.ema(slow_period)
+    macd_signal = macd_line.ewm(span=signal_period, adjust=False).mean()
+    return pd.DataFrame({'MACD_Line': macd_line, 'MACD_Signal': macd_signal, 'MACD_Hist': macd_line - macd_signal})
+
+# 指標名稱 -> 計算函式 compute(shared, **params)、串流類別 (可為 None) 與預設參數 (順序即位置參數順序)
+INDICATOR_SPECS = {}
+
+def register_indicator(name: str, compute, stream=None, **defaults):
+    """
+    註冊 (或覆寫) 指標。compute(shared: SharedIntermediates, **params) 回傳與收盤價等長的 DataFrame；
+    stream 為同參數的串流類別 (提供 update(close) 與 seed(shared, frame)：由批次結果建立處理完整段收盤價後的狀態)，
+    提供時新增 K 棒可增量延伸，否則整段重算。
+    """
+    INDICATOR_SPECS[name] = {'compute': compute, 'stream': stream, 'defaults': defaults}
+
+register_indicator('MA', _compute_ma, lambda periods: MovingAverages(_ma_periods(periods)), periods=tuple(config.MA_PERIODS))
+register_indicator('RSI', _compute_rsi, RSI, window=14)
+register_indicator('BBands', _compute_bbands, BollingerBands, window=20, num_std=2.0)
+register_indicator('MACD', _compute_macd, MACD, fast_period=12, slow_period=26, signal_period=9)
+
+def resolve_params(name: str, args: tuple = (), params: dict | None = None) -> tuple:
+    """合併預設值、位置參數與關鍵字參數，回傳可作為快取鍵的 ((參數, 值), ...)，例如 MA(50)、BBands(20, 2.5)"""
+    if name not in INDICATOR_SPECS:
+        raise KeyError(f"未註冊的指標: {name}")
+    defaults = INDICATOR_SPECS[name]['defaults']
+    if len(args) > len(defaults):
+        raise TypeError(f"{name} 最多接受 {len(defaults)} 個參數")
+    merged = {**defaults, **dict(zip(defaults, args)), **(params or {})}
+    unknown = set(merged) - set(defaults)
+    if unknown:
+        raise TypeError(f"{name} 不接受參數: {', '.join(sorted(unknown))}")
+    return tuple((k, tuple(v) if isinstance(v, list) else v) for k, v in merged.items())
+
+def data_fingerprint(dates: np.ndarray, closes: np.ndarray) -> str:
+    """日期與收盤價的雜湊，作為指標快取鍵的資料部分"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(closes, dtype=np.float64).tobytes())
+    h.update(np.asarray(dates, dtype='datetime64[ns]').view('i8').tobytes())
+    return h.hexdigest()
+
+# --- 依需求計算 (Lazy) 與快取 ---
+
+def _cache_entry(dates, closes, frame, data_key, state=None, buffer=None) -> dict:
+    """IndicatorCache 的快取值：state/buffer 為延伸用的串流狀態與列緩衝區 (批次計算的結果兩者皆為 None)"""
+    return {'dates': dates, 'closes': closes, 'frame': frame, 'data_key': data_key, 'state': state, 'buffer': buffer}
+
+class IndicatorCache:
+    """
+    有上限的 LRU 快取，鍵為 (資料雜湊, 指標, 參數)；共用中間結果也存放於此。
+    同一代碼的歷史只在尾端新增 K 棒時，以串流元件延伸上一份結果而不重算，結果與整段重算逐位元相同：
+    第一次延伸時建立串流狀態 (EMA 類由批次結果直接建立，滾動視窗類從頭重播一次)，
+    新的列寫入預先配置 (容量倍增) 的緩衝區，狀態與緩衝區直接轉交給新的結果，之後每次只計算新增的 K 棒。
+    最後一根被更新 (例如盤中即時 K 棒) 時狀態無法回退，改為整段向量化重算。
+    """
+
+    def __init__(self, maxsize: int = config.INDICATOR_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lru = OrderedDict()
+        self._latest = {}  # (代碼, 指標, 參數) -> 最近一次的快取鍵，供增量延伸
+
+    def memo(self, key, compute):
+        """取得快取值，不存在時呼叫 compute() 計算並存入"""
+        if key in self._lru:
+            self._lru.move_to_end(key)
+            return self._lru[key]
+        value = compute()
+        self._lru[key] = value
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+        return value
+
+    def get(self, ticker: str | None, dates: np.ndarray, closes: np.ndarray, name: str, *args,
+            data_key: str | None = None, **params) -> pd.DataFrame:
+        spec = INDICATOR_SPECS[name]
+        param_key = resolve_params(name, args, params)
+        data_key = data_key or data_fingerprint(dates, closes)
+        key = (data_key, name, param_key)
+        latest_key = (ticker.upper(), name, param_key) if ticker else None
+
+        def compute():
+            entry = None
+            prev_key = self._latest.get(latest_key) if latest_key else None
+            if spec['stream'] is not None and prev_key in self._lru:
+                entry = self._extend(self._lru[prev_key], dates, closes, data_key, spec, dict(param_key))
+            if entry is None:
+                frame = spec['compute'](SharedIntermediates(self, data_key, closes), **dict(param_key))
+                entry = _cache_entry(dates, closes, frame, data_key)
+            return entry
+
+        entry = self.memo(key, compute)
+        if latest_key: self._latest[latest_key] = key
+        return entry['frame']
+
+    def put(self, dates: np.ndarray, closes: np.ndarray, name: str, *args, frame: pd.DataFrame,
+            data_key: str | None = None, **params):
+        """存入已算好的指標 (例如子行程從共享記憶體取得的欄位)，之後同一份資料的 get 直接命中"""
+        data_key = data_key or data_fingerprint(dates, closes)
+        key = (data_key, name, resolve_params(name, args, params))
+        self._lru.pop(key, None)
+        self.memo(key, lambda: _cache_entry(dates, closes, frame, data_key))
+
+    def _extend(self, entry, dates, closes, data_key, spec, params) -> dict | None:
+        """只計算新增的 K 棒；歷史不是單純在尾端延伸時回傳 None"""
+        n = len(entry['closes'])
+        if n == 0 or len(closes) <= n:
+            return None
+        if not (np.array_equal(entry['closes'], closes[:n]) and np.array_equal(entry['dates'], dates[:n])):
+            return None
+
+        state, buffer = entry['state'], entry['buffer']
+        if state is None:
+            shared = SharedIntermediates(self, entry['data_key'], entry['closes'])
+            state, buffer = spec['stream'](**params).seed(shared, entry['frame']), None
+        # 狀態與緩衝區轉交給新的結果；舊結果之後若再被延伸，會重新由批次結果建立
+        entry['state'] = entry['buffer'] = None
+
+        frame = entry['frame']
+        if buffer is None or len(buffer) < len(closes):
+            grown = np.empty((max(2 * len(closes), 64), frame.shape[1]))
+            grown[:n] = frame.to_numpy(dtype=np.float64) if buffer is None else buffer[:n]
+            buffer = grown
+        for i in range(n, len(closes)):
+            buffer[i] = state.update(float(closes[i]))
+
+        # 各結果的 frame 只涵蓋自己的列數，之後寫入緩衝區尾端不影響已回傳的 frame
+        frame = pd.DataFrame(buffer[:len(closes)], columns=frame.columns, copy=False)
+        return _cache_entry(dates, closes, frame, data_key, state, buffer)
+
+    def clear(self):
+        self._lru.clear()
+        self._latest.clear()
+
+# 行程內共用的指標快取 (與 st.cache_data 一樣跨 Session 共用)
+indicator_cache = IndicatorCache()
+
+class LazyIndicators:
+    """
+    單一回測視窗的指標存取介面：指標在第一次被要求 (圖表或策略) 時才以完整歷史計算，
+    回傳的 DataFrame 已切齊視窗，索引與 core_data 相同 (0 ~ 視窗長度-1)。
+    參數可用位置或關鍵字指定，例如 get('MA', 50)、get('RSI', window=7)、get('BBands', 20, 2.5)。
+    """
+
+    def __init__(self, ticker: str | None, history: pd.DataFrame, start: int = 0, stop: int | None = None,
+                 cache: IndicatorCache | None = None):
+        self.ticker = ticker.upper() if ticker else None
+        self.dates = history['Date'].to_numpy()
+        self.closes = history['Close'].to_numpy(dtype=np.float64)
+        self.data_key = data_fingerprint(self.dates, self.closes)
+        self.start = start
+        self.stop = stop if stop is not None else len(history)
+        self.cache = cache if cache is not None else indicator_cache
+        self._views = {}
+
+    def get(self, name: str, *args, **params) -> pd.DataFrame:
+        param_key = resolve_params(name, args, params)
+        view = self._views.get((name, param_key))
+        if view is None:
+            full = self.cache.get(self.ticker, self.dates, self.closes, name,
+                                  data_key=self.data_key, **dict(param_key))
+            view = full.iloc[self.start:self.stop].reset_index(drop=True)
+            self._views[(name, param_key)] = view
+        return view
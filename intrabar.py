@@ -0,0 +1,110 @@
+# intrabar.py
+# 盤中路徑模型：決定同一根 K 棒內掛單成交、強平、止損與止盈的先後順序
+# 有較細週期的 K 棒時以其串接成路徑，否則以 O→H→L→C / O→L→H→C 推估；路徑一次以 NumPy 建好，逐根查詢只做切片
+
+import numpy as np
+import pandas as pd
+from price_cache import PriceCache
+from resample import MINUTE_NS, interval_minutes
+
+# --- 路徑建構 ---
+
+def ohlc_points(opens, highs, lows, closes) -> np.ndarray:
+    """
+    每根 K 棒的四個路徑點 (n, 4)：開盤 -> 先到的極值 -> 後到的極值 -> 收盤。
+    離開盤價較近的極值視為先到；距離相同時，收紅 (Close >= Open) 先到低點、收黑先到高點。
+    """
+    opens, highs, lows, closes = (np.asarray(a, dtype=np.float64) for a in (opens, highs, lows, closes))
+    up, down = highs - opens, opens - lows
+    high_first = (up < down) | ((up == down) & (closes < opens))
+    return np.column_stack([opens, np.where(high_first, highs, lows), np.where(high_first, lows, highs), closes])
+
+class IntrabarPaths:
+    """
+    各 K 棒的盤中價格路徑，以扁平陣列 points 與起點 starts 存放 (第 i 根為 points[starts[i]:starts[i + 1]])。
+    路徑點之間視為線性移動；slice 與原物件共用 points，不複製資料。
+    """
+
+    def __init__(self, points: np.ndarray, starts: np.ndarray):
+        self.points = points
+        self.starts = starts
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def path(self, index: int) -> np.ndarray:
+        return self.points[self.starts[index]:self.starts[index + 1]]
+
+    def slice(self, start: int, stop: int) -> 'IntrabarPaths':
+        """第 start ~ stop-1 根 K 棒的路徑 (索引重新由 0 起算)"""
+        return IntrabarPaths(self.points, self.starts[start:stop + 1])
+
+def ohlc_paths(prices: PriceCache) -> IntrabarPaths:
+    """只有 OHLC 時的推估路徑 (每根四個點)"""
+    points = ohlc_points(prices.opens, prices.highs, prices.lows, prices.closes)
+    return IntrabarPaths(points.ravel(), np.arange(len(points) + 1) * 4)
+
+def fine_paths(prices: PriceCache, fine: pd.DataFrame, interval: str) -> IntrabarPaths:
+    """
+    以較細週期的 K 棒 fine 串接出 prices (interval 週期) 各根的路徑：每根細 K 棒以 ohlc_points 展開，
+    依時間落入 [Date, Date + interval) 的粗 K 棒。細 K 棒的開盤價與高低點需與粗 K 棒一致 (完整涵蓋該根)，
+    否則 (例如細週期資料只有近期、或第一天只涵蓋半天) 改用粗 K 棒自身的推估路徑。
+    """
+    n = len(prices)
+    dates = prices.dates.astype('datetime64[ns]').view('i8')
+    fine_dates = fine['Date'].to_numpy(dtype='datetime64[ns]').view('i8')
+    bar = np.searchsorted(dates, fine_dates, side='right') - 1
+    valid = bar >= 0
+    valid[valid] = fine_dates[valid] < dates[bar[valid]] + interval_minutes(interval) * MINUTE_NS
+    fine_bar = bar[valid]
+    detailed = ohlc_points(*(fine[col].to_numpy()[valid] for col in ('Open', 'High', 'Low', 'Close')))
+
+    # 細 K 棒依時間排序，同一根粗 K 棒的細 K 棒相鄰，以 reduceat 一次算出各組的開盤價與高低點
+    covered = np.zeros(n, dtype=bool)
+    if len(fine_bar):
+        groups = np.flatnonzero(np.r_[True, fine_bar[1:] != fine_bar[:-1]])
+        owners = fine_bar[groups]
+        covered[owners] = (np.isclose(detailed[groups, 0], prices.opens[owners])
+                           & np.isclose(np.maximum.reduceat(detailed.max(axis=1), groups), prices.highs[owners])
+                           & np.isclose(np.minimum.reduceat(detailed.min(axis=1), groups), prices.lows[owners]))
+        keep = covered[fine_bar]
+        fine_bar, detailed = fine_bar[keep], detailed[keep]
+    coarse = ohlc_points(prices.opens, prices.highs, prices.lows, prices.closes)
+
+    owner = np.r_[fine_bar, np.flatnonzero(~covered)]
+    order = np.argsort(owner, kind='stable')  # 同一根 K 棒內維持細 K 棒的時間順序
+    rows = np.concatenate([detailed, coarse[~covered]])[order]
+    owner = owner[order]
+    rows = np.clip(rows, prices.lows[owner, None], prices.highs[owner, None])
+    starts = np.r_[0, np.cumsum(np.bincount(owner, minlength=n) * 4)]
+    return IntrabarPaths(rows.ravel(), starts)
+
+def build_intrabar(prices: PriceCache, fine: pd.DataFrame | None = None,
+                   interval: str | None = None) -> IntrabarPaths:
+    """有 fine (與 prices 的週期 interval) 時使用細 K 棒路徑，否則使用 OHLC 推估路徑"""
+    if fine is None or fine.empty: return ohlc_paths(prices)
+    return fine_paths(prices, fine, interval)
+
+# --- 觸價時間 ---
+
+def first_touch(path: np.ndarray, levels, is_upper, after: float = 0.0) -> np.ndarray:
+    """
+    各價位在路徑上第一次被觸及的時間 (路徑點索引，點之間線性內插)，只考慮 after 之後的部分；未觸及為 inf。
+    上緣價位在價格 >= 價位時觸及，下緣在價格 <= 價位時觸及。所有價位一次以 NumPy 計算。
+    """
+    levels = np.asarray(levels, dtype=np.float64)
+    sign = np.where(np.asarray(is_upper, dtype=bool), 1.0, -1.0)
+
+    i = min(int(after), len(path) - 1)
+    start = path[i] if i + 1 >= len(path) else path[i] + (path[i + 1] - path[i]) * (after - i)
+    points = np.r_[start, path[i + 1:]]
+    times = np.r_[after, np.arange(i + 1, len(path), dtype=np.float64)]
+
+    reached = (points[None, :] - levels[:, None]) * sign[:, None] >= 0
+    j = reached.argmax(axis=1)
+    hit = reached[np.arange(len(levels)), j]
+    prev = np.maximum(j - 1, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = (levels - points[prev]) / (points[j] - points[prev])
+        touched = np.where(j > 0, times[prev] + weight * (times[j] - times[prev]), after)
+    return np.where(hit, touched, np.inf)
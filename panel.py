@@ -0,0 +1,391 @@
+# panel.py
+# 多資產投資組合回測：把多個代碼 (股票 / 匯率 / 加密貨幣) 對齊成同一條日期軸的欄式面板，
+# 每個資產沿用 SimulationEngine 的保證金、掛單、SL/TP 與強平規則，但共用同一筆現金；對齊與逐 K 棒估值皆跨資產向量化
+# 用法：engine = PanelEngine(load_panel(['TSLA', 'NVDA', 'BTC-USD', 'JPY=X']))
+
+import numpy as np
+import pandas as pd
+import config
+from data_sources import load_ohlcv
+from price_cache import PriceCache, OHLCV_COLUMNS, OPEN, HIGH, LOW, CLOSE
+from engine import SimulationEngine, Portfolio
+from equity_ledger import EquityLedger
+from analytics import analyze, trade_stats
+
+def guess_asset_type(ticker: str) -> str:
+    """依 Yahoo Finance 代碼慣例判斷資產類型：'=X' 結尾為匯率、'-USD' 結尾為加密貨幣，其餘為股票"""
+    ticker = ticker.upper()
+    if ticker.endswith('=X'): return 'Forex'
+    if ticker.endswith('-USD'): return 'Crypto'
+    return 'Stock'
+
+# --- 對齊面板 ---
+
+def _normalize_dates(data: pd.DataFrame) -> pd.DataFrame:
+    """日期去除時區並取到日，同一天有多筆時保留最後一筆"""
+    dates = pd.to_datetime(data['Date'])
+    if dates.dt.tz is not None: dates = dates.dt.tz_localize(None)
+    data = data.assign(Date=dates.dt.normalize())
+    return data.drop_duplicates('Date', keep='last').sort_values('Date').reset_index(drop=True)
+
+class PricePanel:
+    """
+    多個代碼在共同日期軸 (各資產交易日的聯集) 上的欄式價格面板。
+    ohlcv 為 shape (5, 資產數, 天數) 的陣列，資產當天休市 (例如股票的週末) 時為 NaN；
+    traded[a, t] 表示資產 a 在第 t 天有 K 棒，bar_index[a, t] 為截至第 t 天該資產自己的 K 棒索引 (尚未開始時為 -1)。
+    mark_open / mark_close 為估值用價格：有交易時取當天開盤 / 收盤，休市時沿用最近一次收盤價。
+    first_valid 為所有資產都已有 K 棒的第一天，回測起點不可早於此日。
+    calendar 為只有日期的 PriceCache (OHLCV 為 0)，供資產曲線帳本與績效分析查詢日期。
+    """
+
+    def __init__(self, tickers: list[str], asset_types: list[str], dates: np.ndarray, ohlcv: np.ndarray, traded: np.ndarray):
+        self.tickers = list(tickers)
+        self.asset_types = list(asset_types)
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.ohlcv = ohlcv
+        self.traded = traded
+        self.bar_index = np.cumsum(traded, axis=1) - 1
+
+        # 最近一根有交易的欄位 (向前填補)，休市日的估值沿用該欄的收盤價
+        cols = np.arange(len(self.dates))
+        last = np.maximum.accumulate(np.where(traded, cols, 0), axis=1)
+        closes = ohlcv[CLOSE]
+        self.mark_close = np.take_along_axis(closes, last, axis=1)
+        self.mark_open = np.where(traded, ohlcv[OPEN], self.mark_close)
+        self.first_valid = int(np.argmax(traded, axis=1).max()) if len(self.dates) else 0
+        self.calendar = PriceCache(np.zeros((len(OHLCV_COLUMNS), len(self.dates))), self.dates)
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def n_assets(self) -> int:
+        return len(self.tickers)
+
+    @property
+    def periods_per_year(self) -> int:
+        """日期軸的年化期數，以交易日最多的資產類型為準 (含加密貨幣時為 365)"""
+        return max(config.ASSET_CONFIGS[t]['periods_per_year'] for t in self.asset_types)
+
+    def asset_frame(self, a: int) -> pd.DataFrame:
+        """資產 a 自己交易日的 Date/OHLCV DataFrame (索引與 bar_index 相同)"""
+        cols = np.flatnonzero(self.traded[a])
+        frame = {col: self.ohlcv[i, a, cols] for i, col in enumerate(OHLCV_COLUMNS)}
+        return pd.DataFrame({'Date': self.dates[cols], **frame})
+
+def build_panel(frames: dict[str, pd.DataFrame], asset_types: dict[str, str] | None = None) -> PricePanel:
+    """
+    將多個代碼的日線 DataFrame 對齊成 PricePanel。
+    日期軸涵蓋所有資產都有資料的期間 (最晚開始到最早結束)，並往前多取每個資產在期間開始前的最後一根，
+    讓期間第一天就有各資產的估值價格。
+    asset_types 未提供的代碼以 guess_asset_type 判斷。
+    """
+    if not frames:
+        raise ValueError("至少需要一個代碼")
+    tickers = [t.upper() for t in frames]
+    asset_types = {k.upper(): v for k, v in (asset_types or {}).items()}
+    types = [asset_types.get(t) or guess_asset_type(t) for t in tickers]
+    data = [_normalize_dates(df) for df in frames.values()]
+
+    asset_dates = [df['Date'].to_numpy(dtype='datetime64[ns]') for df in data]
+    start = max(d[0] for d in asset_dates)
+    end = min(d[-1] for d in asset_dates)
+    if start > end:
+        raise ValueError("各代碼的歷史資料沒有重疊的期間")
+
+    # 各資產保留的 K 棒範圍 [lo, hi)，日期軸為其聯集
+    spans = [(max(np.searchsorted(d, start, side='right') - 1, 0), np.searchsorted(d, end, side='right')) for d in asset_dates]
+    dates = np.unique(np.concatenate([d[lo:hi] for d, (lo, hi) in zip(asset_dates, spans)]))
+
+    n_assets, n_dates = len(tickers), len(dates)
+    ohlcv = np.full((len(OHLCV_COLUMNS), n_assets, n_dates), np.nan)
+    traded = np.zeros((n_assets, n_dates), dtype=bool)
+    for a, (df, d, (lo, hi)) in enumerate(zip(data, asset_dates, spans)):
+        cols = np.searchsorted(dates, d[lo:hi])
+        traded[a, cols] = True
+        for i, col in enumerate(OHLCV_COLUMNS):
+            ohlcv[i, a, cols] = df[col].to_numpy(dtype=np.float64)[lo:hi] if col in df.columns else 0.0
+    return PricePanel(tickers, types, dates, ohlcv, traded)
+
+def load_panel(tickers: list[str], source=None, asset_types: dict[str, str] | None = None) -> PricePanel:
+    """以 data_sources.load_ohlcv 載入多個代碼並對齊"""
+    frames = {}
+    for ticker in tickers:
+        data = load_ohlcv(ticker, source)
+        if data is None or data.empty:
+            raise ValueError(f"無法載入 {ticker} 的數據。")
+        frames[ticker] = data
+    return build_panel(frames, asset_types)
+
+# --- 共用現金的單一資產引擎 ---
+
+class SharedCashPortfolio(Portfolio):
+    """balance 直接讀寫 owner (PanelEngine) 的現金；持倉、掛單與彙總值仍由各資產各自維護"""
+
+    def __init__(self, owner):
+        self.owner = owner
+        super().__init__(owner.balance)
+
+    @property
+    def balance(self):
+        return self.owner.balance
+
+    @balance.setter
+    def balance(self, value):
+        self.owner.balance = value
+
+class AssetEngine(SimulationEngine):
+    """
+    PanelEngine 中單一資產的引擎，K 棒索引為該資產自己的交易日。
+    下單、掛單、SL/TP 與強平規則與 SimulationEngine 相同；總資產、破產判斷與資產曲線交由 PanelEngine 處理。
+    """
+
+    def __init__(self, owner, ticker: str, core_data: pd.DataFrame, asset_type: str, start_index: int):
+        super().__init__(core_data, asset_type=asset_type, start_index=start_index,
+                         initial_capital=owner.balance, fast_forward=False)
+        self.owner = owner
+        self.ticker = ticker
+        self.portfolio = SharedCashPortfolio(owner)
+
+    def _notify(self, text, msg_type):
+        self.owner._notify(f"[{self.ticker}] {text}", msg_type)
+
+    def get_current_asset_value(self):
+        return self.owner.get_current_asset_value()
+
+    def check_and_end_simulation(self, asset_value):
+        return self.owner.check_and_end_simulation(asset_value)
+
+    def step_bar(self):
+        """前進到下一根自己的 K 棒並處理掛單與 SL/TP，回傳是否有事件發生"""
+        self.current_sim_index += 1
+        if self.intrabar is not None: return self.process_intrabar_events()
+        order_triggered = self.check_pending_orders()
+        sltp_triggered = self.check_sl_tp_trigger()
+        return order_triggered or sltp_triggered
+
+# --- 多資產引擎 ---
+
+class PanelEngine:
+    """
+    多資產回測引擎：面板的每一天只推進當天有交易的資產，休市的資產不會成交也不會觸發 SL/TP。
+    現金由所有資產共用 (任一資產的保證金、手續費與損益都進出同一個 balance)。
+    總資產 = 現金 + Σ(圈存 + 標記價格 x 淨數量 + 常數項)，以各資產的彙總值與面板價格做矩陣運算，
+    與資產數、持倉筆數無關；快轉時整段區間一次算出。
+    """
+
+    def __init__(self, panel: PricePanel, start_index: int = config.INITIAL_OBSERVATION_DAYS,
+                 initial_capital: float = config.INITIAL_CAPITAL, fast_forward: bool = True):
+        if not panel.first_valid <= start_index < len(panel):
+            raise ValueError(f"start_index 需介於 {panel.first_valid} 與 {len(panel) - 1} 之間")
+        self.panel = panel
+        self.initial_capital = initial_capital
+        self.balance = initial_capital
+        self.fast_forward = fast_forward
+        self.last_event_msg = None
+
+        self.engines = [AssetEngine(self, ticker, panel.asset_frame(a), panel.asset_types[a], int(panel.bar_index[a, start_index]))
+                        for a, ticker in enumerate(panel.tickers)]
+        self.engine_map = dict(zip(panel.tickers, self.engines))
+
+        self.current_sim_index = start_index
+        self.max_sim_index = len(panel) - 1
+        self.sim_active = True
+        self.end_sim_index_on_settle = None
+        self.settlement_stats = None
+        self.start_date = panel.calendar.py_dates[start_index]
+        self.equity_history = EquityLedger(panel.calendar, start_index, initial_capital)
+
+    def _notify(self, text, msg_type):
+        self.last_event_msg = {'text': text, 'type': msg_type, 'mode': 'toast'}
+
+    def engine(self, ticker: str) -> AssetEngine:
+        return self.engine_map[ticker.upper()]
+
+    # --- 行情與資金 ---
+
+    def is_trading(self, ticker: str) -> bool:
+        """該資產今天是否開市"""
+        return bool(self.panel.traded[self.panel.tickers.index(ticker.upper()), self.current_sim_index])
+
+    def get_current_price(self, ticker: str) -> float:
+        """當天開盤價 (休市時為最近收盤價)"""
+        return float(self.panel.mark_open[self.panel.tickers.index(ticker.upper()), self.current_sim_index])
+
+    def _position_totals(self):
+        """各資產的淨數量 (向量) 與價格無關的部分 (圈存 + 常數項) 總和"""
+        net_qty = np.fromiter((e.portfolio.net_qty for e in self.engines), dtype=np.float64, count=len(self.engines))
+        offset = sum(e.portfolio.locked_funds + e.portfolio.value_offset for e in self.engines)
+        return net_qty, offset
+
+    def _equity_curve(self, start, stop):
+        """以目前持倉計算 [start, stop) 各天開盤的總資產"""
+        net_qty, offset = self._position_totals()
+        return self.balance + offset + net_qty @ self.panel.mark_open[:, start:stop]
+
+    def get_current_asset_value(self):
+        """計算當前總資產價值"""
+        if not self.sim_active or self.current_sim_index >= len(self.panel):
+            return self.balance
+        return float(self._equity_curve(self.current_sim_index, self.current_sim_index + 1)[0])
+
+    def check_and_end_simulation(self, asset_value):
+        """風險控制：破產檢測"""
+        if asset_value <= 0:
+            if self.sim_active:
+                self.settle_portfolio(force_end=True)
+                self._notify("🚨 風險控制警告！總資產歸零，模擬強制結束！", 'error')
+            return True
+        return False
+
+    # --- 交易 (休市的資產不接受新單) ---
+
+    def _open_engine(self, ticker: str) -> AssetEngine | None:
+        if not self.sim_active: return None
+        if not self.is_trading(ticker):
+            self._notify(f"🚫 {ticker.upper()} 今日休市，無法下單。", 'error')
+            return None
+        return self.engine(ticker)
+
+    def execute_trade(self, ticker: str, trade_mode_key: str, quantity: float, leverage: float = 1.0) -> bool:
+        """以當天開盤價市價開倉"""
+        engine = self._open_engine(ticker)
+        if engine is None: return False
+        return engine.execute_trade(trade_mode_key, quantity, engine.get_current_price(), leverage)
+
+    def place_limit_order(self, ticker: str, trade_mode_key: str, quantity: float, limit_price: float,
+                          leverage: float = 1.0, order_type: str = 'Limit') -> bool:
+        engine = self._open_engine(ticker)
+        if engine is None: return False
+        return engine.place_limit_order(trade_mode_key, quantity, limit_price, leverage, order_type)
+
+    def close_position_lot(self, ticker: str, pos_id: str, settle_qty: float, reason: str = '手動平倉') -> bool:
+        """以當天開盤價市價平倉"""
+        engine = self._open_engine(ticker)
+        if engine is None: return False
+        return engine.close_position_lot(pos_id, settle_qty, engine.get_current_price(), reason, mode='手動')
+
+    # --- 結算 ---
+
+    def settle_portfolio(self, force_end=False):
+        """結算所有資產 (force_end 時以收盤價平倉並退還掛單)"""
+        if not self.sim_active and not force_end: return
+        t = min(self.current_sim_index, self.max_sim_index)
+        if force_end: self.sim_active = False
+
+        marks = self.panel.mark_close[:, t] if force_end else self.panel.mark_open[:, t]
+        msg = "強制結算" if force_end else "手動全平"
+        for engine, price in zip(self.engines, marks):
+            for pos in engine.portfolio.positions:
+                engine.close_position_lot(pos.id, pos.qty, float(price), reason=msg, mode='自動結算')
+
+        if not force_end: return
+        for engine in self.engines:
+            for order in engine.portfolio.order_map.values():
+                self.balance += order.locked_funds
+            engine.portfolio.clear_orders()
+            engine.sim_active = False
+
+        self.end_sim_index_on_settle = t
+        final_asset = self.balance
+        total_pnl = final_asset - self.initial_capital
+        ledger = self.equity_history
+        transactions = sorted((r for e in self.engines for r in e.portfolio.transactions), key=lambda r: r.close_date)
+
+        self.settlement_stats = {
+            'final_asset': final_asset, 'total_pnl': total_pnl, 'roi': total_pnl / self.initial_capital * 100,
+            'start_date': self.start_date, 'end_date': self.panel.calendar.py_dates[t],
+            'peak_equity': ledger.peak, 'trough_equity': ledger.trough, 'max_drawdown': ledger.max_drawdown
+        }
+        self.settlement_stats.update(analyze(ledger.equity, transactions, self.panel.calendar, ledger.start_index,
+                                             self.panel.periods_per_year))
+        self.settlement_stats['by_asset'] = {
+            e.ticker: trade_stats(np.fromiter((r.net_pnl for r in e.portfolio.transactions), dtype=np.float64))
+            for e in self.engines
+        }
+
+    # --- 時間推進 ---
+
+    def _step(self):
+        """前進一天：只推進當天有交易的資產，回傳 (事件是否發生, 是否破產)"""
+        self.current_sim_index += 1
+        t = self.current_sim_index
+
+        event_triggered = False
+        for a in np.flatnonzero(self.panel.traded[:, t]):
+            if self.engines[a].step_bar(): event_triggered = True
+            if not self.sim_active: break  # 成交或強平後破產，已結算
+
+        total_asset_new = self.get_current_asset_value()
+        self.equity_history.append(total_asset_new)
+
+        is_bankrupt = self.check_and_end_simulation(total_asset_new) or not self.sim_active
+        return event_triggered, is_bankrupt
+
+    def advance_one_day(self):
+        """推進一天 (記錄資產變化)，回傳 (可否繼續, 事件是否發生)"""
+        if not self.sim_active: return False, False
+
+        if self.current_sim_index < self.max_sim_index:
+            event_triggered, is_bankrupt = self._step()
+            if is_bankrupt:
+                return False, True
+            return True, event_triggered
+        else:
+            self.settle_portfolio(force_end=True)
+            return False, True
+
+    def advance_multiple_days(self, days_to_advance):
+        """一次推進多天，遇到事件即停止"""
+        if not self.sim_active: return False, False
+
+        event_occurred = False
+        can_continue = True
+        remaining = days_to_advance
+
+        while remaining > 0:
+            if self.current_sim_index >= self.max_sim_index:
+                self.settle_portfolio(force_end=True)
+                can_continue = False
+                event_occurred = True
+                break
+
+            if self.fast_forward:
+                start = self.current_sim_index + 1
+                stop = min(start + remaining, self.max_sim_index + 1)
+                skipped = self._find_next_event_index(start, stop) - start
+                if skipped > 0:
+                    self._fast_forward(start, start + skipped)
+                    remaining -= skipped
+                    continue
+
+            event_triggered, is_bankrupt = self._step()
+            remaining -= 1
+            if event_triggered or is_bankrupt:
+                event_occurred = True
+                break
+
+        return can_continue, event_occurred
+
+    # --- 快轉 (Fast-Forward) ---
+
+    def _find_next_event_index(self, start, stop):
+        """在 [start, stop) 中找出第一天可能有任一資產觸發事件或破產，沒有則回傳 stop"""
+        if start >= stop: return stop
+
+        levels = np.array([e._trigger_levels() for e in self.engines], dtype=np.float64)
+        ohlcv = self.panel.ohlcv
+        # 休市日的 High/Low 為 NaN，比較結果為 False
+        with np.errstate(invalid='ignore'):
+            hit = ((ohlcv[HIGH, :, start:stop] >= levels[:, :1]) | (ohlcv[LOW, :, start:stop] <= levels[:, 1:])).any(axis=0)
+        hit |= self._equity_curve(start, stop) <= 0
+
+        first = int(np.argmax(hit))
+        return start + first if hit[first] else stop
+
+    def _fast_forward(self, start, stop):
+        """批次跳過 [start, stop) 區間：不觸發任何事件，只補齊資產曲線並同步各資產的 K 棒索引"""
+        self.equity_history.extend(self._equity_curve(start, stop))
+        self.current_sim_index = stop - 1
+        for engine, index in zip(self.engines, self.panel.bar_index[:, stop - 1]):
+            engine.current_sim_index = int(index)
@@ -0,0 +1,171 @@
+# prefetch.py
+# 批次預載：以有上限的執行緒池同時下載多個代碼的歷史 K 線並寫入本地資料庫 (OHLCVStore)
+# 所有執行緒共用一個權杖桶限速，暫時性錯誤 (逾時、連線失敗、HTTP 429 / 5xx) 以指數退避 + 隨機抖動重試
+# 用法：python prefetch.py TSLA NVDA BTC-USD JPY=X --file watchlist.txt --workers 16 --rate 8
+
+import argparse
+import random
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+import config
+from data_sources import DataSource, YFinanceSource, YahooChartSource, get_data_source
+from data_store import OHLCVStore
+from resample import base_interval
+
+# --- 限速 ---
+
+class RateLimiter:
+    """
+    權杖桶 (token bucket)：平均每秒 rate 次、最多連續 burst 次，可跨執行緒共用。
+    acquire() 先預約權杖再於鎖外等待，等待中的執行緒不會互相阻擋。
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0: return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate
+        if wait > 0: time.sleep(wait)
+
+# --- 重試 ---
+
+def is_transient(error: Exception) -> bool:
+    """可重試的錯誤：逾時、連線問題、HTTP 429 與 5xx (其他 HTTP 錯誤與資料格式錯誤不重試)"""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, (urllib.error.URLError, TimeoutError, ConnectionError))
+
+def _retry_after(error: Exception) -> float | None:
+    """HTTP 429 / 503 回應的 Retry-After 秒數"""
+    headers = getattr(error, 'headers', None)
+    value = headers.get('Retry-After') if headers is not None else None
+    try: return float(value) if value is not None else None
+    except ValueError: return None
+
+class RetryingFetch:
+    """
+    包裝 DataSource.fetch：每次請求前先向限速器取得權杖，暫時性錯誤依指數退避重試。
+    attempts 記錄各代碼的請求次數 (含重試)。
+    """
+
+    def __init__(self, source: DataSource, limiter: RateLimiter | None = None,
+                 retries: int = config.PREFETCH_RETRIES, backoff: float = config.PREFETCH_BACKOFF):
+        self.source = source
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.attempts = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, ticker: str, start: pd.Timestamp | None = None,
+                 interval: str = config.DEFAULT_INTERVAL) -> pd.DataFrame | None:
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None: self.limiter.acquire()
+            with self._lock:
+                self.attempts[ticker] = self.attempts.get(ticker, 0) + 1
+            try:
+                return self.source.fetch(ticker, start, interval)
+            except Exception as e:
+                if attempt >= self.retries or not is_transient(e): raise
+                delay = self.backoff * 2 ** attempt * (0.5 + random.random())
+                time.sleep(max(delay, _retry_after(e) or 0.0))
+
+# --- 批次預載 ---
+
+def prefetch(tickers: list[str], source: DataSource | None = None, store: OHLCVStore | None = None,
+             max_workers: int = config.PREFETCH_WORKERS, rate: float = config.PREFETCH_RATE,
+             retries: int = config.PREFETCH_RETRIES, backoff: float = config.PREFETCH_BACKOFF,
+             interval: str = config.DEFAULT_INTERVAL, on_done=None) -> pd.DataFrame:
+    """
+    同時下載 tickers 並寫入本地資料庫 (已有資料的代碼只做增量更新)，回傳每個代碼一列的結果表：
+    ticker、status ('ok' / 'empty' / 'error')、bars、attempts、seconds、error。
+    非遠端來源 (合成 / 本地檔案) 不需快取，只會讀取一次確認可用。on_done(row) 於每個代碼完成時呼叫。
+    日內週期只下載並保存 base_interval(interval) 的基礎序列 (與 load_ohlcv 相同)。
+    yf.download 共用模組層級的狀態，無法在多執行緒中同時呼叫，因此 yfinance 來源改用 YahooChartSource (同一份資料)。
+    """
+    source = source if source is not None else get_data_source()
+    if isinstance(source, YFinanceSource): source = YahooChartSource()
+    store = store if store is not None else OHLCVStore()
+    fetch = RetryingFetch(source, RateLimiter(rate, burst=max(1, int(rate))), retries, backoff)
+    tickers = list(dict.fromkeys(t.strip().upper() for t in tickers if t.strip()))
+    base = base_interval(interval)
+
+    def load(ticker):
+        started = time.perf_counter()
+        row = {'ticker': ticker, 'status': 'ok', 'bars': 0, 'attempts': 0, 'seconds': 0.0, 'error': ''}
+        try:
+            if source.is_remote: data = store.refresh(ticker, lambda t, start: fetch(t, start, base), base)
+            else: data = fetch(ticker, None, base)
+            if data is None or data.empty: row['status'] = 'empty'
+            else: row['bars'] = len(data)
+        except Exception as e:
+            row['status'] = 'error'
+            row['error'] = f"{type(e).__name__}: {e}"
+        row['attempts'] = fetch.attempts.get(ticker, 0)
+        row['seconds'] = time.perf_counter() - started
+        return row
+
+    rows = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in as_completed([executor.submit(load, t) for t in tickers]):
+            row = future.result()
+            rows.append(row)
+            if on_done is not None: on_done(row)
+
+    order = {t: i for i, t in enumerate(tickers)}
+    rows.sort(key=lambda row: order[row['ticker']])
+    return pd.DataFrame(rows, columns=['ticker', 'status', 'bars', 'attempts', 'seconds', 'error'])
+
+def read_watchlist(path: str) -> list[str]:
+    """每行一個代碼 (可用逗號或空白分隔，# 之後為註解)"""
+    tickers = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            tickers.extend(line.split('#', 1)[0].replace(',', ' ').split())
+    return tickers
+
+def main():
+    parser = argparse.ArgumentParser(description="批次預載歷史 K 線至本地資料庫")
+    parser.add_argument('tickers', nargs='*')
+    parser.add_argument('--file', default=None, help="代碼清單檔 (每行一個代碼)")
+    parser.add_argument('--source', default=config.DATA_SOURCE, help="資料來源，例如 yfinance、yahoo、yahoo:http://127.0.0.1:8000")
+    parser.add_argument('--store', default=config.DATA_STORE_DIR, help="本地資料庫目錄")
+    parser.add_argument('--interval', choices=list(config.INTERVALS), default=config.DEFAULT_INTERVAL)
+    parser.add_argument('--workers', type=int, default=config.PREFETCH_WORKERS)
+    parser.add_argument('--rate', type=float, default=config.PREFETCH_RATE, help="每秒最多請求數 (0 代表不限速)")
+    parser.add_argument('--retries', type=int, default=config.PREFETCH_RETRIES)
+    parser.add_argument('--backoff', type=float, default=config.PREFETCH_BACKOFF)
+    args = parser.parse_args()
+
+    tickers = list(dict.fromkeys(t.upper() for t in args.tickers + (read_watchlist(args.file) if args.file else [])))
+    if not tickers:
+        parser.error("請指定代碼或 --file")
+
+    started = time.perf_counter()
+    done = []
+
+    def progress(row):
+        done.append(row)
+        detail = f"{row['bars']} 根" if row['status'] == 'ok' else row['error'] or row['status']
+        print(f"[{len(done)}/{len(tickers)}] {row['ticker']:<10} {row['status']:<6} {detail} ({row['attempts']} 次, {row['seconds']:.1f}s)")
+
+    report = prefetch(tickers, get_data_source(args.source), OHLCVStore(args.store), args.workers, args.rate,
+                      args.retries, args.backoff, args.interval, on_done=progress)
+    counts = report['status'].value_counts().to_dict()
+    print(f"完成 {len(report)} 個代碼，耗時 {time.perf_counter() - started:.1f}s：{counts}")
+
+if __name__ == '__main__':
+    main()
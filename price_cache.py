@@ -0,0 +1,60 @@
+# price_cache.py
+# 欄式 (Columnar) 價格快取：一次把 OHLCV 與日期轉成 NumPy 陣列，供逐 K 棒查詢使用
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# --- 欄位索引 ---
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(5)
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+class PriceCache:
+    """
+    OHLCV 以 shape (5, n) 的連續 float64 陣列儲存，每個欄位各自連續，
+    方便單點查詢與整段向量化掃描；日期同時保留 datetime64 與 Python datetime 兩種形式，
+    並預先建立圖表用的日期字串 (date_labels，日內 K 棒含時分) 與日期 -> 索引的對照表。
+    """
+
+    def __init__(self, ohlcv: np.ndarray, dates: np.ndarray):
+        self.ohlcv = np.ascontiguousarray(ohlcv, dtype=np.float64)
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.py_dates = pd.DatetimeIndex(self.dates).to_pydatetime()
+        intraday = bool((self.dates.view('i8') % (86400 * 10**9)).any())
+        self.date_labels = np.datetime_as_string(self.dates, unit='m' if intraday else 'D')
+        self.date_index = dict(zip(self.py_dates, range(len(self.py_dates))))
+
+        self.opens = self.ohlcv[OPEN]
+        self.highs = self.ohlcv[HIGH]
+        self.lows = self.ohlcv[LOW]
+        self.closes = self.ohlcv[CLOSE]
+        self.volumes = self.ohlcv[VOLUME]
+
+    def __len__(self):
+        return self.ohlcv.shape[1]
+
+    def get_price_info(self, index: int) -> tuple[datetime, float, float]:
+        """根據索引取得某一天的日期、開盤價與收盤價"""
+        if 0 <= index < len(self):
+            return self.py_dates[index], float(self.opens[index]), float(self.closes[index])
+        return datetime.now(), 0.0, 0.0
+
+    def index_of(self, date) -> int | None:
+        """日期 (datetime / Timestamp / datetime64 / 字串) 對應的 K 棒索引，查無回傳 None"""
+        index = self.date_index.get(date)
+        if index is None and not isinstance(date, datetime):
+            index = self.date_index.get(pd.Timestamp(date).to_pydatetime())
+        return index
+
+    def get_bar(self, index: int) -> tuple[float, float, float, float]:
+        """取得單根 K 棒的 (Open, High, Low, Close)"""
+        return (float(self.opens[index]), float(self.highs[index]),
+                float(self.lows[index]), float(self.closes[index]))
+
+def build_price_cache(data: pd.DataFrame) -> PriceCache:
+    """由含 Date/OHLCV 欄位的 DataFrame 建立價格快取"""
+    ohlcv = np.empty((len(OHLCV_COLUMNS), len(data)), dtype=np.float64)
+    for i, col in enumerate(OHLCV_COLUMNS):
+        ohlcv[i] = data[col].to_numpy(dtype=np.float64) if col in data.columns else 0.0
+    dates = pd.to_datetime(data['Date']).to_numpy(dtype='datetime64[ns]')
+    return PriceCache(ohlcv, dates)
@@ -0,0 +1,90 @@
+# records.py
+# 持倉、掛單與成交紀錄的資料結構：__slots__ dataclass，交易模式的類型與方向於建立時解析一次
+# 介面表格可用 to_frame 轉為 DataFrame
+
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+import pandas as pd
+import config
+
+def _resolve_mode(record, trade_mode_key):
+    mode_info = config.TRADE_MODE_MAP.get(trade_mode_key, {})
+    record.is_margin = mode_info.get('type') == 'Margin'
+    record.direction = mode_info.get('direction', 'Long')
+    record.is_long = record.direction == 'Long'
+
+class _Record:
+    """共用的轉換函式 (dataclass 欄位 -> dict)"""
+    __slots__ = ()
+
+    def to_dict(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+@dataclass(slots=True)
+class Position(_Record):
+    """持倉 (同一筆開倉為一個 lot)"""
+    id: str
+    open_date: datetime
+    pos_mode_key: str
+    display_name: str
+    qty: float
+    initial_qty: float
+    cost: float
+    initial_cost: float
+    leverage: float = 1.0
+    liquidation_price: float = 0.0
+    sl: float = 0.0
+    tp: float = 0.0
+    total_open_fee: float = 0.0
+    is_margin: bool = field(init=False, default=False)
+    direction: str = field(init=False, default='Long')
+    is_long: bool = field(init=False, default=True)
+
+    def __post_init__(self):
+        _resolve_mode(self, self.pos_mode_key)
+
+@dataclass(slots=True)
+class PendingOrder(_Record):
+    """限價 / 停損掛單 (locked_funds 為下單時圈存的保證金與手續費)"""
+    id: str
+    trade_mode_key: str
+    display_name: str
+    order_type: str
+    qty: float
+    price: float
+    leverage: float = 1.0
+    created_at: int = 0
+    locked_funds: float = 0.0
+    is_margin: bool = field(init=False, default=False)
+    direction: str = field(init=False, default='Long')
+    is_long: bool = field(init=False, default=True)
+
+    def __post_init__(self):
+        _resolve_mode(self, self.trade_mode_key)
+
+@dataclass(slots=True)
+class TradeRecord(_Record):
+    """已平倉的成交紀錄 (部分平倉各自一筆)"""
+    id: str
+    asset: str
+    mode_key: str
+    mode_name: str
+    type_display: str
+    leverage: float
+    direction: str
+    open_date: datetime
+    close_date: datetime
+    qty: float
+    open_price: float
+    close_price: float
+    pnl: float
+    fees: float
+    net_pnl: float
+    reason: str
+
+def to_frame(records, columns: list[str] | None = None) -> pd.DataFrame:
+    """將紀錄列表轉為 DataFrame (每個欄位一欄)；columns 可只取部分欄位"""
+    records = list(records)
+    if columns is None:
+        columns = [f.name for f in fields(records[0])] if records else []
+    return pd.DataFrame({col: [getattr(r, col) for r in records] for col in columns})
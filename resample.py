@@ -0,0 +1,77 @@
+# resample.py
+# K 棒週期工具與 OHLCV 重新取樣：以最細的基礎序列 (例如 5 分 K) 向量化彙總出較粗的週期 (15 分、30 分、日 K)
+
+import math
+import numpy as np
+import pandas as pd
+import config
+
+MINUTE_NS = 60 * 10**9
+DAY_NS = 1440 * MINUTE_NS
+
+# --- 週期 ---
+
+def interval_minutes(interval: str) -> int:
+    if interval not in config.INTERVALS:
+        raise ValueError(f"不支援的 K 棒週期: {interval} (可用: {', '.join(config.INTERVALS)})")
+    return config.INTERVALS[interval]
+
+def is_intraday(interval: str) -> bool:
+    return interval_minutes(interval) < 1440
+
+def base_interval(interval: str) -> str:
+    """
+    實際下載並保存的基礎週期：回溯天數不少於 interval、且能整除 interval 的最細週期
+    (例如 15m / 30m -> 5m，1h 回溯較長因此維持 1h，日 K 維持 1d)。
+    """
+    minutes = interval_minutes(interval)
+    if not is_intraday(interval): return interval
+    days = config.INTRADAY_HISTORY_DAYS.get(interval, 0)
+    candidates = [i for i, m in config.INTERVALS.items()
+                  if m <= minutes and minutes % m == 0 and config.INTRADAY_HISTORY_DAYS.get(i, 0) >= days]
+    return min(candidates, key=config.INTERVALS.get, default=interval)
+
+def bars_per_year(asset_type: str, interval: str = config.DEFAULT_INTERVAL) -> int:
+    """年化用的每年 K 棒數：交易日數 x 每個交易日的 K 棒數"""
+    conf = config.ASSET_CONFIGS[asset_type]
+    if not is_intraday(interval): return conf['periods_per_year']
+    return conf['periods_per_year'] * math.ceil(conf['session_minutes'] / interval_minutes(interval))
+
+# --- 重新取樣 ---
+
+def session_offset(dates: np.ndarray, minutes: int) -> int:
+    """
+    日內分桶的對齊位移 (奈秒)：取最常見的每日第一根 K 棒時間，對 minutes 取餘數，
+    例如美股 09:30 開盤時 1h K 棒為 09:30、10:30 ...，與資料源的小時線相同。
+    """
+    ns = np.asarray(dates, dtype='datetime64[ns]').view('i8')
+    if len(ns) == 0: return 0
+    day = ns // DAY_NS
+    firsts = ns[np.r_[True, day[1:] != day[:-1]]] % DAY_NS
+    values, counts = np.unique(firsts, return_counts=True)
+    return int(values[np.argmax(counts)] % (minutes * MINUTE_NS))
+
+def resample_ohlcv(data: pd.DataFrame, interval: str, offset: int | None = None) -> pd.DataFrame:
+    """
+    將依時間排序的 Date/OHLCV DataFrame 彙總成 interval 週期：Open 取第一根、High/Low 取極值、Close 取最後一根、Volume 加總。
+    以整數分桶 + reduceat 一次完成，不經過 pandas groupby；日內週期的分桶起點依 session_offset 對齊
+    (offset 可直接指定奈秒位移)，日 K 以日期分桶。Date 為各桶的起始時間。
+    """
+    if data.empty: return data.copy()
+    dates = data['Date'].to_numpy(dtype='datetime64[ns]')
+    ns = dates.view('i8')
+    step = interval_minutes(interval) * MINUTE_NS
+    if offset is None: offset = session_offset(dates, interval_minutes(interval)) if step < DAY_NS else 0
+    buckets = (ns - offset) // step * step + offset
+
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(ns)] - 1
+    columns = {col: data[col].to_numpy(dtype=np.float64) for col in ('Open', 'High', 'Low', 'Close', 'Volume')}
+    return pd.DataFrame({
+        'Date': buckets[starts].view('datetime64[ns]'),
+        'Open': columns['Open'][starts],
+        'High': np.maximum.reduceat(columns['High'], starts),
+        'Low': np.minimum.reduceat(columns['Low'], starts),
+        'Close': columns['Close'][ends],
+        'Volume': np.add.reduceat(columns['Volume'], starts),
+    })
@@ -0,0 +1,211 @@
+# strategy.py
+# 策略外掛介面：Strategy.on_bar(bar, indicators, portfolio) 回傳下單指令，由 StrategyRunner 交給 SimulationEngine 執行
+# 成交、掛單、SL/TP 與強平一律沿用引擎的既有規則，與手動操作完全相同
+
+import math
+import config
+from engine import SimulationEngine, Portfolio
+
+# --- 下單指令 ---
+# 指令為 dict，以 'action' 區分；建議使用以下函式建立
+
+def market_order(trade_mode_key: str, qty: float, leverage: float = 1.0) -> dict:
+    """市價開倉 (以下一根 K 棒開盤價成交)"""
+    return {'action': 'market', 'trade_mode_key': trade_mode_key, 'qty': qty, 'leverage': leverage}
+
+def limit_order(trade_mode_key: str, qty: float, price: float, leverage: float = 1.0, order_type: str = 'Limit') -> dict:
+    """限價 / 停損掛單 (order_type 為 'Limit' 或 'Stop')"""
+    return {'action': 'limit', 'trade_mode_key': trade_mode_key, 'qty': qty, 'price': price,
+            'leverage': leverage, 'order_type': order_type}
+
+def close_position(pos_id: str | None = None, qty: float | None = None, trade_mode_key: str | None = None) -> dict:
+    """市價平倉：指定 pos_id，或平掉 trade_mode_key (未指定則全部) 的所有部位；qty 為 None 代表全部"""
+    return {'action': 'close', 'pos_id': pos_id, 'qty': qty, 'trade_mode_key': trade_mode_key}
+
+def cancel_order(order_id: str) -> dict:
+    """取消掛單"""
+    return {'action': 'cancel', 'order_id': order_id}
+
+def set_sl_tp(pos_id: str, sl: float = 0.0, tp: float = 0.0) -> dict:
+    """設定部位的止損/止盈 (0 代表不設定)"""
+    return {'action': 'sl_tp', 'pos_id': pos_id, 'sl': sl, 'tp': tp}
+
+# --- 策略介面 ---
+
+class Strategy:
+    """
+    策略基底類別。每根可交易 K 棒開盤前呼叫一次 on_bar，參數為：
+    bar：最近一根已收盤的 K 棒 {'index', 'date', 'open', 'high', 'low', 'close', 'volume'}
+    indicators：BarIndicators，只能看到 bar (含) 以前的指標值
+    portfolio：唯讀的 Portfolio (部位、掛單、餘額)
+    回傳下單指令列表 (可為空或 None)，於下一根 K 棒開盤執行。
+    """
+
+    def on_start(self, engine: SimulationEngine):
+        """回測開始前呼叫 (可在此重設狀態或預先計算)"""
+
+    def on_bar(self, bar: dict, indicators: 'BarIndicators', portfolio: Portfolio) -> list[dict] | None:
+        raise NotImplementedError
+
+    def required_indicators(self) -> list[tuple]:
+        """策略會用到的指標 [(名稱, 參數...)]，參數掃描時預先計算並放入共享記憶體 (可不實作)"""
+        return []
+
+class BarIndicators:
+    """
+    策略用的指標存取介面，包裝 LazyIndicators 並擋住未來資料。
+    get(...) 回傳截至目前 K 棒的 DataFrame；latest(...) 回傳目前 K 棒的 {欄位: 值}。
+    """
+
+    def __init__(self, indicators):
+        self.indicators = indicators
+        self.index = -1
+        self._columns = {}
+
+    def get(self, name: str, *args, **params):
+        return self.indicators.get(name, *args, **params).iloc[:self.index + 1]
+
+    def latest(self, name: str, *args, **params) -> dict:
+        key = (name, args, tuple(sorted(params.items())))
+        columns = self._columns.get(key)
+        if columns is None:
+            frame = self.indicators.get(name, *args, **params)
+            columns = {col: frame[col].to_numpy() for col in frame.columns}
+            self._columns[key] = columns
+        return {col: float(values[self.index]) for col, values in columns.items()}
+
+# --- 執行器 ---
+
+class StrategyRunner:
+    """以策略驅動 SimulationEngine：每根 K 棒呼叫 on_bar、執行指令、再推進一天，直到結算"""
+
+    def __init__(self, engine: SimulationEngine, strategy: Strategy):
+        if engine.indicators is None:
+            raise ValueError("SimulationEngine 需提供 indicators (LazyIndicators) 才能執行策略")
+        self.engine = engine
+        self.strategy = strategy
+        self.bar_indicators = BarIndicators(engine.indicators)
+        self.orders_accepted = 0
+        self.orders_rejected = 0
+        self._started = False
+
+    def _bar(self, index: int) -> dict:
+        prices = self.engine.prices
+        return {
+            'index': index, 'date': prices.py_dates[index],
+            'open': float(prices.opens[index]), 'high': float(prices.highs[index]),
+            'low': float(prices.lows[index]), 'close': float(prices.closes[index]),
+            'volume': float(prices.volumes[index]),
+        }
+
+    def execute(self, order: dict) -> bool:
+        """執行單一指令，回傳引擎是否接受"""
+        engine = self.engine
+        action = order['action']
+        if action == 'market':
+            return engine.execute_trade(order['trade_mode_key'], order['qty'], engine.get_current_price(), order.get('leverage', 1.0))
+        if action == 'limit':
+            return engine.place_limit_order(order['trade_mode_key'], order['qty'], order['price'],
+                                            order.get('leverage', 1.0), order.get('order_type', 'Limit'))
+        if action == 'close':
+            price = engine.get_current_price()
+            if order.get('pos_id'):
+                targets = [engine.portfolio.find_position(order['pos_id'])]
+            else:
+                mode_key = order.get('trade_mode_key')
+                targets = [p for p in engine.portfolio.positions if mode_key is None or p.pos_mode_key == mode_key]
+            ok = bool(targets) and None not in targets
+            for pos in targets:
+                if pos is None: continue
+                qty = order['qty'] if order.get('qty') is not None else pos.qty
+                ok = engine.close_position_lot(pos.id, qty, price, reason='策略平倉', mode='手動') and ok
+            return ok
+        if action == 'cancel':
+            if engine.portfolio.find_order(order['order_id']) is None: return False
+            engine.cancel_order(order['order_id'])
+            return True
+        if action == 'sl_tp':
+            return engine.set_sl_tp(order['pos_id'], order.get('sl', 0.0), order.get('tp', 0.0))
+        raise ValueError(f"未知的下單指令: {action}")
+
+    def step(self) -> bool:
+        """處理一根 K 棒 (策略決策 + 推進一天)，回傳是否可繼續"""
+        engine = self.engine
+        if not engine.sim_active: return False
+        if not self._started:
+            self.strategy.on_start(engine)
+            self._started = True
+
+        last_closed = engine.current_sim_index - 1
+        if last_closed >= 0:
+            self.bar_indicators.index = last_closed
+            orders = self.strategy.on_bar(self._bar(last_closed), self.bar_indicators, engine.portfolio)
+            for order in orders or []:
+                if not engine.sim_active: break
+                if self.execute(order): self.orders_accepted += 1
+                else: self.orders_rejected += 1
+
+        if not engine.sim_active: return False
+        can_continue, _ = engine.advance_one_day()
+        return can_continue
+
+    def run(self) -> dict | None:
+        """執行到回測結束，回傳 settlement_stats"""
+        while self.step():
+            pass
+        if self.engine.sim_active:
+            self.engine.settle_portfolio(force_end=True)
+        return self.engine.settlement_stats
+
+# --- 範例策略 ---
+
+class RSIReversion(Strategy):
+    """
+    RSI 均值回歸：RSI 低於 oversold 時以可用餘額做多並設定止損 / 止盈，高於 overbought 時平倉。
+    leverage 為 1 時買入現貨，大於 1 時以保證金做多 (止損價不高於強平價時改由強平出場)。
+    stop_loss / take_profit 為相對成本的比例，0 代表不設定。
+    """
+
+    def __init__(self, window: int = 14, oversold: float = 30.0, overbought: float = 70.0,
+                 stop_loss: float = 0.1, take_profit: float = 0.0, leverage: float = 1.0, fraction: float = 1.0):
+        self.window = window
+        self.oversold = oversold
+        self.overbought = overbought
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.leverage = leverage
+        self.fraction = fraction
+        self.mode_key = 'Margin_Long' if leverage > 1 else 'Spot_Buy'
+        self.min_qty = 1.0
+
+    def on_start(self, engine):
+        self.min_qty = config.ASSET_CONFIGS[engine.asset_type]['min_qty']
+
+    def required_indicators(self):
+        return [('RSI', self.window)]
+
+    def _protect(self, pos) -> dict | None:
+        sl = pos.cost * (1 - self.stop_loss) if self.stop_loss > 0 else 0.0
+        if sl <= pos.liquidation_price: sl = 0.0
+        tp = pos.cost * (1 + self.take_profit) if self.take_profit > 0 else 0.0
+        return set_sl_tp(pos.id, sl=sl, tp=tp) if sl or tp else None
+
+    def on_bar(self, bar, indicators, portfolio):
+        rsi = indicators.latest('RSI', self.window)['RSI']
+        if rsi != rsi: return None
+        positions = [p for p in portfolio.positions if p.pos_mode_key == self.mode_key]
+
+        if positions:
+            unprotected = [p for p in positions if p.sl == 0 and p.tp == 0]
+            orders = [o for o in map(self._protect, unprotected) if o is not None]
+            if rsi > self.overbought: orders.append(close_position(trade_mode_key=self.mode_key))
+            return orders
+
+        if rsi < self.oversold:
+            # 以收盤價估算可開數量 (含手續費 / 保證金並保留 1% 緩衝，避免跳空開高時餘額不足)
+            if self.mode_key == 'Spot_Buy': unit_cost = bar['close'] * (1 + config.FEE_RATE)
+            else: unit_cost = bar['close'] * (1 / self.leverage + config.LEVERAGE_FEE_RATE)
+            qty = portfolio.balance * self.fraction / (unit_cost * 1.01)
+            qty = math.floor(qty / self.min_qty) * self.min_qty
+            if qty > 0: return [market_order(self.mode_key, qty, self.leverage)]
+        return None
@@ -0,0 +1,276 @@
+# sweep.py
+# 參數掃描：以網格或隨機抽樣搜尋止損 / 止盈比例、槓桿與指標門檻，每組參數在同一批歷史區間上平行回測並彙整績效
+# OHLCV 與策略用到的指標只在主行程載入 / 計算一次並放入共享記憶體，子行程直接映射，派工時只傳送參數與區間起點
+# 用法：python sweep.py TSLA --windows 200 --seed 0 --grid stop_loss=0.05,0.1 take_profit=0,0.2 leverage=1,5,10 oversold=25,30
+
+import argparse
+import inspect
+import itertools
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import config
+from data_sources import load_ohlcv
+from indicators import INDICATOR_WARMUP_BARS, data_fingerprint, indicator_cache
+from backtest import STRATEGIES, run_window, sample_windows, summarize, rank
+
+OHLCV_COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+# 未指定 --grid 時各內建策略的預設參數空間
+DEFAULT_GRIDS = {
+    'buy_and_hold': ['fraction=0.5,1.0'],
+    'ma_cross': ['fast=10,20', 'slow=50,60'],
+    'rsi_reversion': ['stop_loss=0.05,0.1', 'leverage=1,5'],
+}
+
+# --- 參數空間 ---
+
+def _parse_value(text: str):
+    for cast in (int, float):
+        try: return cast(text)
+        except ValueError: pass
+    return text
+
+def parse_space(items: list[str]) -> dict[str, list]:
+    """
+    解析命令列的參數空間：'stop_loss=0.05,0.1' 為列舉值，'leverage=1:20:1' 為含終點的等差數列。
+    回傳 {參數: [候選值...]}。
+    """
+    space = {}
+    for item in items:
+        name, sep, values = item.partition('=')
+        if not sep or not values:
+            raise ValueError(f"參數格式應為 名稱=值1,值2 或 名稱=起點:終點:間隔: {item}")
+        if ':' in values:
+            start, stop, step = (_parse_value(v) for v in values.split(':'))
+            n = int(math.floor((stop - start) / step + 1e-9)) + 1
+            space[name] = [round(start + i * step, 10) for i in range(n)]
+        else:
+            space[name] = [_parse_value(v) for v in values.split(',')]
+    return space
+
+def check_space(strategy_cls, space: dict[str, list]):
+    """確認參數空間的名稱都是策略建構子接受的參數"""
+    accepted = [name for name in inspect.signature(strategy_cls).parameters if name != 'self']
+    unknown = [name for name in space if name not in accepted]
+    if unknown:
+        raise TypeError(f"{strategy_cls.__name__} 不接受參數: {', '.join(unknown)} (可用參數: {', '.join(accepted)})")
+
+def param_grid(space: dict[str, list]) -> list[dict]:
+    """參數空間的笛卡兒積 (網格搜尋)"""
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*space.values())]
+
+def random_params(space: dict[str, list], n: int, seed: int | None = None) -> list[dict]:
+    """從網格中不重複抽取 n 組 (隨機搜尋)；以編號解碼，不需先展開整個網格"""
+    keys = list(space)
+    sizes = [len(space[k]) for k in keys]
+    total = math.prod(sizes)
+    combos = []
+    for code in random.Random(seed).sample(range(total), min(n, total)):
+        combo = {}
+        for key, size in zip(reversed(keys), reversed(sizes)):
+            code, i = divmod(code, size)
+            combo[key] = space[key][i]
+        combos.append({k: combo[k] for k in keys})
+    return combos
+
+# --- 共享記憶體 ---
+
+class SharedArrays:
+    """
+    將多個 NumPy 陣列放進同一塊共享記憶體。spec 為可 pickle 的 (區塊名稱, [(鍵, dtype, shape, 位移)...])，
+    子行程以 attach(spec) 取得唯讀檢視 (不複製)；建立者用完後呼叫 close() 釋放。
+    """
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        layout, size = [], 0
+        for key, arr in arrays.items():
+            layout.append((key, arr.dtype.str, arr.shape, size))
+            size += -(-arr.nbytes // 64) * 64  # 每個陣列以 64 bytes 對齊
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.spec = (self.shm.name, layout)
+        for (key, dtype, shape, offset), arr in zip(layout, arrays.values()):
+            np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)[...] = arr
+
+    @staticmethod
+    def attach(spec) -> tuple[shared_memory.SharedMemory, dict[str, np.ndarray]]:
+        name, layout = spec
+        shm = shared_memory.SharedMemory(name=name)
+        views = {}
+        for key, dtype, shape, offset in layout:
+            view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            view.flags.writeable = False
+            views[key] = view
+        return shm, views
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def shared_inputs(history: pd.DataFrame, strategies) -> tuple[dict[str, np.ndarray], list[tuple]]:
+    """
+    收集要放進共享記憶體的陣列：OHLCV 各欄，以及各策略 required_indicators() 的完整歷史指標 (去除重複後只算一次)。
+    回傳 (陣列 dict, 指標清單 [(名稱, 參數, 欄位)...])，指標欄位的鍵為 'ind{序號}:{欄位}'。
+    """
+    arrays = {col: history[col].to_numpy() for col in OHLCV_COLUMNS}
+    dates, closes = arrays['Date'], history['Close'].to_numpy(dtype=np.float64)
+    data_key = data_fingerprint(dates, closes)
+
+    specs = []
+    for strategy in strategies:
+        for name, *args in getattr(strategy, 'required_indicators', lambda: [])():
+            if (name, tuple(args)) not in [(n, a) for n, a, _ in specs]:
+                frame = indicator_cache.get(None, dates, closes, name, *args, data_key=data_key)
+                for col in frame.columns:
+                    arrays[f'ind{len(specs)}:{col}'] = frame[col].to_numpy(dtype=np.float64)
+                specs.append((name, tuple(args), list(frame.columns)))
+    return arrays, specs
+
+# --- 子行程 ---
+
+_worker_state = {}
+
+def _load_worker(arrays, indicator_specs, strategy_cls, ticker, asset_type, interval):
+    """以 (共享) 陣列建立歷史 DataFrame，並把預先算好的指標存入本行程的指標快取"""
+    history = pd.DataFrame({col: arrays[col] for col in OHLCV_COLUMNS}, copy=False)
+    dates = history['Date'].to_numpy()
+    closes = history['Close'].to_numpy(dtype=np.float64)
+    data_key = data_fingerprint(dates, closes)
+    for i, (name, args, columns) in enumerate(indicator_specs):
+        frame = pd.DataFrame({col: arrays[f'ind{i}:{col}'] for col in columns}, copy=False)
+        indicator_cache.put(dates, closes, name, *args, frame=frame, data_key=data_key)
+    _worker_state.update(history=history, strategy_cls=strategy_cls, ticker=ticker, asset_type=asset_type,
+                         interval=interval)
+
+def _init_worker(spec, indicator_specs, strategy_cls, ticker, asset_type, interval):
+    shm, views = SharedArrays.attach(spec)
+    _worker_state['shm'] = shm  # 保持映射直到行程結束
+    _load_worker(views, indicator_specs, strategy_cls, ticker, asset_type, interval)
+
+def _run_task(combo_id: int, params: dict, starts: list[int]) -> tuple[int, list[dict]]:
+    s = _worker_state
+    strategy = s['strategy_cls'](**params)
+    return combo_id, [run_window(s['history'], start, strategy, s['ticker'], s['asset_type'], interval=s['interval'])
+                      for start in starts]
+
+# --- 掃描 ---
+
+def iter_sweep(ticker: str, combos: list[dict], strategy: str = 'rsi_reversion', n_windows: int = 100,
+               seed: int | None = None, step: int | None = None, asset_type: str = 'Stock',
+               history: pd.DataFrame | None = None, max_workers: int | None = None,
+               interval: str = config.DEFAULT_INTERVAL):
+    """
+    逐組產生 {參數..., summarize 結果...}，某組參數的所有區間跑完就立即產生 (依完成先後)。
+    所有參數組合使用同一批區間 (共同隨機數)，結果可直接比較；max_workers=1 時在本行程依序執行。
+    history 未提供時載入 interval 週期的 K 棒 (區間長度與 step 皆以 K 棒計)。
+    """
+    if history is None:
+        history = load_ohlcv(ticker, interval=interval)
+        if history is None:
+            raise ValueError(f"無法載入 {ticker} 的數據。")
+    history = history.reset_index(drop=True)
+    strategy_cls = STRATEGIES[strategy]
+
+    starts = sample_windows(len(history) - INDICATOR_WARMUP_BARS, n_windows, seed=seed, step=step)
+    if not starts or not combos: return
+    arrays, indicator_specs = shared_inputs(history, [strategy_cls(**params) for params in combos])
+
+    # 參數組合少於行程數時，再把區間切塊，讓每個行程都有工作
+    workers = max_workers or os.cpu_count() or 1
+    n_chunks = min(len(starts), max(1, -(-workers * 4 // len(combos))))
+    chunk_size = -(-len(starts) // n_chunks)
+    chunks = [starts[i:i + chunk_size] for i in range(0, len(starts), chunk_size)]
+    tasks = [(combo_id, params, chunk) for combo_id, params in enumerate(combos) for chunk in chunks]
+
+    remaining = dict.fromkeys(range(len(combos)), len(chunks))
+    rows = {combo_id: [] for combo_id in range(len(combos))}
+
+    def collect(results):
+        for combo_id, chunk_rows in results:
+            rows[combo_id].extend(chunk_rows)
+            remaining[combo_id] -= 1
+            if remaining[combo_id] == 0:
+                yield {**combos[combo_id], **summarize(pd.DataFrame(rows.pop(combo_id)))}
+
+    if max_workers == 1:
+        _load_worker(arrays, indicator_specs, strategy_cls, ticker, asset_type, interval)
+        yield from collect(_run_task(*task) for task in tasks)
+        return
+
+    shared = SharedArrays(arrays)
+    executor = None
+    try:
+        # 行程池啟動或派工失敗時也要釋放共享記憶體
+        executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                       initargs=(shared.spec, indicator_specs, strategy_cls, ticker, asset_type, interval))
+        futures = [executor.submit(_run_task, *task) for task in tasks]
+        yield from collect(future.result() for future in as_completed(futures))
+    finally:
+        if executor is not None: executor.shutdown(cancel_futures=True)
+        shared.close()
+
+def run_sweep(ticker: str, combos: list[dict], out: str | None = None, on_row=None, **kwargs) -> pd.DataFrame:
+    """
+    執行 iter_sweep 並回傳每組參數一列的結果表。指定 out 時邊跑邊寫入 CSV，
+    on_row(row, done) 於每組完成時呼叫 (例如顯示進度)。
+    """
+    results = []
+    f = open(out, 'w', newline='', encoding='utf-8') if out else None
+    try:
+        for row in iter_sweep(ticker, combos, **kwargs):
+            if f is not None:
+                pd.DataFrame([row]).to_csv(f, header=not results, index=False)
+                f.flush()
+            results.append(row)
+            if on_row is not None: on_row(row, len(results))
+    finally:
+        if f is not None: f.close()
+    return pd.DataFrame(results)
+
+def main():
+    parser = argparse.ArgumentParser(description="策略參數掃描")
+    parser.add_argument('ticker', nargs='?', default=config.DEFAULT_TICKER)
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='rsi_reversion')
+    parser.add_argument('--grid', nargs='+', default=None,
+                        help="參數空間，例如 stop_loss=0.05,0.1 leverage=1:20:1 (預設見 DEFAULT_GRIDS)")
+    parser.add_argument('--random', type=int, default=0, help="隨機抽取 N 組參數 (0 代表完整網格)")
+    parser.add_argument('--windows', type=int, default=100, help="每組參數的區間數 (逐段模式下為上限)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--step', type=int, default=None, help="逐段步進的間隔 (K 棒數)，不指定則隨機抽樣")
+    parser.add_argument('--asset-type', choices=sorted(config.ASSET_CONFIGS), default='Stock')
+    parser.add_argument('--interval', choices=list(config.INTERVALS), default=config.DEFAULT_INTERVAL,
+                        help="K 棒週期 (區間長度與 --step 皆以 K 棒計)")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default=None, help="結果 CSV 路徑 (邊跑邊寫入)")
+    parser.add_argument('--top', type=int, default=10, help="列出排名最佳的前 N 組參數")
+    parser.add_argument('--rank-by', default='sharpe_mean', help="排序欄位 (例如 sharpe_mean、roi_median、calmar_mean)")
+    args = parser.parse_args()
+
+    space = parse_space(args.grid or DEFAULT_GRIDS[args.strategy])
+    try:
+        check_space(STRATEGIES[args.strategy], space)
+    except TypeError as e:
+        parser.error(str(e))
+    combos = random_params(space, args.random, args.seed) if args.random else param_grid(space)
+    print(f"{len(combos)} 組參數 × {args.windows} 段區間")
+
+    def progress(row, done):
+        params = ', '.join(f"{k}={row[k]}" for k in space)
+        print(f"[{done}/{len(combos)}] {params}  roi_mean={row.get('roi_mean', math.nan):,.2f}"
+              f"  {args.rank_by}={row.get(args.rank_by, math.nan):,.2f}")
+
+    results = run_sweep(args.ticker, combos, out=args.out, on_row=progress, strategy=args.strategy,
+                        n_windows=args.windows, seed=args.seed, step=args.step, asset_type=args.asset_type,
+                        max_workers=args.workers, interval=args.interval)
+    if not results.empty:
+        columns = list(space) + ['windows', 'roi_mean', 'roi_median', 'mdd_mean', 'sharpe_mean', 'calmar_mean',
+                                 'trade_win_rate', 'bankruptcies']
+        print(rank(results, args.rank_by, args.top)[columns].to_string(index=False, float_format='{:,.2f}'.format))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+# conftest.py
+# 測試共用設定：讓測試可直接匯入專案根目錄的模組
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
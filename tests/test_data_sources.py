@@ -0,0 +1,41 @@
+# test_data_sources.py
+# Chart API 回應的解析：時間需依交易所時區換算為當地時間，跨越夏令時間切換時仍對齊開盤時刻
+
+import pandas as pd
+from data_sources import parse_chart_payload
+
+def _payload(timestamps: list[int], meta: dict) -> dict:
+    n = len(timestamps)
+    closes = [100.0 + i for i in range(n)]
+    return {'chart': {'result': [{
+        'meta': meta, 'timestamp': timestamps,
+        'indicators': {'quote': [{'open': closes, 'high': closes, 'low': closes, 'close': closes, 'volume': [1.0] * n}]},
+    }], 'error': None}}
+
+# 美股 2024-03-10 進入夏令時間：之前開盤為 14:30 UTC，之後為 13:30 UTC
+UTC_OPENS = ['2024-03-08 14:30', '2024-03-11 13:30', '2024-03-12 13:30']
+
+def _timestamps() -> list[int]:
+    return [int(pd.Timestamp(t, tz='UTC').timestamp()) for t in UTC_OPENS]
+
+def test_intraday_uses_exchange_timezone_across_dst():
+    # gmtoffset 只反映請求當下的偏移 (夏令時間 -4h)，不可套用到整段歷史
+    meta = {'gmtoffset': -14400, 'exchangeTimezoneName': 'America/New_York'}
+    data = parse_chart_payload(_payload(_timestamps(), meta), intraday=True)
+    assert list(data['Date']) == [pd.Timestamp('2024-03-08 09:30'), pd.Timestamp('2024-03-11 09:30'),
+                                  pd.Timestamp('2024-03-12 09:30')]
+    assert data['Date'].dt.tz is None
+
+def test_daily_dates_are_exchange_dates():
+    # 東京 (UTC+9) 的交易日在 UTC 仍是前一天
+    timestamps = [int(pd.Timestamp(t, tz='Asia/Tokyo').timestamp()) for t in ('2024-03-11 09:00', '2024-03-12 09:00')]
+    data = parse_chart_payload(_payload(timestamps, {'gmtoffset': 32400, 'exchangeTimezoneName': 'Asia/Tokyo'}))
+    assert list(data['Date']) == [pd.Timestamp('2024-03-11'), pd.Timestamp('2024-03-12')]
+
+def test_falls_back_to_gmtoffset_without_timezone_name():
+    data = parse_chart_payload(_payload(_timestamps()[:1], {'gmtoffset': -18000}), intraday=True)
+    assert data['Date'].iloc[0] == pd.Timestamp('2024-03-08 09:30')
+
+def test_empty_payload():
+    assert parse_chart_payload({'chart': {'result': None}}) is None
+    assert parse_chart_payload(_payload([], {})) is None
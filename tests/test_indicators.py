@@ -0,0 +1,104 @@
+# test_indicators.py
+# 串流指標與 Pandas 批次計算的逐位元比對 (含整段持平、四捨五入後的價格與前段為 NaN 的序列)，以及指標快取的增量延伸
+
+import numpy as np
+import pandas as pd
+import pytest
+from indicators import (RollingMean, RollingStd, RSI, BollingerBands, MACD, MovingAverages, IndicatorCache,
+                        calculate_ma, calculate_rsi, calculate_bollinger_bands, calculate_macd)
+
+def _walk(seed: int, n: int, decimals: int | None = None) -> np.ndarray:
+    closes = 100 + np.cumsum(np.random.default_rng(seed).standard_normal(n))
+    return closes if decimals is None else closes.round(decimals)
+
+def _flat() -> np.ndarray:
+    closes = _walk(0, 3000, 4)
+    closes[100:130] = closes[100]
+    return closes
+
+def _rounded() -> np.ndarray:
+    closes = _walk(1, 2000, 2)
+    rng = np.random.default_rng(2)
+    for start in rng.integers(0, 1900, 30):
+        closes[start:start + rng.integers(1, 40)] = closes[start]
+    return closes
+
+def _nan_led() -> np.ndarray:
+    closes = _walk(3, 500, 2)
+    closes[:15] = np.nan
+    closes[200] = np.nan
+    return closes
+
+SERIES = {'flat': _flat, 'rounded': _rounded, 'nan_led': _nan_led}
+
+def _assert_identical(streamed, expected):
+    streamed, expected = np.asarray(streamed, dtype=np.float64), np.asarray(expected, dtype=np.float64)
+    same = (streamed == expected) | (np.isnan(streamed) & np.isnan(expected))
+    assert same.all(), f'第一個不一致位置: {np.flatnonzero(~same)[0]}'
+
+# --- 滾動均值 / 標準差 ---
+
+@pytest.mark.parametrize('name', SERIES)
+@pytest.mark.parametrize('window', [2, 3, 20])
+def test_rolling_std_matches_pandas(name, window):
+    closes = SERIES[name]()
+    std = RollingStd(window)
+    _assert_identical([std.update(x) for x in closes], pd.Series(closes).rolling(window).std())
+
+@pytest.mark.parametrize('name', SERIES)
+@pytest.mark.parametrize('window', [2, 3, 20])
+def test_rolling_mean_matches_pandas(name, window):
+    closes = SERIES[name]()
+    mean = RollingMean(window)
+    _assert_identical([mean.update(x) for x in closes], pd.Series(closes).rolling(window).mean())
+
+def test_rolling_std_recovers_from_cancellation():
+    # 移除極大值後平方差和幾乎完全抵銷，需以視窗內的值重新累計才能得到 0.5
+    closes = [99999999999999999, 1, 1, 2, 3, 1, 1]
+    std = RollingStd(2)
+    _assert_identical([std.update(float(x)) for x in closes], pd.Series(closes, dtype=float).rolling(2).std())
+
+# --- 組合指標 ---
+
+@pytest.mark.parametrize('name', ['flat', 'rounded'])
+def test_streaming_indicators_match_batch(name):
+    closes = SERIES[name]()
+    data = pd.DataFrame({'Close': closes})
+    mas, rsi, bbands, macd = MovingAverages(), RSI(14), BollingerBands(20, 2.0), MACD(12, 26, 9)
+    rows = [mas.update(x) + (rsi.update(x),) + bbands.update(x) + macd.update(x) for x in closes]
+    expected = pd.concat([calculate_ma(data), calculate_rsi(data).rename('RSI'),
+                          calculate_bollinger_bands(data), calculate_macd(data)], axis=1)
+    _assert_identical(rows, expected.to_numpy())
+
+# --- 指標快取的增量延伸 ---
+
+def _dates(n: int) -> np.ndarray:
+    return pd.date_range('2000-01-01', periods=n).to_numpy()
+
+@pytest.mark.parametrize('series', ['flat', 'rounded'])
+@pytest.mark.parametrize('name, args', [('MA', ()), ('RSI', ()), ('BBands', ()), ('MACD', ()), ('BBands', (10, 2.5))])
+def test_cache_extension_matches_full_compute(series, name, args):
+    # flat 的持平區段 (第 100~129 根) 在延伸途中經過，滾動和與平方差和必須延續整段歷史的累計
+    closes = SERIES[series]()[:2000]
+    dates = _dates(len(closes))
+    cache = IndicatorCache()
+    cache.get('TEST', dates[:90], closes[:90], name, *args)
+    first = cache.get('TEST', dates[:91], closes[:91], name, *args)
+    snapshot = first.copy()
+    for n in range(92, len(closes) + 1):
+        extended = cache.get('TEST', dates[:n], closes[:n], name, *args)
+    expected = IndicatorCache().get(None, dates, closes, name, *args)
+
+    assert list(extended.columns) == list(expected.columns)
+    _assert_identical(extended.to_numpy(), expected.to_numpy())
+    # 之後的延伸寫入共用緩衝區尾端，不會改動先前回傳的結果
+    _assert_identical(first, snapshot)
+
+def test_cache_recomputes_when_last_bar_is_revised():
+    closes, dates = _rounded()[:300], _dates(300)
+    cache = IndicatorCache()
+    cache.get('TEST', dates[:299], closes[:299], 'BBands')
+    cache.get('TEST', dates, closes, 'BBands')
+    revised = closes.copy()
+    revised[-1] += 1.0
+    _assert_identical(cache.get('TEST', dates, revised, 'BBands'), IndicatorCache().get(None, dates, revised, 'BBands'))
@@ -0,0 +1,138 @@
+# test_prefetch.py
+# 批次預載的重試與限速測試：以本地 http.server 扮演 Chart API，依腳本回應 429 / 5xx / 404，
+# 檢查 Retry-After 是否被遵守、暫時性錯誤是否重試、永久錯誤是否只請求一次，以及請求間隔是否符合限速
+
+import json
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+import pandas as pd
+import pytest
+from data_sources import YahooChartSource
+from data_store import OHLCVStore
+from prefetch import RateLimiter, RetryingFetch, prefetch
+
+DAY = 86400
+START = int(pd.Timestamp('2024-01-02 14:30').timestamp())
+
+def _payload(n: int = 5) -> dict:
+    closes = [100.0 + i for i in range(n)]
+    return {'chart': {'result': [{
+        'meta': {'gmtoffset': -18000, 'exchangeTimezoneName': 'America/New_York'},
+        'timestamp': [START + i * DAY for i in range(n)],
+        'indicators': {'quote': [{'open': closes, 'high': [c + 1 for c in closes], 'low': [c - 1 for c in closes],
+                                  'close': closes, 'volume': [1000.0] * n}],
+                       'adjclose': [{'adjclose': closes}]},
+    }], 'error': None}}
+
+# --- 替身伺服器 ---
+
+class _Handler(BaseHTTPRequestHandler):
+    """每個代碼依 script 依序回應 (狀態碼, 標頭)，腳本用完後回應 200 與 K 線資料；requests 記錄各代碼的請求時間"""
+
+    def log_message(self, *args): pass
+
+    def do_GET(self):
+        ticker = unquote(urlparse(self.path).path.rsplit('/', 1)[-1])
+        server = self.server
+        with server.lock:
+            server.requests.setdefault(ticker, []).append(time.monotonic())
+            script = server.script.get(ticker) or []
+            code, headers = script.pop(0) if script else (200, {})
+        body = json.dumps(_payload() if code == 200 else {'chart': {'result': None, 'error': {'code': code}}}).encode()
+        self.send_response(code)
+        for key, value in headers.items(): self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    srv.daemon_threads = True
+    srv.lock = threading.Lock()
+    srv.script = {}
+    srv.requests = {}
+    thread = threading.Thread(target=srv.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+@pytest.fixture
+def source(server):
+    return YahooChartSource(f"http://127.0.0.1:{server.server_address[1]}", timeout=5)
+
+# --- 重試 ---
+
+def test_retry_after_is_honored(server, source):
+    server.script['TSLA'] = [(429, {'Retry-After': '0.3'})]
+    fetch = RetryingFetch(source, retries=2, backoff=0.001)
+    data = fetch('TSLA')
+    assert data is not None and len(data) == 5
+    first, second = server.requests['TSLA']
+    assert second - first >= 0.3
+    assert fetch.attempts['TSLA'] == 2
+
+def test_server_errors_are_retried_until_success(server, source):
+    server.script['NVDA'] = [(500, {}), (503, {})]
+    fetch = RetryingFetch(source, retries=3, backoff=0.01)
+    data = fetch('NVDA')
+    assert data is not None and len(data) == 5
+    assert len(server.requests['NVDA']) == 3
+    assert fetch.attempts['NVDA'] == 3
+
+def test_retries_are_bounded(server, source):
+    server.script['NVDA'] = [(502, {})] * 5
+    fetch = RetryingFetch(source, retries=2, backoff=0.01)
+    with pytest.raises(urllib.error.HTTPError) as error:
+        fetch('NVDA')
+    assert error.value.code == 502
+    assert len(server.requests['NVDA']) == 3
+
+def test_not_found_is_not_retried(server, source):
+    server.script['MISSING'] = [(404, {})]
+    fetch = RetryingFetch(source, retries=3, backoff=0.01)
+    assert fetch('MISSING') is None
+    assert len(server.requests['MISSING']) == 1
+
+def test_client_error_is_not_retried(server, source):
+    server.script['BAD'] = [(400, {})]
+    fetch = RetryingFetch(source, retries=3, backoff=0.01)
+    with pytest.raises(urllib.error.HTTPError):
+        fetch('BAD')
+    assert len(server.requests['BAD']) == 1
+
+# --- 限速 ---
+
+def test_rate_limit_spaces_requests_across_threads(server, source):
+    rate = 20.0
+    tickers = [f"T{i}" for i in range(8)]
+    fetch = RetryingFetch(source, RateLimiter(rate, burst=1), retries=0)
+    with ThreadPoolExecutor(max_workers=len(tickers)) as executor:
+        results = list(executor.map(fetch, tickers))
+    assert all(data is not None for data in results)
+    times = sorted(t for ticker in tickers for t in server.requests[ticker])
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    # 權杖於請求送出前取得，伺服器端的間隔只會受網路延遲抖動 (留 20ms 餘裕)
+    assert min(gaps) >= 1 / rate - 0.02
+    assert times[-1] - times[0] >= (len(times) - 1) / rate - 0.02
+
+def test_prefetch_reports_each_ticker(server, source, tmp_path):
+    server.script['TSLA'] = [(429, {'Retry-After': '0.05'})]
+    server.script['MISSING'] = [(404, {})]
+    server.script['DOWN'] = [(500, {})] * 5
+    report = prefetch(['tsla', 'MISSING', 'DOWN', 'TSLA'], source, OHLCVStore(tmp_path),
+                      max_workers=4, rate=0, retries=1, backoff=0.01)
+    rows = report.set_index('ticker')
+    assert list(report['ticker']) == ['TSLA', 'MISSING', 'DOWN']
+    assert rows.loc['TSLA', 'status'] == 'ok' and rows.loc['TSLA', 'bars'] == 5
+    assert rows.loc['TSLA', 'attempts'] == 2
+    assert rows.loc['MISSING', 'status'] == 'empty' and rows.loc['MISSING', 'attempts'] == 1
+    assert rows.loc['DOWN', 'status'] == 'error' and rows.loc['DOWN', 'attempts'] == 2
+    assert 'HTTPError' in rows.loc['DOWN', 'error']
+    assert OHLCVStore(tmp_path).load('TSLA') is not None